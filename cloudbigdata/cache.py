@@ -0,0 +1,88 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process caches shared by the Cloud Big Data plugin."""
+
+import collections
+import threading
+import time
+
+
+class TTLCache(object):
+    """Size-bounded LRU cache whose entries expire after a TTL.
+
+    The least recently used entry is evicted once maxsize entries are
+    stored. The hits and misses counters record every lookup.
+    """
+
+    def __init__(self, maxsize, ttl, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the live value stored for key or default."""
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or item[0] <= self._timer():
+                self.misses += 1
+                return default
+            # Re-insert to mark the entry as most recently used
+            self._data[key] = item
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        """Store value for key, expiring after ttl (or the default TTL)."""
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self._timer() + ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove key from the cache and return its value."""
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None:
+            return default
+        return item[1]
+
+    def items(self):
+        """Return the live (key, value) pairs without counting lookups."""
+        now = self._timer()
+        with self._lock:
+            return [(key, item[1]) for key, item in self._data.items()
+                    if item[0] > now]
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the cache size and hit/miss counters."""
+        return {'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -13,11 +13,11 @@
 
 """Client Libraries for Rackspace Resources."""
 
-from lavaclient.client import Lava
-from lavaclient.error import LavaError
-from lavaclient.error import RequestError
+import hashlib
+
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from heat.common import exception
 from heat.common.i18n import _LI
@@ -25,22 +25,169 @@ from heat.common.i18n import _LW
 from heat.engine.clients import client_plugin
 from heat.engine import constraints
 
+from cloudbigdata import cache
+from cloudbigdata import instrumentation
+from cloudbigdata import lava
+from cloudbigdata import snapshot
+from cloudbigdata import throttle
+
 
 LOG = logging.getLogger(__name__)
 
+cbd_opts = [
+    cfg.StrOpt('endpoint_template',
+               default='https://{region}.bigdata.api.rackspacecloud.com:443/'
+                       'v2/{tenant}',
+               help='CBD API endpoint, formatted with the region and tenant '
+                    'ID.'),
+    cfg.IntOpt('flavor_cache_ttl',
+               default=300,
+               help='Seconds a region\'s CBD flavor catalog is cached.'),
+    cfg.IntOpt('flavor_cache_size',
+               default=32,
+               help='Maximum number of regions whose CBD flavor catalog is '
+                    'cached.'),
+    cfg.IntOpt('stack_cache_ttl',
+               default=3600,
+               help='Seconds a CBD stack ID known to exist is cached.'),
+    cfg.IntOpt('stack_cache_negative_ttl',
+               default=60,
+               help='Seconds a CBD stack ID known to be missing is cached.'),
+    cfg.IntOpt('stack_cache_size',
+               default=256,
+               help='Maximum number of CBD stack IDs cached.'),
+    cfg.IntOpt('client_pool_size',
+               default=64,
+               help='Maximum number of authenticated CBD clients pooled for '
+                    'reuse.'),
+    cfg.IntOpt('client_pool_ttl',
+               default=3600,
+               help='Maximum seconds a pooled CBD client is reused. Clients '
+                    'are also evicted when their token expires.'),
+    cfg.IntOpt('ssh_key_cache_ttl',
+               default=3600,
+               help='Seconds a CBD SSH key name known to exist is cached.'),
+    cfg.IntOpt('ssh_key_cache_size',
+               default=1024,
+               help='Maximum number of CBD SSH key names cached.'),
+]
+cfg.CONF.register_opts(cbd_opts, group='cloud_big_data')
+
+# Tenant quota limits reported by the CBD limits API
+QUOTA_LIMITS = ('node_count', 'ram', 'vcpus', 'disk')
+
+_flavor_cache = None
+_stack_cache = None
+_client_pool = None
+_ssh_key_cache = None
+
+
+def _get_flavor_cache():
+    """Return the process-wide flavor catalog cache, keyed by region."""
+    global _flavor_cache
+    if _flavor_cache is None:
+        opts = cfg.CONF.cloud_big_data
+        _flavor_cache = cache.TTLCache(opts.flavor_cache_size,
+                                       opts.flavor_cache_ttl)
+    return _flavor_cache
+
+
+def _get_stack_cache():
+    """Return the process-wide stack ID cache, keyed by region and ID."""
+    global _stack_cache
+    if _stack_cache is None:
+        opts = cfg.CONF.cloud_big_data
+        _stack_cache = cache.TTLCache(opts.stack_cache_size,
+                                      opts.stack_cache_ttl)
+    return _stack_cache
+
+
+def _get_client_pool():
+    """Return the process-wide CBD client pool.
+
+    Clients are keyed by tenant, region and a hash of the auth token.
+    """
+    global _client_pool
+    if _client_pool is None:
+        opts = cfg.CONF.cloud_big_data
+        _client_pool = cache.TTLCache(opts.client_pool_size,
+                                      opts.client_pool_ttl)
+    return _client_pool
+
+
+def _get_ssh_key_cache():
+    """Return the process-wide cache of SSH key names known to exist."""
+    global _ssh_key_cache
+    if _ssh_key_cache is None:
+        opts = cfg.CONF.cloud_big_data
+        _ssh_key_cache = cache.TTLCache(opts.ssh_key_cache_size,
+                                        opts.ssh_key_cache_ttl)
+    return _ssh_key_cache
+
+
+def client_pool_stats():
+    """Return the client pool size, hit/miss counters and reuse rate."""
+    stats = _get_client_pool().stats()
+    lookups = stats['hits'] + stats['misses']
+    stats['reuse_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+    return stats
+
+
+def _flavor_to_dict(flavor):
+    """Return the cacheable details of a CBD flavor."""
+    return {'id': flavor.id,
+            'name': flavor.name,
+            'ram': getattr(flavor, 'ram', None),
+            'vcpus': getattr(flavor, 'vcpus', None),
+            'disk': getattr(flavor, 'disk', None)}
+
+
+def _flavor_catalog(flavors):
+    """Return flavor details indexed by flavor name and id."""
+    catalog = {}
+    for details in flavors:
+        catalog[details['name']] = details
+        catalog[details['id']] = details
+    return catalog
+
+
+def _stack_to_dict(stack):
+    """Return the cacheable node groups and limits of a CBD stack."""
+    node_groups = []
+    for group in getattr(stack, 'node_groups', None) or []:
+        limits = getattr(group, 'resource_limits', None)
+        node_groups.append({
+            'id': group.id,
+            'flavor_id': getattr(group, 'flavor_id', None),
+            'count': getattr(group, 'count', None),
+            'min_count': getattr(limits, 'min_count', None),
+            'max_count': getattr(limits, 'max_count', None),
+            'min_ram': getattr(limits, 'min_ram', None),
+        })
+    return {'id': stack.id, 'node_groups': node_groups}
+
+
+def flavor_cache_stats():
+    """Return the flavor catalog cache size and hit/miss counters."""
+    return _get_flavor_cache().stats()
+
+
+def stack_cache_stats():
+    """Return the stack ID cache size and hit/miss counters."""
+    return _get_stack_cache().stats()
+
 
 class StackConstraint(constraints.BaseCustomConstraint):
     """Validate CBD stack IDs."""
-    expected_exceptions = (RequestError,)
+
+    @property
+    def expected_exceptions(self):
+        # Resolved when validating, once the Lava client is loaded
+        return (lava.RequestError,)
 
     def validate_with_client(self, client, stack_id):
         """Check stack ID with CBD client."""
-        try:
-            client.client("cloud_big_data").stacks.get(stack_id)
-        except RequestError as exc:
-            if exc.code == 404:  # Resource not found
-                raise
-            raise LavaError(exc)
+        client.client_plugin("cloud_big_data").validate_stack(stack_id)
 
 
 class FlavorConstraint(constraints.BaseCustomConstraint):
@@ -58,55 +205,248 @@ class RackspaceCBDClientPlugin(client_plugin.ClientPlugin):
     Creating a new class instead of complicating the original class
     since CBD is not Pyrax-based.
     """
+    @property
+    def region(self):
+        """The lower-cased region name used for CBD requests."""
+        if self.context.region_name:
+            return self.context.region_name.lower()
+        return cfg.CONF.region_name_for_services.lower()
+
+    def _fetch_catalogs(self):
+        """Read the flavor and stack catalogs for a catalog snapshot."""
+        client = self.client()
+        flavors = [_flavor_to_dict(flavor) for flavor in client.flavors.list()]
+        stacks = []
+        for stack in client.stacks.list():
+            if getattr(stack, 'node_groups', None) is None:
+                # The stack list only has stack summaries
+                stack = client.stacks.get(stack.id)
+            stacks.append(_stack_to_dict(stack))
+        return flavors, stacks
+
+    def _catalog_snapshot(self):
+        """Return the tenant's catalog snapshot, or None if there is none.
+
+        A stale snapshot is refreshed by one worker of the host.
+        """
+        store = snapshot.get_store()
+        if store is None:
+            return None
+        return store.load(self.context.tenant_id, self.region,
+                          self._fetch_catalogs)
+
+    def _refresh_flavor_catalog(self):
+        """Read the flavor list and cache it indexed by name and id."""
+        try:
+            flavor_list = self.client().flavors.list()
+        except lava.LavaError as exc:
+            LOG.info("Unable to read CBD flavor list", exc_info=exc)
+            raise
+        flavors = [_flavor_to_dict(flavor) for flavor in flavor_list]
+        catalog = _flavor_catalog(flavors)
+        _get_flavor_cache().set(self.region, catalog)
+        store = snapshot.get_store()
+        if store is not None:
+            store.update_flavors(self.context.tenant_id, self.region,
+                                 flavors)
+        return catalog
+
+    def _cached_flavor_catalog(self):
+        """Return the flavor catalog from memory or the catalog snapshot."""
+        flavor_cache = _get_flavor_cache()
+        catalog = flavor_cache.get(self.region)
+        if catalog is None:
+            catalog_snapshot = self._catalog_snapshot()
+            if catalog_snapshot is not None:
+                catalog = _flavor_catalog(catalog_snapshot['flavors'])
+                flavor_cache.set(self.region, catalog)
+        return catalog
+
+    def get_flavor_catalog(self):
+        """Return the cached flavor details, keyed by flavor name and id."""
+        catalog = self._cached_flavor_catalog()
+        if catalog is None:
+            catalog = self._refresh_flavor_catalog()
+        return catalog
+
     def get_flavor_id(self, flavor):
         """Get the id for the specified flavor name.
 
-        If the specified value is flavor id, just return it.
+        If the specified value is flavor id, just return it. The flavor
+        catalog is cached per region and re-read once on a miss.
         :param flavor: the name of the flavor to find
         :returns: the id of :flavor:
         :raises: exception.EntityNotFound
         """
-        flavor_id = None
+        return self.get_flavor_ids([flavor])[flavor]
+
+    def get_flavor_ids(self, flavors):
+        """Get the ids for several flavor names or ids in one lookup.
+
+        The flavor catalog is read at most once for all the flavors.
+        :param flavors: the names or ids of the flavors to find
+        :returns: a dict mapping each of :flavors: to its id
+        :raises: exception.EntityNotFound
+        """
+        catalog = self._cached_flavor_catalog()
+        if catalog is None or any(flavor not in catalog
+                                  for flavor in flavors):
+            catalog = self._refresh_flavor_catalog()
+        flavor_ids = {}
+        for flavor in flavors:
+            if flavor not in catalog:
+                LOG.info("Unable to find CBD flavor %s", flavor)
+                raise exception.EntityNotFound(entity='Flavor', name=flavor)
+            flavor_ids[flavor] = catalog[flavor]['id']
+        return flavor_ids
+
+    def validate_stack(self, stack_id):
+        """Check that the specified stack exists.
+
+        Known-good and known-missing stack IDs are cached process-wide
+        for each tenant, and stacks in the catalog snapshot are
+        known-good. Only a 404 is cached as missing; other errors are not
+        cached.
+        :param stack_id: the CBD stack ID to check
+        :returns: the stack's node groups and their limits
+        :raises: RequestError if the stack does not exist
+        """
+        key = (self.context.tenant_id, self.region, stack_id)
+        stack_cache = _get_stack_cache()
+        cached = stack_cache.get(key)
+        if isinstance(cached, dict):
+            return cached
+        if cached is not None:
+            raise cached
+        catalog_snapshot = self._catalog_snapshot()
+        for details in (catalog_snapshot or {}).get('stacks', []):
+            if details['id'] == stack_id:
+                stack_cache.set(key, details)
+                return details
         try:
-            flavor_list = self.client().flavors.list()
-        except LavaError as exc:
-            LOG.info("Unable to read CBD flavor list", exc_info=exc)
-            raise
-        for bigdata_flavor in flavor_list:
-            if bigdata_flavor.name == flavor or bigdata_flavor.id == flavor:
-                flavor_id = bigdata_flavor.id
-                break
-        if flavor_id is None:
-            LOG.info("Unable to find CBD flavor %s", flavor)
-            raise exception.EntityNotFound(entity='Flavor', name=flavor)
-        return flavor_id
+            stack = self.client().stacks.get(stack_id)
+        except lava.RequestError as exc:
+            if exc.code == 404:  # Resource not found
+                stack_cache.set(
+                    key, exc,
+                    ttl=cfg.CONF.cloud_big_data.stack_cache_negative_ttl)
+                raise
+            raise lava.LavaError(exc)
+        details = _stack_to_dict(stack)
+        stack_cache.set(key, details)
+        return details
+
+    def get_quota_remaining(self):
+        """Return the tenant's remaining CBD quota in one API call.
+
+        :returns: a dict with the remaining node_count, ram, vcpus and
+            disk, omitting limits the API does not report
+        """
+        limits = self.client().limits.get()
+        remaining = {}
+        for name in QUOTA_LIMITS:
+            limit = getattr(limits, name, None)
+            if getattr(limit, 'remaining', None) is not None:
+                remaining[name] = limit.remaining
+        return remaining
+
+    def ensure_ssh_key(self, name, public_key):
+        """Register an SSH key unless the key name is known to exist.
+
+        An existing key is never overwritten. Key names are cached once
+        created or once the CBD API rejects them as already existing.
+        Other failures are logged and the key is tried again on the next
+        create.
+        :param name: the SSH key name
+        :param public_key: the SSH public key
+        """
+        key = (self.context.tenant_id, self.region, name)
+        key_cache = _get_ssh_key_cache()
+        if key_cache.get(key):
+            return
+        try:
+            self.client().credentials.create_ssh_key(name, public_key)
+        except lava.LavaError as exc:
+            if getattr(exc, 'code', None) != 409:
+                LOG.warn(_LW("Unable to register CBD SSH key %(name)s: "
+                             "%(exc)s."), {'name': name, 'exc': exc})
+                return
+            # The key already exists
+        key_cache.set(key, True)
+
+    def _pool_key(self):
+        """Return the client pool key for this plugin's context."""
+        token = self.context.auth_token or ''
+        token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        return (self.context.tenant_id, self.region, token_hash)
+
+    def _token_ttl(self):
+        """Return the seconds until the auth token expires, if known."""
+        info = self.context.auth_token_info
+        if not isinstance(info, dict):
+            return None
+        expires = (info.get('token', {}).get('expires_at') or
+                   info.get('access', {}).get('token', {}).get('expires'))
+        if not expires:
+            return None
+        expiry = timeutils.normalize_time(timeutils.parse_isotime(expires))
+        return timeutils.delta_seconds(timeutils.utcnow(), expiry)
+
+    def evict_client(self):
+        """Drop this context's client from the pool.
+
+        Called when the CBD API rejects the client's token, so that the
+        next call authenticates again instead of reusing the client.
+        """
+        _get_client_pool().pop(self._pool_key())
+        self._client = None
 
     def _create(self):
-        """Create an authenticated CBD client."""
-        region = cfg.CONF.region_name_for_services.lower()
-        if self.context.region_name:
-            region = self.context.region_name.lower()
+        """Create an authenticated CBD client.
+
+        Clients are pooled so that resources created with the same
+        token reuse one HTTP session and its connections.
+        """
+        key = self._pool_key()
+        pool = _get_client_pool()
+        client = pool.get(key)
+        if client is not None:
+            LOG.debug("Reusing pooled CBD client for tenant %s",
+                      self.context.tenant_id)
+            return client
+
+        region = self.region
         LOG.info(_LI("CBD client authenticating username %s in region %s"),
                  self.context.username, region)
         tenant = self.context.tenant_id
         username = self.context.username
-        endpoint_uri = ("https://{region}.bigdata.api.rackspacecloud.com:443/"
-                        "v2/{tenant}".format(region=region, tenant=tenant))
+        endpoint_uri = cfg.CONF.cloud_big_data.endpoint_template.format(
+            region=region, tenant=tenant)
         try:
-            return Lava(username=username,
-                        tenant_id=self.context.tenant_id,
-                        auth_url=self.context.auth_url,
-                        api_key=None,
-                        token=self.context.auth_token,
-                        region=region,
-                        endpoint=endpoint_uri,
-                        verify_ssl=False)
-        except LavaError as exc:
+            lava_client = lava.load()(username=username,
+                                      tenant_id=self.context.tenant_id,
+                                      auth_url=self.context.auth_url,
+                                      api_key=None,
+                                      token=self.context.auth_token,
+                                      region=region,
+                                      endpoint=endpoint_uri,
+                                      verify_ssl=False)
+        except lava.LavaError as exc:
             LOG.warn(_LW("CBD client authentication failed: %s."), exc)
             raise exception.AuthorizationFailure()
         LOG.info(_LI("CBD user %s authenticated successfully."), username)
+        client = instrumentation.InstrumentedClient(
+            lava_client, throttle.get_limiter(tenant, region),
+            on_auth_failure=self.evict_client)
+
+        ttl = self._token_ttl()
+        if ttl is None:
+            pool.set(key, client)
+        elif ttl > 0:
+            pool.set(key, client, ttl=min(ttl, pool.ttl))
+        return client
 
     def is_not_found(self, exc):
         """Determine if a CBD cluster exists."""
-        return (isinstance(exc, RequestError) and
+        return (isinstance(exc, lava.RequestError) and
                 exc.code == 404)
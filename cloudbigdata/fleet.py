@@ -0,0 +1,61 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bulk creation of identical Cloud Big Data clusters."""
+
+import eventlet
+from oslo_config import cfg
+
+
+fleet_opts = [
+    cfg.IntOpt('fleet_create_concurrency',
+               default=10,
+               help='Maximum number of concurrent CBD cluster creates for a '
+                    'cluster fleet.'),
+]
+cfg.CONF.register_opts(fleet_opts, group='cloud_big_data')
+
+
+def cluster_name(base, index, max_length=50):
+    """Return the name of a fleet member, truncating the base name."""
+    suffix = '-%d' % index
+    return base[:max_length - len(suffix)] + suffix
+
+
+def bulk_create(create, names, concurrency=None):
+    """Create clusters concurrently.
+
+    :param create: callable creating the cluster with a name and
+        returning it
+    :param names: the names of the clusters to create
+    :param concurrency: maximum concurrent creates, defaults to
+        fleet_create_concurrency
+    :returns: a tuple of a dict of name to created cluster ID and a dict
+        of name to the exception raised creating it
+    """
+    if concurrency is None:
+        concurrency = cfg.CONF.cloud_big_data.fleet_create_concurrency
+    created = {}
+    errors = {}
+
+    def submit(name):
+        try:
+            created[name] = str(create(name).id)
+        except Exception as exc:
+            errors[name] = exc
+
+    pool = eventlet.GreenPool(max(1, concurrency))
+    for name in names:
+        pool.spawn_n(submit, name)
+    pool.waitall()
+    return created, errors
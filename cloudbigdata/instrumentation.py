@@ -0,0 +1,302 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Timing of Cloud Big Data API calls.
+
+Every call made through an InstrumentedClient is timed and emitted to
+the configured sink along with the correlation ID and phase of the
+enclosing scope. Calls made through a rate limited client also report
+how long they waited for the limiter and how many calls were queued
+ahead of them. A call rejected for an invalid token notifies the
+client's owner, which can then stop reusing the client.
+"""
+
+import contextlib
+import socket
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+from heat.common.i18n import _LI
+
+from cloudbigdata import lava
+
+
+LOG = logging.getLogger(__name__)
+
+metrics_opts = [
+    cfg.StrOpt('metrics_sink',
+               default='memory',
+               choices=['none', 'log', 'statsd', 'memory'],
+               help='Where CBD API call timings are emitted.'),
+    cfg.StrOpt('statsd_host',
+               default='127.0.0.1',
+               help='Host of the statsd daemon for the statsd metrics sink.'),
+    cfg.IntOpt('statsd_port',
+               default=8125,
+               help='Port of the statsd daemon for the statsd metrics sink.'),
+    cfg.StrOpt('statsd_prefix',
+               default='heat.cbd',
+               help='Prefix of the metric names sent to statsd.'),
+]
+cfg.CONF.register_opts(metrics_opts, group='cloud_big_data')
+
+# Lava client attributes holding API managers whose calls are timed
+MANAGERS = ('clusters', 'credentials', 'distros', 'flavors', 'limits',
+            'nodes', 'scripts', 'stacks')
+
+# API manager methods that only read and may be coalesced
+READ_METHODS = ('get', 'list', 'nodes')
+
+
+class NullSink(object):
+    """Discard all events."""
+
+    def emit(self, event):
+        pass
+
+
+class LogSink(object):
+    """Log every event as a JSON document."""
+
+    def emit(self, event):
+        LOG.info(_LI("CBD API call %s"), jsonutils.dumps(event))
+
+
+class StatsdSink(object):
+    """Send call timers and status counters to statsd over UDP."""
+
+    def __init__(self, host, port, prefix):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def emit(self, event):
+        name = '%s.%s' % (self.prefix, event['name'])
+        data = '%s:%d|ms\n%s.%s:1|c' % (name, event['duration'] * 1000,
+                                        name, event['status'])
+        if event.get('code') is not None:
+            data += '\n%s.code.%s:1|c' % (name, event['code'])
+        if event.get('throttle_wait'):
+            data += '\n%s.throttle_wait:%d|ms\n%s.queue_depth:%d|g' % (
+                name, event['throttle_wait'] * 1000,
+                self.prefix, event['queue_depth'])
+        try:
+            self._socket.sendto(data.encode('utf-8'), self.address)
+        except socket.error:
+            pass  # Metrics must never fail an API call
+
+
+class HistogramSink(object):
+    """Aggregate call durations in memory.
+
+    Durations are counted in power-of-two millisecond buckets so memory
+    use stays constant however many calls are recorded.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        millis = int(event['duration'] * 1000)
+        bucket = 1
+        while bucket < millis:
+            bucket *= 2
+        with self._lock:
+            entry = self._calls.setdefault(
+                event['name'],
+                {'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': {},
+                 'throttled': 0, 'throttle_wait': 0.0})
+            entry['count'] += 1
+            entry['seconds'] += event['duration']
+            if event.get('throttle_wait'):
+                entry['throttled'] += 1
+                entry['throttle_wait'] += event['throttle_wait']
+            if event['status'] != 'ok':
+                entry['errors'] += 1
+            entry['buckets'][bucket] = entry['buckets'].get(bucket, 0) + 1
+
+    def snapshot(self):
+        """Return a copy of the aggregated calls, keyed by call name."""
+        with self._lock:
+            return dict((name, dict(entry, buckets=dict(entry['buckets'])))
+                        for name, entry in self._calls.items())
+
+    def percentile(self, name, pct):
+        """Return the bucket upper bound in ms holding the pct percentile."""
+        entry = self.snapshot().get(name)
+        if not entry:
+            return None
+        rank = pct / 100.0 * entry['count']
+        seen = 0
+        for bucket in sorted(entry['buckets']):
+            seen += entry['buckets'][bucket]
+            if seen >= rank:
+                return bucket
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._calls = {}
+
+
+_sink = None
+_local = threading.local()
+
+
+def get_sink():
+    """Return the configured metrics sink."""
+    global _sink
+    if _sink is None:
+        opts = cfg.CONF.cloud_big_data
+        if opts.metrics_sink == 'log':
+            _sink = LogSink()
+        elif opts.metrics_sink == 'statsd':
+            _sink = StatsdSink(opts.statsd_host, opts.statsd_port,
+                               opts.statsd_prefix)
+        elif opts.metrics_sink == 'memory':
+            _sink = HistogramSink()
+        else:
+            _sink = NullSink()
+    return _sink
+
+
+def set_sink(sink):
+    """Replace the metrics sink; None restores the configured sink."""
+    global _sink
+    _sink = sink
+
+
+@contextlib.contextmanager
+def scope(correlation_id, phase, timings=None, retries=0):
+    """Attribute the API calls made in the block to a phase.
+
+    :param correlation_id: identifies the resource making the calls
+    :param phase: the name of the phase, e.g. 'submit'
+    :param timings: optional dict aggregating calls and seconds per phase
+    :param retries: the number of times the phase was already retried
+    """
+    previous = getattr(_local, 'scope', None)
+    _local.scope = {'correlation_id': correlation_id,
+                    'phase': phase,
+                    'timings': timings,
+                    'retries': retries}
+    try:
+        yield
+    finally:
+        _local.scope = previous
+
+
+def timed_call(name, func, *args, **kwargs):
+    """Call func, emitting its duration and status as the call name."""
+    return _timed_call(name, func, args, kwargs)
+
+
+def _timed_call(name, func, args, kwargs, throttle=None):
+    """Call func with args and kwargs, emitting its duration and status.
+
+    The status is 'ok' or 'error'; the HTTP code of a failed request is
+    emitted as its code.
+    :param throttle: optional dict with the throttle_wait and
+        queue_depth of the call, added to the emitted event
+    """
+    current = getattr(_local, 'scope', None) or {}
+    status = 'ok'
+    code = None
+    started = time.time()
+    try:
+        return func(*args, **kwargs)
+    except Exception as exc:
+        status = 'error'
+        code = getattr(exc, 'code', None)
+        raise
+    finally:
+        duration = time.time() - started
+        timings = current.get('timings')
+        if timings is not None:
+            entry = timings.setdefault(current['phase'],
+                                       {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += duration
+        event = {'name': name,
+                 'duration': duration,
+                 'status': status,
+                 'code': code,
+                 'retries': current.get('retries', 0),
+                 'correlation_id': current.get('correlation_id'),
+                 'phase': current.get('phase')}
+        if throttle:
+            event.update(throttle)
+        try:
+            get_sink().emit(event)
+        except Exception as exc:
+            LOG.debug("Unable to emit CBD API call metrics: %s", exc)
+
+
+class _InstrumentedManager(object):
+    """Time every method called on a Lava API manager.
+
+    With a limiter, calls wait for the tenant's rate limit and identical
+    concurrent reads are made once. on_auth_failure is called when a
+    call is rejected for an invalid token.
+    """
+
+    def __init__(self, prefix, manager, limiter=None, on_auth_failure=None):
+        self._prefix = prefix
+        self._manager = manager
+        self._limiter = limiter
+        self._on_auth_failure = on_auth_failure
+
+    def __getattr__(self, name):
+        attr = getattr(self._manager, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        call_name = '%s.%s' % (self._prefix, name)
+
+        limiter = self._limiter
+        on_auth_failure = self._on_auth_failure
+
+        def call(*args, **kwargs):
+            try:
+                if limiter is None:
+                    return _timed_call(call_name, attr, args, kwargs)
+                return limiter.call(
+                    (call_name, repr(args), repr(sorted(kwargs.items()))),
+                    lambda throttle: _timed_call(call_name, attr, args,
+                                                 kwargs, throttle),
+                    read=name in READ_METHODS)
+            except Exception as exc:
+                if on_auth_failure is not None and lava.is_auth_failure(exc):
+                    on_auth_failure()
+                raise
+        return call
+
+
+class InstrumentedClient(object):
+    """Proxy a Lava client, timing every call made through its managers."""
+
+    def __init__(self, client, limiter=None, on_auth_failure=None):
+        self._client = client
+        self._limiter = limiter
+        self._on_auth_failure = on_auth_failure
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name in MANAGERS:
+            return _InstrumentedManager(name, attr, self._limiter,
+                                        self._on_auth_failure)
+        return attr
@@ -0,0 +1,70 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Lazy loading of the Lava client.
+
+Importing lavaclient loads its whole HTTP client stack, which every
+heat-engine and heat-api worker would pay for at startup even if it
+never touches a CBD resource. The client is loaded by load() when the
+first CBD client is created. Until then the exception names below are
+stand-ins; no Lava client exception can be raised before the client is
+loaded, so code catching lava.LavaError behaves the same either way.
+Always look the names up on this module when raising or catching.
+"""
+
+Lava = None
+
+
+class LavaError(Exception):
+    """Stands in for lavaclient.error.LavaError until the client loads."""
+
+
+class AuthenticationError(LavaError):
+    """Stands in for lavaclient.error.AuthenticationError until loaded."""
+
+
+class AuthorizationError(LavaError):
+    """Stands in for lavaclient.error.AuthorizationError until loaded."""
+
+
+class RequestError(LavaError):
+    """Stands in for lavaclient.error.RequestError until the client loads."""
+
+    def __init__(self, msg, code=None):
+        super(RequestError, self).__init__(msg)
+        self.code = code
+
+
+def load():
+    """Load the Lava client and bind its exception classes.
+
+    :returns: the Lava client class
+    """
+    global Lava, LavaError, AuthenticationError, AuthorizationError
+    global RequestError
+    if Lava is None:
+        from lavaclient import client
+        from lavaclient import error
+        LavaError = error.LavaError
+        AuthenticationError = error.AuthenticationError
+        AuthorizationError = error.AuthorizationError
+        RequestError = error.RequestError
+        Lava = client.Lava
+    return Lava
+
+
+def is_auth_failure(exc):
+    """Return True if a Lava client error means its token is not valid."""
+    if isinstance(exc, (AuthenticationError, AuthorizationError)):
+        return True
+    return isinstance(exc, RequestError) and exc.code == 401
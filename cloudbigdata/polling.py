@@ -0,0 +1,214 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Adaptive polling of Cloud Big Data cluster status."""
+
+import random
+import socket
+import sys
+import time
+
+from oslo_config import cfg
+
+
+poll_opts = [
+    cfg.IntOpt('poll_min_interval',
+               default=5,
+               help='Minimum seconds between CBD cluster status polls.'),
+    cfg.IntOpt('poll_max_interval',
+               default=120,
+               help='Maximum seconds between CBD cluster status polls.'),
+    cfg.IntOpt('poll_retry_budget',
+               default=20,
+               help='Consecutive transient CBD API errors tolerated while '
+                    'polling a cluster before the action fails.'),
+    cfg.FloatOpt('poll_stuck_factor',
+                 default=3.0,
+                 help='A cluster whose status has not changed for this many '
+                      'times the expected duration of the action is treated '
+                      'as stuck and the action fails. 0 disables the '
+                      'check.'),
+]
+cfg.CONF.register_opts(poll_opts, group='cloud_big_data')
+
+# Typical build times in seconds, keyed by CBD stack ID prefix
+EXPECTED_BUILD_TIME = {
+    'HADOOP': 25 * 60,
+    'SPARK': 20 * 60,
+    'KAFKA': 15 * 60,
+}
+DEFAULT_BUILD_TIME = 20 * 60
+EXPECTED_RESIZE_TIME = 10 * 60
+EXPECTED_DELETE_TIME = 5 * 60
+
+# Fraction of the interval randomly added or removed to spread out polls
+JITTER = 0.2
+
+# Number of status transitions kept in the poll state
+MAX_TRANSITIONS = 20
+
+# Outcomes of a cluster status for a resource action
+COMPLETE, IN_PROGRESS, FAILED = ('COMPLETE', 'IN_PROGRESS', 'FAILED')
+
+# Cluster statuses that complete an action or keep it in progress. Any
+# other status, including an unknown one, fails the action.
+CLUSTER_STATES = {
+    'CREATE': {
+        COMPLETE: ('ACTIVE',),
+        IN_PROGRESS: ('NEW', 'PENDING', 'BUILD', 'BUILDING', 'CONFIGURING'),
+    },
+    'UPDATE': {
+        COMPLETE: ('ACTIVE',),
+        IN_PROGRESS: ('PENDING', 'UPDATING', 'RESIZING', 'BUILDING',
+                      'CONFIGURING'),
+    },
+}
+
+# HTTP status codes worth retrying
+TRANSIENT_CODES = (429, 500, 502, 503, 504)
+
+_stats = {'polls': 0, 'polls_saved': 0}
+
+
+def stats():
+    """Return the number of status polls made and skipped."""
+    return dict(_stats)
+
+
+def classify(action, status):
+    """Return the outcome of a cluster status for a resource action."""
+    states = CLUSTER_STATES[action]
+    if status in states[COMPLETE]:
+        return COMPLETE
+    if status in states[IN_PROGRESS]:
+        return IN_PROGRESS
+    return FAILED
+
+
+def is_transient(exc):
+    """Return True if a failed CBD API call is worth retrying."""
+    code = getattr(exc, 'code', None)
+    if code is not None:
+        return code in TRANSIENT_CODES
+    if isinstance(exc, socket.error):
+        return True
+    # requests is only loaded with the Lava client
+    requests = sys.modules.get('requests')
+    return requests is not None and isinstance(
+        exc, (requests.exceptions.ConnectionError,
+              requests.exceptions.Timeout))
+
+
+def retry_after(exc):
+    """Return the seconds a failed call asks to wait, if it says so."""
+    value = getattr(exc, 'retry_after', None)
+    response = getattr(exc, 'response', None)
+    if value is None and response is not None:
+        value = response.headers.get('Retry-After')
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def expected_build_time(stack_id):
+    """Return the expected build time in seconds for a CBD stack ID."""
+    for prefix, duration in EXPECTED_BUILD_TIME.items():
+        if (stack_id or '').upper().startswith(prefix):
+            return duration
+    return DEFAULT_BUILD_TIME
+
+
+class PollPolicy(object):
+    """Decide when a resource should next poll its cluster status.
+
+    The policy is stateless; the poll state is a plain dict the caller
+    persists between scheduler ticks. While the status is unchanged the
+    interval backs off exponentially with jitter. Polls are kept at the
+    minimum interval around the expected completion time.
+    """
+
+    def __init__(self, expected_duration, min_interval=None,
+                 max_interval=None, timer=time.time):
+        opts = cfg.CONF.cloud_big_data
+        if min_interval is None:
+            min_interval = opts.poll_min_interval
+        if max_interval is None:
+            max_interval = opts.poll_max_interval
+        self.expected_duration = expected_duration
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self._timer = timer
+
+    def should_poll(self, state):
+        """Return True if the next poll is due, counting skipped polls."""
+        next_poll = state.get('next_poll')
+        if next_poll is not None and self._timer() < next_poll:
+            _stats['polls_saved'] += 1
+            return False
+        return True
+
+    def is_stuck(self, state):
+        """Return True if the status has not changed for far too long."""
+        factor = cfg.CONF.cloud_big_data.poll_stuck_factor
+        since = state.get('status_since')
+        if not factor or since is None:
+            return False
+        return self._timer() - since > self.expected_duration * factor
+
+    def record(self, state, status, wait=None):
+        """Record a poll that returned status and schedule the next one.
+
+        :param state: the poll state dict, updated in place
+        :param status: the cluster status, or None if the poll failed
+        :param wait: minimum seconds to wait, e.g. from a Retry-After
+        :returns: the updated state
+        """
+        if status is None:
+            # A failed poll backs off as if the status were unchanged
+            status = state.get('status')
+            state['failures'] = state.get('failures', 0) + 1
+        else:
+            state['failures'] = 0
+        now = self._timer()
+        _stats['polls'] += 1
+        state.setdefault('started', now)
+        interval = state.get('interval')
+        if status != state.get('status'):
+            transitions = state.setdefault('transitions', [])
+            transitions.append([status, now])
+            del transitions[:-MAX_TRANSITIONS]
+            state['status_since'] = now
+        if interval is None or status != state.get('status'):
+            interval = self.min_interval
+        else:
+            interval = min(interval * 2, self.max_interval)
+
+        expected_end = state['started'] + self.expected_duration
+        if abs(expected_end - now) <= self.max_interval:
+            interval = self.min_interval
+        elif now < expected_end:
+            # Do not sleep past the start of the completion window
+            interval = max(self.min_interval,
+                           min(interval,
+                               expected_end - self.max_interval - now))
+
+        jittered = interval * random.uniform(1 - JITTER, 1 + JITTER)
+        jittered = min(max(jittered, self.min_interval), self.max_interval)
+        if wait is not None:
+            jittered = max(jittered, wait)
+        state.update({'status': status,
+                      'last_poll': now,
+                      'interval': interval,
+                      'next_poll': now + jittered})
+        return state
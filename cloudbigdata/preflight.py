@@ -0,0 +1,162 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Validate-time checks and estimates for Cloud Big Data clusters."""
+
+from oslo_config import cfg
+
+from heat.common.i18n import _
+
+from cloudbigdata import polling
+
+
+preflight_opts = [
+    cfg.BoolOpt('preflight_checks',
+                default=True,
+                help='Check CBD clusters against their stack limits and the '
+                     'tenant quota when templates are validated.'),
+]
+cfg.CONF.register_opts(preflight_opts, group='cloud_big_data')
+
+# Quota units used by a node, keyed by CBD limit name and flavor field
+NODE_USAGE = (('ram', 'ram'), ('vcpus', 'vcpus'), ('disk', 'disk'))
+
+# Descriptions of the quota limits' units
+QUOTA_UNITS = {
+    'node_count': _('nodes'),
+    'ram': _('MB of RAM'),
+    'vcpus': _('vCPUs'),
+    'disk': _('GB of disk'),
+}
+
+
+def _requested_groups(stack, node_groups):
+    """Return the node groups a cluster is built with, keyed by ID.
+
+    Node groups of the stack that are not requested are built with
+    their default flavor and count.
+    """
+    requested = dict((group['id'], group) for group in node_groups)
+    for stack_group in stack['node_groups']:
+        if stack_group['id'] not in requested and stack_group['count']:
+            requested[stack_group['id']] = {
+                'id': stack_group['id'],
+                'flavor': stack_group['flavor_id'],
+                'count': stack_group['count']}
+    return requested
+
+
+def check_cluster(stack, flavors, node_groups):
+    """Return the reasons a cluster cannot be built, if any.
+
+    :param stack: the stack details returned by validate_stack
+    :param flavors: the flavor catalog keyed by flavor name and id
+    :param node_groups: the requested node groups, each with an id,
+        flavor and count
+    :returns: a list of problem descriptions
+    """
+    problems = []
+    stack_groups = dict((group['id'], group)
+                        for group in stack['node_groups'])
+    for group in _requested_groups(stack, node_groups).values():
+        flavor = flavors.get(group['flavor'])
+        if flavor is None:
+            problems.append(_('Flavor %(flavor)s of node group %(group)s '
+                              'does not exist.') %
+                            {'flavor': group['flavor'], 'group': group['id']})
+            continue
+        stack_group = stack_groups.get(group['id'])
+        if stack_groups and stack_group is None:
+            problems.append(_('Stack %(stack)s has no node group '
+                              '%(group)s.') %
+                            {'stack': stack['id'], 'group': group['id']})
+        elif stack_group is not None:
+            problems.extend(_check_limits(stack['id'], stack_group, group,
+                                          flavor))
+    return problems
+
+
+def cluster_usage(stack, flavors, node_groups):
+    """Return the tenant quota a cluster uses, keyed by CBD limit name.
+
+    Unrequested stack node groups count against the quota. Node groups
+    of unknown flavors only count as nodes.
+    """
+    usage = {'node_count': 0}
+    for group in _requested_groups(stack, node_groups).values():
+        usage['node_count'] += group['count']
+        flavor = flavors.get(group['flavor']) or {}
+        for limit, field in NODE_USAGE:
+            if flavor.get(field) is not None:
+                usage[limit] = (usage.get(limit, 0) +
+                                group['count'] * flavor[field])
+    return usage
+
+
+def check_quota(usage, remaining):
+    """Return the tenant quota limits the usage exceeds, if any.
+
+    :param usage: the quota needed, keyed by CBD limit name
+    :param remaining: the remaining tenant quota
+    :returns: a list of problem descriptions
+    """
+    problems = []
+    for limit, used in sorted(usage.items()):
+        available = remaining.get(limit)
+        if available is not None and used > available:
+            problems.append(_('The clusters need %(used)d %(units)s but '
+                              'only %(available)d remain in the tenant '
+                              'quota.') %
+                            {'used': used, 'units': QUOTA_UNITS[limit],
+                             'available': available})
+    return problems
+
+
+def _check_limits(stack_id, stack_group, group, flavor):
+    """Return the node group's violations of its stack's resource limits."""
+    problems = []
+    min_count = stack_group['min_count']
+    max_count = stack_group['max_count']
+    if min_count is not None and group['count'] < min_count:
+        problems.append(_('Node group %(group)s of stack %(stack)s needs '
+                          'at least %(count)d nodes.') %
+                        {'group': group['id'], 'stack': stack_id,
+                         'count': min_count})
+    if max_count is not None and group['count'] > max_count:
+        problems.append(_('Node group %(group)s of stack %(stack)s allows '
+                          'at most %(count)d nodes.') %
+                        {'group': group['id'], 'stack': stack_id,
+                         'count': max_count})
+    min_ram = stack_group['min_ram']
+    if (min_ram is not None and flavor.get('ram') is not None and
+            flavor['ram'] < min_ram):
+        problems.append(_('Node group %(group)s of stack %(stack)s needs a '
+                          'flavor with at least %(min_ram)d MB of RAM; '
+                          '%(flavor)s has %(ram)d MB.') %
+                        {'group': group['id'], 'stack': stack_id,
+                         'min_ram': min_ram, 'flavor': flavor['name'],
+                         'ram': flavor['ram']})
+    return problems
+
+
+def estimate(stack_id, node_groups):
+    """Estimate the build time and node-hours spent building a cluster.
+
+    :returns: a dict with the build_time in seconds, the number of
+        requested nodes and the node_hours consumed while building
+    """
+    build_time = polling.expected_build_time(stack_id)
+    nodes = sum(group['count'] for group in node_groups)
+    return {'build_time': build_time,
+            'nodes': nodes,
+            'node_hours': round(nodes * build_time / 3600.0, 2)}
@@ -0,0 +1,165 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bulk and background deletion of Cloud Big Data clusters."""
+
+import threading
+import time
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from heat.common.i18n import _LE
+from heat.common.i18n import _LI
+from heat.common.i18n import _LW
+
+
+LOG = logging.getLogger(__name__)
+
+reaper_opts = [
+    cfg.IntOpt('reaper_interval',
+               default=30,
+               help='Seconds between checks that asynchronously deleted CBD '
+                    'clusters are gone.'),
+    cfg.IntOpt('reaper_timeout',
+               default=3600,
+               help='Seconds the reaper keeps confirming an asynchronous CBD '
+                    'cluster delete before giving up on it.'),
+    cfg.IntOpt('bulk_delete_concurrency',
+               default=20,
+               help='Maximum number of concurrent CBD cluster deletes in a '
+                    'bulk teardown.'),
+]
+cfg.CONF.register_opts(reaper_opts, group='cloud_big_data')
+
+# Statuses of a cluster whose delete is known to be under way
+DELETING_STATUSES = ('DELETING', 'DELETED')
+
+_reapers = {}
+_reapers_lock = threading.Lock()
+
+
+def bulk_delete(client, cluster_ids, concurrency=None):
+    """Delete clusters concurrently.
+
+    :param client: the CBD client
+    :param cluster_ids: the IDs of the clusters to delete
+    :param concurrency: maximum concurrent deletes, defaults to
+        bulk_delete_concurrency
+    :returns: a dict of cluster ID to the exception raised deleting it;
+        clusters that no longer exist are not errors
+    """
+    if concurrency is None:
+        concurrency = cfg.CONF.cloud_big_data.bulk_delete_concurrency
+    errors = {}
+
+    def delete(cluster_id):
+        try:
+            client.clusters.delete(cluster_id)
+        except Exception as exc:
+            if getattr(exc, 'code', None) != 404:
+                errors[cluster_id] = exc
+
+    pool = eventlet.GreenPool(max(1, concurrency))
+    for cluster_id in cluster_ids:
+        pool.spawn_n(delete, cluster_id)
+    pool.waitall()
+    return errors
+
+
+class ClusterReaper(object):
+    """Confirm in the background that deleted clusters are gone.
+
+    Each check reads the tenant's cluster list once. Clusters missing
+    from it are confirmed deleted, and clusters that are not deleting
+    are deleted again. A cluster is given up on after the timeout, even
+    if the cluster list cannot be read.
+    """
+
+    def __init__(self, interval, timeout, timer=time.time):
+        self.interval = interval
+        self.timeout = timeout
+        self.confirmed = 0
+        self.abandoned = 0
+        self._timer = timer
+        self._get_client = None
+        self._pending = {}
+        self._thread = None
+
+    def is_watching(self, cluster_id):
+        """Return True if the cluster's delete is being confirmed."""
+        return str(cluster_id) in self._pending
+
+    def watch(self, get_client, cluster_id):
+        """Confirm the delete of a cluster in the background.
+
+        :param get_client: callable returning a CBD client, called for
+            every check so that expired clients are replaced
+        """
+        self._get_client = get_client
+        self._pending[str(cluster_id)] = self._timer() + self.timeout
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+
+    def reap(self):
+        """Check every pending cluster once.
+
+        :returns: the number of clusters still pending
+        """
+        now = self._timer()
+        for cluster_id, deadline in list(self._pending.items()):
+            if now > deadline:
+                LOG.error(_LE("Gave up confirming the delete of CBD cluster "
+                              "%s."), cluster_id)
+                self.abandoned += 1
+                del self._pending[cluster_id]
+        if not self._pending:
+            return 0
+        client = self._get_client()
+        clusters = dict((str(cluster.id), cluster)
+                        for cluster in client.clusters.list())
+        redelete = []
+        for cluster_id in list(self._pending):
+            cluster = clusters.get(cluster_id)
+            if cluster is None:
+                LOG.info(_LI("CBD cluster %s deleted."), cluster_id)
+                self.confirmed += 1
+                del self._pending[cluster_id]
+            elif cluster.status not in DELETING_STATUSES:
+                redelete.append(cluster_id)
+        if redelete:
+            bulk_delete(client, redelete)
+        return len(self._pending)
+
+    def _run(self):
+        while self._pending:
+            eventlet.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as exc:
+                LOG.warning(_LW("Unable to confirm CBD cluster deletes: %s"),
+                            exc)
+        self._thread = None
+
+
+def get_reaper(tenant_id, region):
+    """Return the engine-wide cluster reaper for a tenant and region."""
+    key = (tenant_id, region)
+    with _reapers_lock:
+        reaper = _reapers.get(key)
+        if reaper is None:
+            opts = cfg.CONF.cloud_big_data
+            reaper = ClusterReaper(opts.reaper_interval, opts.reaper_timeout)
+            _reapers[key] = reaper
+    return reaper
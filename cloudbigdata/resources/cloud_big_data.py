@@ -13,20 +13,38 @@
 
 """Resources for Rackspace Cloud Big Data."""
 
+import contextlib
+import functools
+import time
+
+import eventlet
+from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 
+from heat.common import exception
 from heat.common.i18n import _
+from heat.common import short_id
 from heat.engine import attributes
 from heat.engine import constraints
 from heat.engine import properties
 from heat.engine import resource
 from heat.engine import support
 
-from lavaclient.error import LavaError, RequestError
+from cloudbigdata import fleet
+from cloudbigdata import instrumentation
+from cloudbigdata import lava
+from cloudbigdata import polling
+from cloudbigdata import preflight
+from cloudbigdata import reaper
+from cloudbigdata import status
+from cloudbigdata import warm_pool
 
 
 LOG = logging.getLogger(__name__)
 
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
 
 class CloudBigData(resource.Resource):
     """Represents a Cloud Big Data resource."""
@@ -34,10 +52,18 @@ class CloudBigData(resource.Resource):
 
     PROPERTIES = (
         CLUSTER_NAME, STACK_ID, FLAVOR, NUM_SLAVES, CLUSTER_LOGIN,
-        PUB_KEY_NAME, PUB_KEY,
+        PUB_KEY_NAME, PUB_KEY, ASYNC_DELETE, NODE_GROUPS, USER_SCRIPTS,
+        CONNECTORS, POOL,
     ) = (
         'clusterName', 'stackId', 'flavor', 'numSlaveNodes', 'clusterLogin',
-        'publicKeyName', 'publicKey', )
+        'publicKeyName', 'publicKey', 'asyncDelete', 'nodeGroups',
+        'userScripts', 'connectors', 'pool', )
+
+    _NODE_GROUP_KEYS = (
+        NODE_GROUP_ID, NODE_GROUP_FLAVOR, NODE_GROUP_COUNT,
+    ) = (
+        'id', 'flavor', 'count',
+    )
 
     properties_schema = {
         CLUSTER_NAME: properties.Schema(
@@ -60,11 +86,10 @@ class CloudBigData(resource.Resource):
         FLAVOR: properties.Schema(
             properties.Schema.STRING,
             _('Rackspace Cloud Big Data Flavor ID to be used for cluster slave'
-              'nodes.'),
+              'nodes. Required unless nodeGroups is specified.'),
             constraints=[
                 constraints.CustomConstraint('cbd.flavor')
-            ],
-            required=True
+            ]
         ),
         CLUSTER_LOGIN: properties.Schema(
             properties.Schema.STRING,
@@ -77,12 +102,14 @@ class CloudBigData(resource.Resource):
         ),
         NUM_SLAVES: properties.Schema(
             properties.Schema.INTEGER,
-            _('How many slave nodes to create in the cluster.'),
+            _('How many slave nodes to create in the cluster. Changing it '
+              'resizes the cluster in place.'),
             default=3,
             constraints=[
                 constraints.Range(1, 10, "Number of slave nodes must be "
                                   "1-10."),
-            ]
+            ],
+            update_allowed=True
         ),
         PUB_KEY_NAME: properties.Schema(
             properties.Schema.STRING,
@@ -105,122 +132,1316 @@ class CloudBigData(resource.Resource):
                                    description="Public key is to long.")
             ],
             required=True
-        )
+        ),
+        ASYNC_DELETE: properties.Schema(
+            properties.Schema.BOOLEAN,
+            _('Complete the delete as soon as the Cloud Big Data API accepts '
+              'it instead of waiting for the cluster to be gone. A '
+              'background reaper confirms the deletes of all such '
+              'clusters with one cluster list.'),
+            default=False,
+            update_allowed=True
+        ),
+        NODE_GROUPS: properties.Schema(
+            properties.Schema.LIST,
+            _('Cluster node groups, each with its own flavor and node count. '
+              'Replaces flavor and numSlaveNodes. Changing only the node '
+              'counts resizes the cluster in place.'),
+            schema=properties.Schema(
+                properties.Schema.MAP,
+                schema={
+                    NODE_GROUP_ID: properties.Schema(
+                        properties.Schema.STRING,
+                        _('Node group ID defined by the CBD stack, e.g. '
+                          'slave or master.'),
+                        required=True
+                    ),
+                    NODE_GROUP_FLAVOR: properties.Schema(
+                        properties.Schema.STRING,
+                        _('Flavor name or ID of the node group nodes.'),
+                        constraints=[
+                            constraints.CustomConstraint('cbd.flavor')
+                        ],
+                        required=True
+                    ),
+                    NODE_GROUP_COUNT: properties.Schema(
+                        properties.Schema.INTEGER,
+                        _('Number of nodes in the node group.'),
+                        constraints=[
+                            constraints.Range(min=1)
+                        ],
+                        required=True
+                    ),
+                }
+            ),
+            update_allowed=True
+        ),
+        USER_SCRIPTS: properties.Schema(
+            properties.Schema.LIST,
+            _('IDs of CBD user scripts to run on the cluster nodes.'),
+            default=[]
+        ),
+        CONNECTORS: properties.Schema(
+            properties.Schema.LIST,
+            _('CBD connectors to configure on the cluster, passed to the '
+              'Cloud Big Data API as given.'),
+            default=[]
+        ),
+        POOL: properties.Schema(
+            properties.Schema.STRING,
+            _('ID of a Rackspace::Cloud::BigDataPool to claim a pre-built '
+              'cluster from. A new cluster is built if the pool has no '
+              'ready cluster of the same stack, flavor and size. A claimed '
+              'cluster keeps the login and SSH key of the pool.')
+        ),
     }
 
     ATTRIBUTES = (
-        CBD_VERSION
+        CBD_VERSION, STATUS, NODE_GROUPS, NODES, ENDPOINTS, PHASE_TIMINGS,
+        NODE_STATUS, NODE_COUNTS, LAST_UPDATED, BUILD_ESTIMATE,
     ) = (
-        'cbdVersion'
+        'cbdVersion', 'status', 'nodeGroups', 'nodes', 'endpoints',
+        'phaseTimings', 'nodeStatus', 'nodeCounts', 'lastUpdated',
+        'buildEstimate',
     )
 
     attributes_schema = {
         CBD_VERSION: attributes.Schema(
             _("Rackspace Cloud Big Data version"),
             type=attributes.Schema.STRING
-        )
+        ),
+        STATUS: attributes.Schema(
+            _("Cluster status as of the last cluster poll."),
+            type=attributes.Schema.STRING
+        ),
+        NODE_GROUPS: attributes.Schema(
+            _("Cluster node groups with their flavor and node count."),
+            type=attributes.Schema.LIST
+        ),
+        NODES: attributes.Schema(
+            _("Cluster nodes with their node group, status and addresses."),
+            type=attributes.Schema.LIST
+        ),
+        ENDPOINTS: attributes.Schema(
+            _("Cluster service endpoints keyed by component name."),
+            type=attributes.Schema.MAP
+        ),
+        PHASE_TIMINGS: attributes.Schema(
+            _("Number of CBD API calls and seconds spent in them, keyed by "
+              "phase such as key_create, flavor_lookup, submit and "
+              "build_poll."),
+            type=attributes.Schema.MAP
+        ),
+        NODE_STATUS: attributes.Schema(
+            _("Status of each cluster node keyed by node name."),
+            type=attributes.Schema.MAP
+        ),
+        NODE_COUNTS: attributes.Schema(
+            _("Number of cluster nodes in each status, keyed by node "
+              "group."),
+            type=attributes.Schema.MAP
+        ),
+        LAST_UPDATED: attributes.Schema(
+            _("UTC time the cluster and node details were last read."),
+            type=attributes.Schema.STRING
+        ),
+        BUILD_ESTIMATE: attributes.Schema(
+            _("Estimated build_time in seconds, number of requested nodes "
+              "and node_hours consumed while building."),
+            type=attributes.Schema.MAP
+        ),
+    }
+
+    # Instrumentation phases of the status polls made for each action
+    POLL_PHASES = {
+        resource.Resource.CREATE: 'build_poll',
+        resource.Resource.UPDATE: 'resize_poll',
+        resource.Resource.DELETE: 'delete_poll',
     }
 
     default_client_name = "cloud_big_data"
 
+    def __init__(self, name, json_snippet, stack):
+        super(CloudBigData, self).__init__(name, json_snippet, stack)
+        self._poll_states = {}
+        self._timings = None
+
+    def _phase_timings(self):
+        """Return the per-phase API call timings of this resource."""
+        if self._timings is None:
+            data = self.data().get('phase_timings') if self.id else None
+            self._timings = jsonutils.loads(data) if data else {}
+        return self._timings
+
+    @contextlib.contextmanager
+    def _phase(self, phase, retries=0):
+        """Attribute the CBD API calls made in the block to a phase."""
+        timings = self._phase_timings()
+        calls = sum(entry['calls'] for entry in timings.values())
+        try:
+            with instrumentation.scope('%s/%s' % (self.stack.id, self.name),
+                                       phase, timings, retries):
+                yield
+        finally:
+            if (self.id is not None and
+                    sum(entry['calls'] for entry in timings.values()) !=
+                    calls):
+                self.data_set('phase_timings', jsonutils.dumps(timings))
+
+    def _in_phase(self, phase, func, *args):
+        """Call func with its CBD API calls attributed to a phase."""
+        with self._phase(phase):
+            return func(*args)
+
+    def _poll_policy(self, action):
+        """Return the status poll policy for a resource action."""
+        if action == self.CREATE:
+            expected = polling.expected_build_time(
+                self.properties[self.STACK_ID])
+        elif action == self.UPDATE:
+            expected = polling.EXPECTED_RESIZE_TIME
+        else:
+            expected = polling.EXPECTED_DELETE_TIME
+        return polling.PollPolicy(expected)
+
+    def _poll_state(self, action):
+        """Return the poll state for an action, loaded from resource data."""
+        if action not in self._poll_states:
+            data = self.data().get('poll_%s' % action.lower())
+            self._poll_states[action] = jsonutils.loads(data) if data else {}
+        return self._poll_states[action]
+
+    def _poll_due(self, action):
+        """Return True if the cluster status should be polled now."""
+        return self._poll_policy(action).should_poll(self._poll_state(action))
+
+    def _record_poll(self, action, status, wait=None):
+        """Schedule the next poll and persist the poll state."""
+        state = self._poll_policy(action).record(self._poll_state(action),
+                                                 status, wait)
+        self.data_set('poll_%s' % action.lower(), jsonutils.dumps(state))
+
+    def _reset_poll(self, action):
+        """Forget the poll state of a previous run of an action."""
+        self._poll_states[action] = {}
+        if self.id is not None:
+            self.data_delete('poll_%s' % action.lower())
+
+    def _retry_poll(self, action, exc):
+        """Schedule a retry after a failed poll, within the retry budget.
+
+        :returns: False if the error is not transient or the retry budget
+            is used up
+        """
+        if not polling.is_transient(exc):
+            return False
+        failures = self._poll_state(action).get('failures', 0)
+        if failures >= cfg.CONF.cloud_big_data.poll_retry_budget:
+            LOG.warning("Giving up on CBD cluster %s after %d failed polls",
+                        self.resource_id, failures + 1)
+            return False
+        self._record_poll(action, None, polling.retry_after(exc))
+        return True
+
+    def _poll_cluster(self, action, show):
+        """Poll the cluster status if a poll is due.
+
+        Transient API errors are retried, honoring Retry-After, until
+        the retry budget is used up. The action fails as soon as the
+        cluster enters a status that cannot lead to completion, or when
+        its status has not changed for far longer than expected.
+        :param action: the resource action the poll is for
+        :param show: callable returning the cluster
+        :returns: the cluster, or None if no poll was made or the poll
+            will be retried
+        """
+        if not self._poll_due(action):
+            return None
+        try:
+            with self._phase(self.POLL_PHASES[action],
+                             self._poll_state(action).get('failures', 0)):
+                cluster = show()
+        except Exception as exc:
+            if not self._retry_poll(action, exc):
+                raise
+            return None
+        self._record_poll(action, cluster.status)
+
+        outcome = polling.classify(action, cluster.status)
+        if outcome == polling.FAILED:
+            raise lava.LavaError("Cluster {} entered the {} state".format(
+                self.resource_id, cluster.status))
+        if (outcome == polling.IN_PROGRESS and
+                self._poll_policy(action).is_stuck(self._poll_state(action))):
+            raise lava.LavaError("Cluster {} is stuck in the {} state".format(
+                self.resource_id, cluster.status))
+        return cluster
+
+    def validate(self):
+        """Validate that the node groups are described exactly once."""
+        super(CloudBigData, self).validate()
+        node_groups = self.properties[self.NODE_GROUPS]
+        if node_groups:
+            if self.properties[self.FLAVOR] is not None:
+                raise exception.StackValidationFailed(
+                    message=_('Only one of %(a)s and %(b)s may be '
+                              'specified.') % {'a': self.FLAVOR,
+                                               'b': self.NODE_GROUPS})
+            ids = [group[self.NODE_GROUP_ID] for group in node_groups]
+            if len(set(ids)) != len(ids):
+                raise exception.StackValidationFailed(
+                    message=_('Node group IDs must be unique.'))
+        elif self.properties[self.FLAVOR] is None:
+            raise exception.StackValidationFailed(
+                message=_('One of %(a)s and %(b)s must be specified.') % {
+                    'a': self.FLAVOR, 'b': self.NODE_GROUPS})
+        if cfg.CONF.cloud_big_data.preflight_checks:
+            self._preflight()
+
+    def _preflight(self):
+        """Check the cluster against its stack limits and the tenant quota.
+
+        The checks use the cached stack and flavor catalogs and one quota
+        call. The quota is checked against all the clusters of the stack
+        that are not built yet; an existing cluster's nodes already count
+        against it. The checks are skipped if the CBD API cannot be
+        reached.
+        """
+        node_groups = self._preflight_node_groups()
+        if node_groups is None:
+            return  # Depends on values only known once the stack runs
+        plugin = self.client_plugin()
+        try:
+            stack = plugin.validate_stack(self.properties[self.STACK_ID])
+            flavors = plugin.get_flavor_catalog()
+            problems = preflight.check_cluster(stack, flavors, node_groups)
+            if not problems and self.resource_id is None:
+                problems = preflight.check_quota(
+                    self._stack_quota_usage(flavors),
+                    plugin.get_quota_remaining())
+        except lava.LavaError as exc:
+            LOG.warning("Skipping CBD cluster preflight checks: %s", exc)
+            return
+        if problems:
+            raise exception.StackValidationFailed(
+                message=' '.join(problems))
+
+    def _preflight_node_groups(self):
+        """Return the node groups to check, or None if not known yet."""
+        node_groups = self._node_groups(self.properties)
+        if (self.properties[self.STACK_ID] is None or
+                self._cluster_count() is None or
+                any(group['flavor'] is None or group['count'] is None
+                    for group in node_groups)):
+            return None
+        return node_groups
+
+    def _quota_usage(self, flavors):
+        """Return the tenant quota the resource's clusters use."""
+        node_groups = self._preflight_node_groups()
+        if node_groups is None:
+            return {}
+        stack = self.client_plugin().validate_stack(
+            self.properties[self.STACK_ID])
+        usage = preflight.cluster_usage(stack, flavors, node_groups)
+        return dict((limit, used * self._cluster_count())
+                    for limit, used in usage.items())
+
+    def _stack_quota_usage(self, flavors):
+        """Return the tenant quota the stack's unbuilt clusters use."""
+        usage = self._quota_usage(flavors)
+        for res in self.stack.resources.values():
+            if (res.name == self.name or
+                    not isinstance(res, CloudBigData) or
+                    res.resource_id is not None):
+                continue
+            for limit, used in res._quota_usage(flavors).items():
+                usage[limit] = usage.get(limit, 0) + used
+        return usage
+
+    def _build_estimate(self):
+        """Return the estimated build time and node-hours of the clusters."""
+        node_groups = self._preflight_node_groups()
+        if node_groups is None:
+            return None
+        build_estimate = preflight.estimate(self.properties[self.STACK_ID],
+                                            node_groups)
+        count = self._cluster_count()
+        build_estimate['nodes'] *= count
+        build_estimate['node_hours'] = round(
+            build_estimate['node_hours'] * count, 2)
+        return build_estimate
+
+    def _cluster_count(self):
+        """Return the number of clusters the resource creates."""
+        return 1
+
+    def _node_groups(self, props):
+        """Return the cluster node groups described by properties.
+
+        Flavors are returned as given and are not resolved to IDs.
+        """
+        if props[self.NODE_GROUPS]:
+            return [{'id': group[self.NODE_GROUP_ID],
+                     'flavor': group[self.NODE_GROUP_FLAVOR],
+                     'count': group[self.NODE_GROUP_COUNT]}
+                    for group in props[self.NODE_GROUPS]]
+        return [{'id': 'slave',
+                 'flavor': props[self.FLAVOR],
+                 'count': props[self.NUM_SLAVES]}]
+
+    def _resolved_node_groups(self):
+        """Return the cluster node groups with their flavors resolved."""
+        node_groups = self._node_groups(self.properties)
+        with self._phase('flavor_lookup'):
+            flavor_ids = self.client_plugin().get_flavor_ids(
+                [group['flavor'] for group in node_groups])
+        return [{'id': group['id'],
+                 'flavor_id': flavor_ids[group['flavor']],
+                 'count': group['count']}
+                for group in node_groups]
+
+    def _cluster_spec(self, node_groups):
+        """Return the clusters.create arguments other than the name.
+
+        :param node_groups: the node groups with their flavors resolved
+        """
+        return {'stack_id': self.properties[self.STACK_ID],
+                'username': self.properties[self.CLUSTER_LOGIN],
+                'ssh_keys': [self.properties[self.PUB_KEY_NAME]],
+                'user_scripts': self.properties[self.USER_SCRIPTS] or [],
+                'node_groups': node_groups,
+                'connectors': self.properties[self.CONNECTORS] or []}
+
+    def _find_pool(self, pool_id):
+        """Return a warm pool of this tenant, restoring it if needed.
+
+        :returns: the pool, or None if it is neither registered with this
+            engine for the tenant and region nor a pool resource of this
+            stack
+        """
+        pool = warm_pool.get_pool(self.context.tenant_id,
+                                  self.client_plugin().region, pool_id)
+        if pool is not None:
+            return pool
+        for res in self.stack.resources.values():
+            if (isinstance(res, CloudBigDataPool) and
+                    res.resource_id == pool_id):
+                return res._pool()
+        return None
+
+    def _claim_from_pool(self):
+        """Adopt a pre-built cluster from the warm pool, if one is ready.
+
+        :returns: True if a cluster was claimed
+        """
+        pool_id = self.properties[self.POOL]
+        pool = self._find_pool(pool_id)
+        if pool is None:
+            LOG.warning("CBD cluster pool %s is not available, building a "
+                        "new cluster.", pool_id)
+            return False
+        if not pool.matches(self._cluster_spec(
+                self._resolved_node_groups())):
+            LOG.warning("CBD cluster pool %s holds clusters built "
+                        "differently, building a new cluster.", pool_id)
+            return False
+        cluster_id = pool.claim()
+        if cluster_id is None:
+            return False
+        self.resource_id_set(cluster_id)
+        self.data_set('pool', pool_id)
+        return True
+
+    def _release_to_pool(self):
+        """Hand a claimed cluster back to its pool instead of deleting it.
+
+        :returns: True if the pool took the cluster back
+        """
+        pool_id = self.data().get('pool')
+        pool = self._find_pool(pool_id) if pool_id else None
+        if pool is None or not pool.matches(
+                self._cluster_spec(self._resolved_node_groups())):
+            return False
+        return pool.release(self.resource_id)
+
     def handle_create(self):
         """Create a Rackspace Cloud Big Data Instance."""
         LOG.debug("Cloud Big Data handle_create called.")
+        # A retried create starts with a fresh poll schedule and budget
+        self._reset_poll(self.CREATE)
+        if self.properties[self.POOL] and self._claim_from_pool():
+            return
         args = dict((key, val) for key, val in self.properties.items())
-        # Create the cluster SSH key
-        try:
-            self.client().credentials.create_ssh_key(
-                args[self.PUB_KEY_NAME],
-                args[self.PUB_KEY])
-        except LavaError:
-            pass  # A key may already exist
+        # Create the cluster SSH key while the flavors are resolved
+        key_thread = eventlet.spawn(self._in_phase, 'key_create',
+                                    self.client_plugin().ensure_ssh_key,
+                                    args[self.PUB_KEY_NAME],
+                                    args[self.PUB_KEY])
 
         # Create the cluster
-        flavor_id = self.client_plugin().get_flavor_id(args[self.FLAVOR])
-        num_slave_nodes = args[self.NUM_SLAVES]
-
-        node_group_list = [{'flavor_id': flavor_id,
-                            'count': num_slave_nodes,
-                            'id': 'slave'}]
         try:
-            cluster = self.client().clusters.create(
-                name=args[self.CLUSTER_NAME],
-                stack_id=args[self.STACK_ID],
-                username=args[self.CLUSTER_LOGIN],
-                ssh_keys=[args[self.PUB_KEY_NAME]],
-                user_scripts=[],
-                node_groups=node_group_list,
-                connectors=[])
-        except LavaError as exc:
+            node_groups = self._node_groups(args)
+            with self._phase('flavor_lookup'):
+                flavor_ids = self.client_plugin().get_flavor_ids(
+                    [group['flavor'] for group in node_groups])
+            node_group_list = [{'flavor_id': flavor_ids[group['flavor']],
+                                'count': group['count'],
+                                'id': group['id']}
+                               for group in node_groups]
+        finally:
+            key_thread.wait()
+        try:
+            with self._phase('submit'):
+                cluster = self.client().clusters.create(
+                    name=args[self.CLUSTER_NAME],
+                    **self._cluster_spec(node_group_list))
+        except lava.LavaError as exc:
             LOG.warning("Unable to create CBD cluster", exc_info=exc)
             raise
         self.resource_id_set(str(cluster.id))
 
     def _show_resource(self):
         """ Show cluster resource details"""
-        return self.client().clusters.get(self.resource_id)
+        aggregator = status.get_aggregator(self.context.tenant_id,
+                                           self.client_plugin().region)
+        return aggregator.get_cluster(self.client(), self.resource_id)
 
     def check_create_complete(self, ignored):
         """Check the cluster creation status."""
+        cluster = self._poll_cluster(self.CREATE, self._show_resource)
+        if cluster is None or cluster.status != 'ACTIVE':
+            return False
+        self._cache_cluster_detail(cluster)
+        return True
+
+    def handle_update(self, json_snippet, tmpl_diff, prop_diff):
+        """Resize the cluster node groups whose node count changed."""
+        self._reset_poll(self.UPDATE)
+        if not prop_diff:
+            return None
+        new_props = dict(self.properties.items())
+        new_props.update(prop_diff)
+        old_groups = self._node_groups(self.properties)
+        new_groups = self._node_groups(new_props)
+        if _node_group_shapes(old_groups) != _node_group_shapes(new_groups):
+            # Only node counts can be changed in place
+            raise resource.UpdateReplace(self.name)
+        resize = _node_group_resize(old_groups, new_groups)
+        if not resize:
+            return None
+        self._invalidate_cluster_detail()
         try:
-            cluster = self._show_resource()
-        except RequestError as exc:
-            # RequestError is the only exception that should be retried and
-            # only a 503 HTTP status code should be retried. Only 4xx-5xx
-            # codes are returned by this exception.
-            if exc.code == 503:
-                return False
+            with self._phase('resize'):
+                self.client().clusters.resize(self.resource_id,
+                                              node_groups=resize)
+        except lava.LavaError as exc:
+            LOG.warning("Unable to resize CBD cluster", exc_info=exc)
             raise
-        # If any other LavaError-based exception is raised, it is a failed
-        # cluster create. Let the exception bubble up to Heat.
+        return resize
 
-        if cluster.status == 'ACTIVE':
+    def check_update_complete(self, resize):
+        """Check the cluster resize status.
+
+        :param resize: the node groups returned by handle_update
+        """
+        if not resize:
             return True
-        if cluster.status == 'ERROR':
-            raise LavaError("Cluster {} entered an error state".format(
-                self.resource_id))
-        return False
+        cluster = self._poll_cluster(
+            self.UPDATE,
+            lambda: self.client().clusters.get(self.resource_id))
+        if cluster is None or cluster.status != 'ACTIVE':
+            return False
+        counts = dict((group.id, group.count)
+                      for group in cluster.node_groups)
+        if any(counts.get(group['id']) != group['count']
+               for group in resize):
+            return False
+        if not self._resize_started() and not self._resize_done(resize):
+            return False
+        self._cache_cluster_detail(cluster)
+        return True
+
+    def _resize_started(self):
+        """Return True if the cluster was seen leaving ACTIVE to resize."""
+        transitions = self._poll_state(self.UPDATE).get('transitions', [])
+        return any(status not in (None, 'ACTIVE')
+                   for status, _since in transitions)
+
+    def _resize_done(self, resize):
+        """Return True if the resized node groups have their active nodes.
+
+        The requested node counts can be reported before the resize
+        starts, so a resize that was never seen in progress is checked
+        against the cluster's nodes.
+        """
+        try:
+            with self._phase(self.POLL_PHASES[self.UPDATE]):
+                nodes = self.client().clusters.nodes(self.resource_id)
+        except Exception as exc:
+            if not self._retry_poll(self.UPDATE, exc):
+                raise
+            return False
+        active = {}
+        for node in nodes:
+            if node.status == 'ACTIVE':
+                active[node.node_group] = active.get(node.node_group, 0) + 1
+        return all(active.get(group['id'], 0) == group['count']
+                   for group in resize)
+
+    def _reaper(self):
+        """Return the cluster reaper for this resource's tenant."""
+        return reaper.get_reaper(self.context.tenant_id,
+                                 self.client_plugin().region)
+
+    def _handle_async_delete(self):
+        """Delete the cluster and leave confirming it to the reaper."""
+        try:
+            with self._phase('delete'):
+                self.client().clusters.delete(self.resource_id)
+        except lava.LavaError as exc:
+            self.client_plugin().ignore_not_found(exc)
+        self._reaper().watch(self.client_plugin().client, self.resource_id)
 
     def handle_delete(self):
         """Delete a Rackspace Cloud Big Data Instance."""
         LOG.debug("Cloud Big Data handle_delete called.")
-        if self.resource_id:
+        self._reset_poll(self.DELETE)
+        self._invalidate_cluster_detail()
+        if (self.resource_id and self.properties[self.POOL] and
+                self._release_to_pool()):
+            return True
+        if self.resource_id and self.properties[self.ASYNC_DELETE]:
+            self._handle_async_delete()
+        elif self.resource_id:
             try:
-                self.client().clusters.delete(self.resource_id)
-            except LavaError as exc:
+                with self._phase('delete'):
+                    self.client().clusters.delete(self.resource_id)
+            except lava.LavaError as exc:
                 self.client_plugin().ignore_not_found(exc)
 
-    def check_delete_complete(self, ignored):
+    def check_delete_complete(self, released):
         """
         Return deletion status.
-        :param result: None
-        if handle_delete returns any result, we can use
-        it here.
+        :param released: True if handle_delete returned the cluster to
+        its pool instead of deleting it
         """
-        if self.resource_id is None:
+        if (released or self.resource_id is None or
+                self.properties[self.ASYNC_DELETE]):
             return True
+        if not self._poll_due(self.DELETE):
+            return False
         try:
-            self.client().clusters.get(self.resource_id)
-        except LavaError as exc:
-            self.client_plugin().ignore_not_found(exc)
-            return True
+            with self._phase(self.POLL_PHASES[self.DELETE]):
+                cluster = self._show_resource()
+        except Exception as exc:
+            if self.client_plugin().is_not_found(exc):
+                return True
+            if not self._retry_poll(self.DELETE, exc):
+                raise
+            return False
+        self._record_poll(self.DELETE, cluster.status)
         return False
 
+    def handle_adopt(self, resource_data):
+        """Adopt an existing cluster with the details it was abandoned with.
+
+        The cluster is read once. Adopting a cluster that is still
+        building waits for it like a create.
+        :returns: True if the cluster is not active yet
+        """
+        super(CloudBigData, self).handle_adopt(resource_data)
+        for action in self.POLL_PHASES:
+            # Poll schedules of the abandoning stack do not apply here
+            self._reset_poll(action)
+        with self._phase('adopt'):
+            cluster = self.client().clusters.get(self.resource_id)
+        self._merge_cluster_status(cluster)
+        if polling.classify(self.CREATE, cluster.status) == polling.FAILED:
+            raise lava.LavaError("Cluster {} is in the {} state".format(
+                self.resource_id, cluster.status))
+        return cluster.status != 'ACTIVE'
+
+    def check_adopt_complete(self, building):
+        """Wait for an adopted cluster that was still building."""
+        if not building:
+            return True
+        return self.check_create_complete(None)
+
+    def prepare_abandon(self):
+        """Carry the cluster details in the abandoned resource data."""
+        if self.resource_id is not None and not self.data().get(
+                'cluster_detail'):
+            try:
+                self._refresh_cluster_detail()
+            except lava.LavaError as exc:
+                LOG.warning("Abandoning CBD cluster %s without its details: "
+                            "%s", self.resource_id, exc)
+        return super(CloudBigData, self).prepare_abandon()
+
+    def handle_check(self):
+        """Check that the cluster is active with a single cluster read."""
+        with self._phase('check'):
+            cluster = self.client().clusters.get(self.resource_id)
+        self._merge_cluster_status(cluster)
+        self._verify_check_conditions([{'attr': 'status',
+                                        'expected': 'ACTIVE',
+                                        'current': cluster.status}])
+
+    def _refresh_cluster_detail(self, cluster=None):
+        """Read cluster and node details and cache them in resource data.
+
+        :param cluster: a cluster from the last successful poll; it is
+            re-read if it is only a cluster list summary
+        :returns: the cached details
+        """
+        with self._phase('cluster_detail'):
+            if (cluster is None or
+                    getattr(cluster, 'node_groups', None) is None):
+                cluster = self.client().clusters.get(self.resource_id)
+            nodes = self.client().clusters.nodes(self.resource_id)
+        detail = {
+            'status': cluster.status,
+            'cbd_version': cluster.cbd_version,
+            'node_groups': [_node_group_to_dict(group)
+                            for group in cluster.node_groups],
+            'nodes': [_node_to_dict(node) for node in nodes],
+            'updated_at': time.time(),
+        }
+        self.data_set('cluster_detail', jsonutils.dumps(detail))
+        return detail
+
+    def _cache_cluster_detail(self, cluster):
+        """Cache the details of a cluster that finished an action.
+
+        A failed read does not fail the finished action; the details are
+        read on the next attribute lookup instead.
+        """
+        try:
+            self._refresh_cluster_detail(cluster)
+        except Exception as exc:
+            if not (isinstance(exc, lava.LavaError) or
+                    polling.is_transient(exc)):
+                raise
+            LOG.warning("Unable to read the details of CBD cluster %s: %s",
+                        self.resource_id, exc)
+
+    def _merge_cluster_status(self, cluster):
+        """Update the cached cluster details from a cluster read.
+
+        The cached nodes are kept; they are re-read on the next refresh.
+        """
+        data = self.data().get('cluster_detail')
+        if not data:
+            return
+        detail = jsonutils.loads(data)
+        # Details carried from before they were timestamped are as fresh
+        # as this read
+        detail.setdefault('updated_at', time.time())
+        detail.update({
+            'status': cluster.status,
+            'cbd_version': cluster.cbd_version,
+            'node_groups': [_node_group_to_dict(group)
+                            for group in cluster.node_groups],
+        })
+        self.data_set('cluster_detail', jsonutils.dumps(detail))
+
+    def _invalidate_cluster_detail(self):
+        """Drop the cached cluster details."""
+        if self.id is not None:
+            self.data_delete('cluster_detail')
+
+    def _cluster_detail(self):
+        """Return the cached cluster details, reading them once stale.
+
+        Stale details are refreshed with one cluster and one nodes call,
+        so readers make at most one refresh per cluster_detail_max_age.
+        The stale details are kept if the refresh fails.
+        """
+        data = self.data().get('cluster_detail')
+        if not data:
+            return self._refresh_cluster_detail()
+        detail = jsonutils.loads(data)
+        max_age = cfg.CONF.cloud_big_data.cluster_detail_max_age
+        if not max_age or time.time() - detail.get('updated_at', 0) < max_age:
+            return detail
+        try:
+            return self._refresh_cluster_detail()
+        except lava.LavaError as exc:
+            LOG.warning("Serving stale details of CBD cluster %s: %s",
+                        self.resource_id, exc)
+            return detail
+
     def _resolve_attribute(self, name):
-        """Enable returning of Cloud Big Data cluster ID."""
+        """Return cluster attributes from the cached cluster details."""
+        if name == self.PHASE_TIMINGS:
+            self._timings = None
+            return self._phase_timings()
+        if name == self.BUILD_ESTIMATE:
+            return self._build_estimate()
+        if self.resource_id is None:
+            return None
         try:
-            cluster = self.client().clusters.get(self.resource_id)
-        except LavaError as exc:
+            detail = self._cluster_detail()
+        except lava.LavaError as exc:
             LOG.error("Unable to find CBD cluster due to: %s", exc)
             return None
 
         if name == self.CBD_VERSION:
-            return cluster.cbd_version
+            return detail['cbd_version']
+        if name == self.STATUS:
+            return detail['status']
+        if name == self.NODE_GROUPS:
+            return detail['node_groups']
+        if name == self.NODES:
+            return detail['nodes']
+        if name == self.ENDPOINTS:
+            endpoints = {}
+            for node in detail['nodes']:
+                endpoints.update(node['endpoints'])
+            return endpoints
+        if name == self.NODE_STATUS:
+            return dict((node['name'], node['status'])
+                        for node in detail['nodes'])
+        if name == self.NODE_COUNTS:
+            counts = {}
+            for node in detail['nodes']:
+                group = counts.setdefault(node['node_group'], {})
+                group[node['status']] = group.get(node['status'], 0) + 1
+            return counts
+        if name == self.LAST_UPDATED:
+            updated_at = detail.get('updated_at')
+            if updated_at is None:
+                return None
+            return time.strftime(TIMESTAMP_FORMAT, time.gmtime(updated_at))
+
+
+class CloudBigDataPool(resource.Resource):
+    """Keeps pre-built Cloud Big Data clusters ready to be claimed.
+
+    CloudBigData resources naming the pool in their pool property adopt
+    one of its clusters instead of building their own. Claimed clusters
+    are replaced in the background.
+    """
+    support_status = support.SupportStatus(version='2015.8')
+
+    PROPERTIES = (
+        STACK_ID, FLAVOR, NUM_SLAVES, CLUSTER_LOGIN, PUB_KEY_NAME, PUB_KEY,
+        POOL_SIZE, RECYCLE,
+    ) = (
+        'stackId', 'flavor', 'numSlaveNodes', 'clusterLogin',
+        'publicKeyName', 'publicKey', 'poolSize', 'recycleClusters',
+    )
+
+    properties_schema = {
+        STACK_ID: CloudBigData.properties_schema[CloudBigData.STACK_ID],
+        FLAVOR: properties.Schema(
+            properties.Schema.STRING,
+            _('Rackspace Cloud Big Data Flavor ID to be used for the pool '
+              'cluster slave nodes.'),
+            constraints=[
+                constraints.CustomConstraint('cbd.flavor')
+            ],
+            required=True
+        ),
+        NUM_SLAVES: properties.Schema(
+            properties.Schema.INTEGER,
+            _('How many slave nodes each pool cluster has.'),
+            default=3,
+            constraints=[
+                constraints.Range(1, 10, "Number of slave nodes must be "
+                                  "1-10."),
+            ]
+        ),
+        CLUSTER_LOGIN: CloudBigData.properties_schema[
+            CloudBigData.CLUSTER_LOGIN],
+        PUB_KEY_NAME: CloudBigData.properties_schema[
+            CloudBigData.PUB_KEY_NAME],
+        PUB_KEY: CloudBigData.properties_schema[CloudBigData.PUB_KEY],
+        POOL_SIZE: properties.Schema(
+            properties.Schema.INTEGER,
+            _('How many built clusters to keep ready to be claimed.'),
+            default=1,
+            constraints=[
+                constraints.Range(1, 10, "Pool size must be 1-10."),
+            ],
+            update_allowed=True
+        ),
+        RECYCLE: properties.Schema(
+            properties.Schema.BOOLEAN,
+            _('Return the clusters of deleted CloudBigData resources to the '
+              'pool instead of deleting them, while the pool has room. '
+              'Recycled clusters keep any data left on them.'),
+            default=False,
+            update_allowed=True
+        ),
+    }
+
+    ATTRIBUTES = (
+        IDLE_CLUSTERS, CLAIMS,
+    ) = (
+        'idleClusters', 'claims',
+    )
+
+    attributes_schema = {
+        IDLE_CLUSTERS: attributes.Schema(
+            _("IDs of the built clusters waiting to be claimed."),
+            type=attributes.Schema.LIST
+        ),
+        CLAIMS: attributes.Schema(
+            _("Number of clusters claimed from the pool by this engine."),
+            type=attributes.Schema.INTEGER
+        ),
+    }
+
+    default_client_name = "cloud_big_data"
+
+    def _new_pool(self, pool_id, spec):
+        """Return an engine pool that saves its state in resource data."""
+        plugin = self.client_plugin()
+        return warm_pool.ClusterPool(
+            pool_id, self.context.tenant_id, plugin.region, spec,
+            self.properties[self.POOL_SIZE], plugin.client,
+            recycle=self.properties[self.RECYCLE],
+            on_change=self._save_pool_state)
+
+    def _save_pool_state(self, state):
+        """Save the pool spec and membership in resource data."""
+        self.data_set('pool_state', jsonutils.dumps(state))
+
+    def _pool(self, start=False):
+        """Return the engine's pool for this resource, or None.
+
+        A pool this engine does not know, e.g. after a restart or when
+        another engine built it, is restored from its saved state.
+        :param start: whether this engine takes over the pool refills
+        """
+        if self.resource_id is None:
+            return None
+        plugin = self.client_plugin()
+        pool = warm_pool.get_pool(self.context.tenant_id, plugin.region,
+                                  self.resource_id)
+        if pool is None:
+            data = self.data().get('pool_state')
+            if not data:
+                return None
+            state = jsonutils.loads(data)
+            pool = self._new_pool(self.resource_id, state['spec'])
+            pool.restore(state)
+            pool = warm_pool.register(pool)
+        if start:
+            pool.start()
+        return pool
+
+    def handle_create(self):
+        """Register the pool and start building its clusters."""
+        plugin = self.client_plugin()
+        plugin.ensure_ssh_key(self.properties[self.PUB_KEY_NAME],
+                              self.properties[self.PUB_KEY])
+        flavor_id = plugin.get_flavor_id(self.properties[self.FLAVOR])
+        spec = {
+            'stack_id': self.properties[self.STACK_ID],
+            'username': self.properties[self.CLUSTER_LOGIN],
+            'ssh_keys': [self.properties[self.PUB_KEY_NAME]],
+            'user_scripts': [],
+            'node_groups': [{'id': 'slave',
+                             'flavor_id': flavor_id,
+                             'count': self.properties[self.NUM_SLAVES]}],
+            'connectors': [],
+        }
+        pool = self._new_pool('cbdpool-%s' % short_id.generate_id(), spec)
+        self.resource_id_set(pool.pool_id)
+        self._save_pool_state(pool.state())
+        warm_pool.register(pool)
+        pool.fill()
+
+    def check_create_complete(self, ignored):
+        """Check that every pool cluster is built."""
+        pool = self._pool(start=True)
+        if pool is None:
+            raise exception.Error(_('CBD cluster pool %s was lost while '
+                                    'it was built.') % self.resource_id)
+        return len(pool.idle()) >= pool.size
+
+    def handle_update(self, json_snippet, tmpl_diff, prop_diff):
+        """Change the pool size or recycling without rebuilding it."""
+        pool = self._pool(start=True)
+        if pool is None or not prop_diff:
+            return
+        if self.RECYCLE in prop_diff:
+            pool.recycle = prop_diff[self.RECYCLE]
+        if self.POOL_SIZE in prop_diff:
+            pool.resize(prop_diff[self.POOL_SIZE])
+
+    def handle_delete(self):
+        """Delete the unclaimed pool clusters."""
+        if self.resource_id is None:
+            return
+        pool = self._pool()
+        warm_pool.unregister(self.context.tenant_id,
+                             self.client_plugin().region, self.resource_id)
+        if pool is None:
+            return  # No pool cluster was ever submitted
+        errors = pool.close()
+        if errors:
+            raise list(errors.values())[0]
+        self.data_delete('pool_state')
+
+    def _resolve_attribute(self, name):
+        """Return the pool state kept by this engine."""
+        pool = self._pool()
+        if name == self.IDLE_CLUSTERS:
+            return pool.idle() if pool else []
+        if name == self.CLAIMS:
+            return pool.claims if pool else 0
+
+
+class CloudBigDataFleet(CloudBigData):
+    """Represents a fleet of identical Cloud Big Data clusters.
+
+    The SSH key and flavors are resolved once for the whole fleet, the
+    clusters are submitted concurrently, and the fleet is polled through
+    the shared cluster list.
+    """
+
+    CLUSTER_COUNT = 'clusterCount'
+
+    properties_schema = dict(
+        (key, schema)
+        for key, schema in CloudBigData.properties_schema.items()
+        if key != CloudBigData.POOL)
+    properties_schema[CLUSTER_COUNT] = properties.Schema(
+        properties.Schema.INTEGER,
+        _('How many identical clusters to create. Changing it adds or '
+          'deletes clusters; other property changes replace the fleet. '
+          'Cluster names get the cluster number as a suffix.'),
+        constraints=[
+            constraints.Range(1, 100, "Number of clusters must be 1-100."),
+        ],
+        required=True,
+        update_allowed=True
+    )
+
+    ATTRIBUTES = (
+        CLUSTER_IDS, CBD_VERSIONS, PHASE_TIMINGS, BUILD_ESTIMATE,
+    ) = (
+        'clusterIds', 'cbdVersions', 'phaseTimings', 'buildEstimate',
+    )
+
+    attributes_schema = {
+        CLUSTER_IDS: attributes.Schema(
+            _("IDs of the fleet clusters, in cluster number order."),
+            type=attributes.Schema.LIST
+        ),
+        CBD_VERSIONS: attributes.Schema(
+            _("Rackspace Cloud Big Data versions of the fleet clusters, in "
+              "cluster number order."),
+            type=attributes.Schema.LIST
+        ),
+        PHASE_TIMINGS: CloudBigData.attributes_schema[
+            CloudBigData.PHASE_TIMINGS],
+        BUILD_ESTIMATE: CloudBigData.attributes_schema[
+            CloudBigData.BUILD_ESTIMATE],
+    }
+
+    def _cluster_count(self):
+        return self.properties[self.CLUSTER_COUNT]
+
+    def _cluster_ids(self):
+        """Return the fleet cluster IDs, keyed by cluster number."""
+        data = self.data().get('cluster_ids') if self.id else None
+        if not data:
+            return {}
+        return dict((int(index), cluster_id)
+                    for index, cluster_id in jsonutils.loads(data).items())
+
+    def _ordered_cluster_ids(self):
+        """Return the fleet cluster IDs in cluster number order."""
+        cluster_ids = self._cluster_ids()
+        return [cluster_ids[index] for index in sorted(cluster_ids)]
+
+    def _save_cluster_ids(self, cluster_ids):
+        self.data_set('cluster_ids', jsonutils.dumps(cluster_ids))
+
+    def _add_clusters(self, indexes, node_groups):
+        """Submit the clusters with the given numbers concurrently.
+
+        :returns: the IDs of the submitted clusters
+        """
+        args = self.properties
+        create = functools.partial(
+            self.client().clusters.create,
+            stack_id=args[self.STACK_ID],
+            username=args[self.CLUSTER_LOGIN],
+            ssh_keys=[args[self.PUB_KEY_NAME]],
+            user_scripts=args[self.USER_SCRIPTS] or [],
+            node_groups=node_groups,
+            connectors=args[self.CONNECTORS] or [])
+        names = dict((fleet.cluster_name(args[self.CLUSTER_NAME], index),
+                      index) for index in indexes)
+        created, errors = fleet.bulk_create(
+            lambda name: self._in_phase('submit',
+                                        functools.partial(create, name=name)),
+            sorted(names))
+        cluster_ids = self._cluster_ids()
+        for name, cluster_id in created.items():
+            cluster_ids[names[name]] = cluster_id
+        self._save_cluster_ids(cluster_ids)
+        if errors:
+            LOG.warning("Unable to create %d of %d CBD clusters",
+                        len(errors), len(names))
+            raise list(errors.values())[0]
+        return list(created.values())
+
+    def handle_create(self):
+        """Create the fleet clusters."""
+        self._reset_poll(self.CREATE)
+        args = self.properties
+        key_thread = eventlet.spawn(self._in_phase, 'key_create',
+                                    self.client_plugin().ensure_ssh_key,
+                                    args[self.PUB_KEY_NAME],
+                                    args[self.PUB_KEY])
+        try:
+            node_groups = self._resolved_node_groups()
+        finally:
+            key_thread.wait()
+        self.resource_id_set(self.physical_resource_name())
+        self._add_clusters(range(1, args[self.CLUSTER_COUNT] + 1),
+                           node_groups)
+
+    def _poll_fleet(self, action, cluster_ids):
+        """Poll the status of fleet clusters if a poll is due.
+
+        :returns: True if every cluster is active
+        """
+        if not self._poll_due(action):
+            return False
+        aggregator = status.get_aggregator(self.context.tenant_id,
+                                           self.client_plugin().region)
+        try:
+            with self._phase(self.POLL_PHASES[action],
+                             self._poll_state(action).get('failures', 0)):
+                clusters = [aggregator.get_cluster(self.client(), cluster_id)
+                            for cluster_id in cluster_ids]
+        except Exception as exc:
+            if not self._retry_poll(action, exc):
+                raise
+            return False
+        active = sum(1 for cluster in clusters if cluster.status == 'ACTIVE')
+        self._record_poll(action, 'ACTIVE %d/%d' % (active, len(clusters)))
+        for cluster in clusters:
+            if (polling.classify(self.CREATE, cluster.status) ==
+                    polling.FAILED):
+                raise lava.LavaError("Cluster {} entered the {} state".format(
+                    cluster.id, cluster.status))
+        if active < len(clusters):
+            if self._poll_policy(action).is_stuck(self._poll_state(action)):
+                raise lava.LavaError(
+                    "Fleet {} is stuck with {} of {} clusters active".format(
+                        self.resource_id, active, len(clusters)))
+            return False
+        self._refresh_fleet_detail()
+        return True
+
+    def check_create_complete(self, ignored):
+        """Check that every fleet cluster is active."""
+        return self._poll_fleet(self.CREATE, self._ordered_cluster_ids())
+
+    def handle_update(self, json_snippet, tmpl_diff, prop_diff):
+        """Add or delete clusters when only the cluster count changed."""
+        self._reset_poll(self.UPDATE)
+        if set(prop_diff) - set([self.CLUSTER_COUNT, self.ASYNC_DELETE]):
+            raise resource.UpdateReplace(self.name)
+        count = prop_diff.get(self.CLUSTER_COUNT)
+        cluster_ids = self._cluster_ids()
+        if count is None or count == len(cluster_ids):
+            return None
+        self._invalidate_cluster_detail()
+        if count > len(cluster_ids):
+            first = max(cluster_ids) + 1 if cluster_ids else 1
+            return self._add_clusters(
+                range(first, first + count - len(cluster_ids)),
+                self._resolved_node_groups())
+        # Delete the highest numbered clusters
+        removed = sorted(cluster_ids)[count:]
+        with self._phase('delete'):
+            errors = reaper.bulk_delete(
+                self.client(), [cluster_ids[index] for index in removed])
+        cluster_reaper = self._reaper()
+        for index in removed:
+            if cluster_ids[index] not in errors:
+                cluster_reaper.watch(self.client_plugin().client,
+                                     cluster_ids[index])
+                del cluster_ids[index]
+        self._save_cluster_ids(cluster_ids)
+        if errors:
+            raise list(errors.values())[0]
+        return None
+
+    def check_update_complete(self, added):
+        """Check that the clusters added by an update are active.
+
+        :param added: the cluster IDs returned by handle_update
+        """
+        if not added:
+            return True
+        return self._poll_fleet(self.UPDATE, added)
+
+    def handle_delete(self):
+        """Delete every fleet cluster in one concurrent burst."""
+        self._reset_poll(self.DELETE)
+        self._invalidate_cluster_detail()
+        cluster_ids = self._ordered_cluster_ids()
+        if not cluster_ids:
+            return None
+        with self._phase('delete'):
+            errors = reaper.bulk_delete(self.client(), cluster_ids)
+        if errors:
+            raise list(errors.values())[0]
+        if self.properties[self.ASYNC_DELETE]:
+            cluster_reaper = self._reaper()
+            for cluster_id in cluster_ids:
+                cluster_reaper.watch(self.client_plugin().client,
+                                     cluster_id)
+            return None
+        return cluster_ids
+
+    def check_delete_complete(self, cluster_ids):
+        """Check that the fleet clusters are gone from the cluster list.
+
+        :param cluster_ids: the cluster IDs returned by handle_delete
+        """
+        if not cluster_ids:
+            return True
+        if not self._poll_due(self.DELETE):
+            return False
+        aggregator = status.get_aggregator(self.context.tenant_id,
+                                           self.client_plugin().region)
+        try:
+            with self._phase(self.POLL_PHASES[self.DELETE]):
+                listed = aggregator.list_clusters(self.client())
+        except Exception as exc:
+            if not self._retry_poll(self.DELETE, exc):
+                raise
+            return False
+        remaining = sum(1 for cluster_id in cluster_ids
+                        if cluster_id in listed)
+        if not remaining:
+            return True
+        self._record_poll(self.DELETE, 'DELETING %d' % remaining)
+        return False
+
+    def handle_adopt(self, resource_data):
+        """Adopt the fleet clusters recorded in the resource data."""
+        resource.Resource.handle_adopt(self, resource_data)
+
+    def check_adopt_complete(self, ignored):
+        return True
+
+    def prepare_abandon(self):
+        """Carry the fleet cluster IDs in the abandoned resource data."""
+        return resource.Resource.prepare_abandon(self)
+
+    def handle_check(self):
+        """Check that every fleet cluster is active with one list call."""
+        aggregator = status.get_aggregator(self.context.tenant_id,
+                                           self.client_plugin().region)
+        with self._phase('check'):
+            listed = aggregator.list_clusters(self.client())
+        checks = []
+        for cluster_id in self._ordered_cluster_ids():
+            cluster = listed.get(cluster_id)
+            checks.append({'attr': 'status of cluster %s' % cluster_id,
+                           'expected': 'ACTIVE',
+                           'current': cluster.status if cluster else None})
+        self._verify_check_conditions(checks)
+
+    def _refresh_fleet_detail(self):
+        """Cache the fleet cluster versions read from the cluster list."""
+        aggregator = status.get_aggregator(self.context.tenant_id,
+                                           self.client_plugin().region)
+        with self._phase('cluster_detail'):
+            clusters = [aggregator.get_cluster(self.client(), cluster_id)
+                        for cluster_id in self._ordered_cluster_ids()]
+        detail = {'cbd_versions': [cluster.cbd_version
+                                   for cluster in clusters]}
+        self.data_set('cluster_detail', jsonutils.dumps(detail))
+        return detail
+
+    def _resolve_attribute(self, name):
+        """Return fleet attributes from the cached fleet details."""
+        if name == self.PHASE_TIMINGS:
+            self._timings = None
+            return self._phase_timings()
+        if name == self.BUILD_ESTIMATE:
+            return self._build_estimate()
+        if name == self.CLUSTER_IDS:
+            return self._ordered_cluster_ids()
+        if name == self.CBD_VERSIONS:
+            data = self.data().get('cluster_detail')
+            try:
+                detail = (jsonutils.loads(data) if data
+                          else self._refresh_fleet_detail())
+            except lava.LavaError as exc:
+                LOG.error("Unable to find CBD clusters due to: %s", exc)
+                return None
+            return detail['cbd_versions']
+
+
+def _node_group_resize(old_groups, new_groups):
+    """Return the node groups whose count differs between two group lists.
+
+    :returns: a list of node group IDs with their new count
+    """
+    old_counts = dict((group['id'], group['count']) for group in old_groups)
+    return [{'id': group['id'], 'count': group['count']}
+            for group in new_groups
+            if old_counts.get(group['id']) != group['count']]
+
+
+def _node_group_shapes(groups):
+    """Return the flavor of each node group, keyed by node group ID."""
+    return dict((group['id'], group['flavor']) for group in groups)
+
+
+def _node_group_to_dict(group):
+    """Return the cacheable fields of a cluster node group."""
+    return {'id': group.id,
+            'flavor_id': group.flavor_id,
+            'count': group.count}
+
+
+def _node_to_dict(node):
+    """Return the cacheable fields of a cluster node."""
+    addresses = getattr(node, 'addresses', None)
+    endpoints = {}
+    for component in getattr(node, 'components', None) or []:
+        uri = getattr(component, 'uri', None)
+        if uri:
+            endpoints[component.name] = uri
+    return {
+        'id': node.id,
+        'name': node.name,
+        'node_group': node.node_group,
+        'status': node.status,
+        'public_ip': _first_address(getattr(addresses, 'public', None)),
+        'private_ip': _first_address(getattr(addresses, 'private', None)),
+        'endpoints': endpoints,
+    }
+
+
+def _first_address(address_list):
+    """Return the first IP address of a node address list."""
+    for address in address_list or []:
+        return getattr(address, 'address', None)
+    return None
 
 
 def resource_mapping():
     """Return the Rackspace Cloud Big Data identifier."""
-    return {'Rackspace::Cloud::BigData': CloudBigData}
+    return {'Rackspace::Cloud::BigData': CloudBigData,
+            'Rackspace::Cloud::BigDataFleet': CloudBigDataFleet,
+            'Rackspace::Cloud::BigDataPool': CloudBigDataPool}
 
 
 def available_resource_mapping():
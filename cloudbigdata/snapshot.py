@@ -0,0 +1,247 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""On-disk CBD catalog snapshots shared by the workers of a host.
+
+A snapshot holds the flavors and stacks a tenant sees in a region, and
+the flavors each stack node group can use. Workers read it instead of
+the CBD API, so a restarted worker validates templates without any API
+call. A stale
+snapshot is refreshed by whichever worker first takes the snapshot's
+lock file; the others keep using the snapshot they have.
+"""
+
+import contextlib
+import errno
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+from heat.common.i18n import _LI
+from heat.common.i18n import _LW
+
+
+LOG = logging.getLogger(__name__)
+
+snapshot_opts = [
+    cfg.StrOpt('catalog_snapshot_dir',
+               help='Directory holding the CBD flavor and stack catalog '
+                    'snapshots shared by the heat workers of a host. '
+                    'Snapshots are not used if unset.'),
+    cfg.IntOpt('catalog_snapshot_max_age',
+               default=86400,
+               help='Seconds after which a CBD catalog snapshot is '
+                    'refreshed from the CBD API.'),
+]
+cfg.CONF.register_opts(snapshot_opts, group='cloud_big_data')
+
+# Version of the snapshot file layout; other versions are ignored
+FORMAT_VERSION = 1
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def compatibility(flavors, stacks):
+    """Return the flavor IDs each stack node group can use.
+
+    :returns: a dict of stack ID to a dict of node group ID to the IDs
+        of the flavors with at least the node group's minimum RAM
+    """
+    result = {}
+    for stack in stacks:
+        groups = {}
+        for group in stack['node_groups']:
+            min_ram = group.get('min_ram') or 0
+            groups[group['id']] = sorted(
+                flavor['id'] for flavor in flavors
+                if (flavor.get('ram') or 0) >= min_ram)
+        result[stack['id']] = groups
+    return result
+
+
+class SnapshotStore(object):
+    """Read and write the catalog snapshots kept in a directory."""
+
+    def __init__(self, directory, max_age, timer=time.time):
+        self.directory = directory
+        self.max_age = max_age
+        self._timer = timer
+        self._parsed = {}
+
+    def _path(self, tenant_id, region, suffix):
+        return os.path.join(self.directory, 'cbd-catalog-%s-%s.%s' %
+                            (tenant_id, region, suffix))
+
+    @contextlib.contextmanager
+    def _lock(self, tenant_id, region):
+        """Take the snapshot's lock file unless another worker holds it.
+
+        Yields True if the lock was taken.
+        """
+        with open(self._path(tenant_id, region, 'lock'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as exc:
+                if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, tenant_id, region):
+        """Return the tenant's snapshot, or None if there is no usable one.
+
+        The parsed snapshot is reused until the file changes.
+        """
+        path = self._path(tenant_id, region, 'json')
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime, stat.st_size)
+        parsed = self._parsed.get((tenant_id, region))
+        if parsed is not None and parsed[0] == stamp:
+            return parsed[1]
+        try:
+            with open(path) as snapshot_file:
+                snapshot = jsonutils.loads(snapshot_file.read())
+        except (IOError, ValueError) as exc:
+            LOG.warning(_LW("Ignoring unreadable CBD catalog snapshot "
+                            "%(path)s: %(exc)s"), {'path': path, 'exc': exc})
+            return None
+        if (not isinstance(snapshot, dict) or
+                snapshot.get('version') != FORMAT_VERSION):
+            return None
+        self._parsed[(tenant_id, region)] = (stamp, snapshot)
+        return snapshot
+
+    def write(self, tenant_id, region, flavors, stacks):
+        """Atomically replace the tenant's snapshot of a region.
+
+        :returns: the written snapshot
+        """
+        catalogs = {'flavors': flavors,
+                    'stacks': stacks,
+                    'compatibility': compatibility(flavors, stacks)}
+        body = jsonutils.dumps(catalogs, sort_keys=True)
+        snapshot = dict(catalogs,
+                        version=FORMAT_VERSION,
+                        tenant_id=tenant_id,
+                        region=region,
+                        generated_at=self._timer(),
+                        etag=hashlib.sha256(body.encode('utf-8')).hexdigest())
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                        prefix='.cbd-catalog-')
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                tmp_file.write(jsonutils.dumps(snapshot,
+                                               separators=(',', ':')))
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, self._path(tenant_id, region, 'json'))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return snapshot
+
+    def is_fresh(self, snapshot):
+        """Return True if the snapshot is younger than the maximum age."""
+        return self._timer() - snapshot['generated_at'] < self.max_age
+
+    def load(self, tenant_id, region, fetch):
+        """Return the tenant's snapshot, refreshing it if it is stale.
+
+        Only the worker holding the snapshot's lock refreshes it. Other
+        workers get the stale snapshot, or None if there is none yet.
+        :param fetch: callable returning the flavor and stack lists
+        """
+        snapshot = self.read(tenant_id, region)
+        if snapshot is not None and self.is_fresh(snapshot):
+            return snapshot
+        try:
+            with self._lock(tenant_id, region) as locked:
+                if not locked:
+                    return snapshot  # Another worker is refreshing it
+                # It may have been refreshed while the lock was taken
+                latest = self.read(tenant_id, region)
+                if latest is not None and self.is_fresh(latest):
+                    return latest
+                try:
+                    flavors, stacks = fetch()
+                except Exception as exc:
+                    LOG.warning(_LW("Unable to read the CBD catalogs of "
+                                    "tenant %(tenant)s in region "
+                                    "%(region)s: %(exc)s"),
+                                {'tenant': tenant_id, 'region': region,
+                                 'exc': exc})
+                    return snapshot
+                snapshot = self.write(tenant_id, region, flavors, stacks)
+                LOG.info(_LI("Refreshed the CBD catalog snapshot of tenant "
+                             "%(tenant)s in region %(region)s, etag "
+                             "%(etag)s."),
+                         {'tenant': tenant_id, 'region': region,
+                          'etag': snapshot['etag']})
+                return snapshot
+        except (IOError, OSError) as exc:
+            LOG.warning(_LW("Unable to refresh the CBD catalog snapshot of "
+                            "tenant %(tenant)s in region %(region)s: "
+                            "%(exc)s"),
+                        {'tenant': tenant_id, 'region': region, 'exc': exc})
+            return snapshot
+
+    def update_flavors(self, tenant_id, region, flavors):
+        """Replace the flavors of the tenant's snapshot, if it is unlocked.
+
+        :returns: True if the snapshot was updated
+        """
+        snapshot = self.read(tenant_id, region)
+        if snapshot is None:
+            return False
+        try:
+            with self._lock(tenant_id, region) as locked:
+                if locked:
+                    self.write(tenant_id, region, flavors,
+                               snapshot['stacks'])
+                return locked
+        except (IOError, OSError) as exc:
+            LOG.warning(_LW("Unable to update the CBD catalog snapshot of "
+                            "tenant %(tenant)s in region %(region)s: "
+                            "%(exc)s"),
+                        {'tenant': tenant_id, 'region': region, 'exc': exc})
+            return False
+
+
+def get_store():
+    """Return the configured snapshot store, or None if it is disabled."""
+    opts = cfg.CONF.cloud_big_data
+    if not opts.catalog_snapshot_dir:
+        return None
+    with _stores_lock:
+        store = _stores.get(opts.catalog_snapshot_dir)
+        if store is None:
+            store = SnapshotStore(opts.catalog_snapshot_dir,
+                                  opts.catalog_snapshot_max_age)
+            _stores[opts.catalog_snapshot_dir] = store
+    return store
@@ -0,0 +1,105 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Shared cluster status polling for Cloud Big Data resources."""
+
+import threading
+import time
+
+from oslo_config import cfg
+
+from cloudbigdata import cache
+
+
+status_opts = [
+    cfg.IntOpt('status_list_interval',
+               default=10,
+               help='Seconds a tenant\'s CBD cluster list is shared between '
+                    'resources polling cluster status.'),
+    cfg.IntOpt('cluster_detail_max_age',
+               default=60,
+               help='Seconds the cluster and node details behind CBD '
+                    'resource attributes are served from cache before '
+                    'they are read again. 0 keeps them until the next '
+                    'resource action.'),
+]
+cfg.CONF.register_opts(status_opts, group='cloud_big_data')
+
+# Aggregators are dropped after a day without use
+AGGREGATOR_TTL = 24 * 60 * 60
+MAX_AGGREGATORS = 1024
+
+_aggregators = cache.TTLCache(MAX_AGGREGATORS, AGGREGATOR_TTL)
+_aggregators_lock = threading.Lock()
+
+
+class ClusterStatusAggregator(object):
+    """Serve cluster status for one tenant from a shared cluster list.
+
+    At most one clusters.list() call is made per interval, however many
+    resources are waiting on their clusters. Clusters missing from the
+    list are read with a single clusters.get() call.
+    """
+
+    def __init__(self, interval, timer=time.time):
+        self.interval = interval
+        self.list_calls = 0
+        self.get_calls = 0
+        self._timer = timer
+        self._clusters = {}
+        self._listed_at = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, client):
+        """Re-read the cluster list if it is older than the interval."""
+        with self._lock:
+            now = self._timer()
+            if (self._listed_at is not None and
+                    now - self._listed_at < self.interval):
+                return
+            clusters = client.clusters.list()
+            self.list_calls += 1
+            self._clusters = dict((str(cluster.id), cluster)
+                                  for cluster in clusters)
+            self._listed_at = now
+
+    def get_cluster(self, client, cluster_id):
+        """Return the cluster, preferring the shared cluster list."""
+        self._refresh(client)
+        cluster = self._clusters.get(str(cluster_id))
+        if cluster is None:
+            self.get_calls += 1
+            cluster = client.clusters.get(cluster_id)
+        return cluster
+
+    def list_clusters(self, client):
+        """Return the shared cluster list, keyed by cluster ID."""
+        self._refresh(client)
+        return dict(self._clusters)
+
+    def forget(self, cluster_id):
+        """Drop a cluster so the next lookup reads it directly."""
+        self._clusters.pop(str(cluster_id), None)
+
+
+def get_aggregator(tenant_id, region):
+    """Return the engine-wide status aggregator for a tenant and region."""
+    key = (tenant_id, region)
+    with _aggregators_lock:
+        aggregator = _aggregators.get(key)
+        if aggregator is None:
+            aggregator = ClusterStatusAggregator(
+                cfg.CONF.cloud_big_data.status_list_interval)
+        # Re-store on every use to keep active tenants from expiring
+        _aggregators.set(key, aggregator)
+    return aggregator
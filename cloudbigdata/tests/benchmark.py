@@ -0,0 +1,206 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmarks for the Cloud Big Data resource against a fake CBD API.
+
+The benchmarks are skipped unless CBD_BENCHMARK is set. Run them with::
+
+    CBD_BENCHMARK=1 python -m testtools.run cloudbigdata.tests.benchmark
+
+CBD_BENCHMARK_LATENCY, CBD_BENCHMARK_ERROR_RATE and
+CBD_BENCHMARK_BUILD_TIME configure the fake API.
+CBD_BENCHMARK_RATE_LIMIT sets the per-tenant API call rate limit, which
+is disabled by default. Reports are appended to the file named by
+CBD_BENCHMARK_REPORT, or logged if it is not set.
+"""
+
+import os
+import time
+import uuid
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+from heat.engine import environment
+from heat.engine import resource
+from heat.engine import scheduler
+from heat.engine import stack as parser
+from heat.engine import template
+from heat.tests import common
+from heat.tests import utils
+
+from .. import cbd_client
+from .. import status
+from .. import throttle
+from ..resources import cloud_big_data as cbd
+from . import fake_lava
+
+
+LOG = logging.getLogger(__name__)
+
+CONCURRENCY = (1, 10, 100)
+
+# Seconds between scheduler steps of the running tasks
+TICK = 0.1
+
+
+def percentile(values, pct):
+    """Return the pct percentile of values by the nearest-rank method."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(round(pct / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def write_report(report):
+    """Append a report to the CBD_BENCHMARK_REPORT file, or log it."""
+    path = os.environ.get('CBD_BENCHMARK_REPORT')
+    if not path:
+        LOG.info("CBD benchmark report: %s",
+                 jsonutils.dumps(report, sort_keys=True))
+        return
+    with open(path, 'a') as report_file:
+        report_file.write(jsonutils.dumps(report, sort_keys=True, indent=2))
+        report_file.write('\n')
+
+
+def reset_caches():
+    """Clear the process-wide plugin caches between runs."""
+    cbd_client._get_flavor_cache().clear()
+    cbd_client._get_stack_cache().clear()
+    cbd_client._get_client_pool().clear()
+    cbd_client._get_ssh_key_cache().clear()
+    status._aggregators.clear()
+    throttle._limiters.clear()
+
+
+def cluster_template(count, stack_id='HADOOP_HDP2_2'):
+    """Return a template with count CBD cluster resources."""
+    resources = {}
+    for index in range(count):
+        resources['cbd_cluster_%d' % index] = {
+            'type': 'Rackspace::Cloud::BigData',
+            'properties': {
+                'clusterName': 'bench_%d' % index,
+                'stackId': stack_id,
+                'flavor': 'Small Hadoop Instance',
+                'numSlaveNodes': 3,
+                'clusterLogin': 'bench_user',
+                'publicKeyName': 'bench_key',
+                'publicKey': 'ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC0UGHH',
+            },
+        }
+    return {'heat_template_version': '2014-10-16', 'resources': resources}
+
+
+def run_concurrently(tasks, tick=TICK, on_tick=None):
+    """Step heat tasks together until all complete.
+
+    :param on_tick: optional callable invoked after every scheduler tick
+    :returns: the seconds each task took to complete
+    """
+    started = time.time()
+    runners = [scheduler.TaskRunner(task) for task in tasks]
+    for runner in runners:
+        runner.start()
+    elapsed = [None] * len(runners)
+    while None in elapsed:
+        for index, runner in enumerate(runners):
+            if elapsed[index] is None and runner.step():
+                elapsed[index] = time.time() - started
+        if on_tick is not None:
+            on_tick()
+        time.sleep(tick)
+    return elapsed
+
+
+class FakeAPITestCase(common.HeatTestCase):
+
+    """Base class running CBD resources against a local fake CBD API."""
+
+    def setUp(self):
+        """Start the fake API and point the plugin at it."""
+        super(FakeAPITestCase, self).setUp()
+        self.api = fake_lava.FakeLavaAPI(
+            latency=float(os.environ.get('CBD_BENCHMARK_LATENCY', 0.01)),
+            error_rate=float(os.environ.get('CBD_BENCHMARK_ERROR_RATE', 0)),
+            build_time=float(os.environ.get('CBD_BENCHMARK_BUILD_TIME', 3)))
+        self.server = fake_lava.FakeLavaServer(self.api)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        overrides = {'endpoint_template': self.server.url + '/v2/{tenant}',
+                     'poll_min_interval': 1,
+                     'poll_max_interval': 2,
+                     'status_list_interval': 1,
+                     'api_rate_limit': float(
+                         os.environ.get('CBD_BENCHMARK_RATE_LIMIT', 0))}
+        for name, value in overrides.items():
+            cfg.CONF.set_override(name, value, group='cloud_big_data')
+        cfg.CONF.set_override('region_name_for_services', 'RegionOne')
+        resource._register_class('Rackspace::Cloud::BigData',
+                                 cbd.CloudBigData)
+        reset_caches()
+        self.addCleanup(reset_caches)
+
+    def create_stack(self, tmpl):
+        """Store a stack for the template using the fake API."""
+        ctx = utils.dummy_context()
+        ctx.auth_url = self.server.url + '/v2.0'
+        stack = parser.Stack(ctx, 'cbd_%s' % uuid.uuid4().hex,
+                             template.Template(tmpl,
+                                               env=environment.Environment()),
+                             stack_id=str(uuid.uuid4()))
+        stack.store()
+        return stack
+
+
+class CBDBenchmark(FakeAPITestCase):
+
+    """Create and delete benchmarks for Rackspace::Cloud::BigData."""
+
+    def setUp(self):
+        """Skip unless benchmarks were requested."""
+        if not os.environ.get('CBD_BENCHMARK'):
+            self.skipTest('Set CBD_BENCHMARK=1 to run the CBD benchmarks')
+        super(CBDBenchmark, self).setUp()
+
+    def _benchmark(self, count):
+        """Create and delete count clusters and return the measurements."""
+        stack = self.create_stack(cluster_template(count))
+        clusters = list(stack.resources.values())
+        report = {'concurrency': count}
+        for phase in ('create', 'delete'):
+            self.api.reset_stats()
+            elapsed = run_concurrently([getattr(cluster, phase)
+                                        for cluster in clusters])
+            for cluster in clusters:
+                self.assertEqual(cluster.COMPLETE, cluster.status)
+            latencies = [duration for _name, duration in self.api.calls]
+            report[phase] = {
+                'api_calls_per_cluster': float(len(latencies)) / count,
+                'calls': self.api.call_counts(),
+                'time_to_complete_p50': percentile(elapsed, 50),
+                'time_to_complete_max': max(elapsed),
+                'call_latency_p50': percentile(latencies, 50),
+                'call_latency_p99': percentile(latencies, 99),
+                'throttle': throttle.stats(),
+            }
+        return report
+
+    def test_create_delete(self):
+        """Benchmark cluster create and delete at increasing concurrency."""
+        for count in CONCURRENCY:
+            report = self._benchmark(count)
+            write_report(report)
@@ -0,0 +1,370 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process fake of the Cloud Big Data v2 API for benchmarks."""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+
+FLAVORS = [
+    {'id': 'hadoop1-7', 'name': 'Small Hadoop Instance',
+     'vcpus': 2, 'ram': 7680, 'disk': 1250},
+    {'id': 'hadoop1-15', 'name': 'Medium Hadoop Instance',
+     'vcpus': 4, 'ram': 15360, 'disk': 2500},
+    {'id': 'hadoop1-30', 'name': 'Large Hadoop Instance',
+     'vcpus': 8, 'ram': 30720, 'disk': 5000},
+    {'id': 'hadoop1-60', 'name': 'XLarge Hadoop Instance',
+     'vcpus': 16, 'ram': 61440, 'disk': 10000},
+]
+
+
+def _stack_node_groups(max_slaves):
+    return [
+        {'id': 'master', 'flavor_id': 'hadoop1-7', 'count': 1,
+         'resource_limits': {'min_count': 1, 'max_count': 1,
+                             'min_ram': 7680}},
+        {'id': 'slave', 'flavor_id': 'hadoop1-7', 'count': 3,
+         'resource_limits': {'min_count': 1, 'max_count': max_slaves,
+                             'min_ram': 7680}},
+    ]
+
+
+STACKS = [
+    {'id': 'HADOOP_HDP2_2', 'name': 'Hadoop HDP 2.2',
+     'distro': 'HDP2.2', 'components': ['ambari', 'hdfs', 'yarn'],
+     'node_groups': _stack_node_groups(10)},
+    {'id': 'SPARK_HDP2_2', 'name': 'Spark on HDP 2.2',
+     'distro': 'HDP2.2', 'components': ['ambari', 'hdfs', 'spark'],
+     'node_groups': _stack_node_groups(10)},
+    {'id': 'KAFKA_HDP2_3', 'name': 'Kafka on HDP 2.3',
+     'distro': 'HDP2.3', 'components': ['ambari', 'kafka', 'zookeeper'],
+     'node_groups': _stack_node_groups(5)},
+]
+
+# Remaining tenant quota reported by the limits API
+QUOTA = {'node_count': 1000, 'ram': 8192000, 'vcpus': 2000, 'disk': 1280000}
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _timestamp(seconds):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+class FakeLavaAPI(object):
+    """State and behaviour of the fake CBD API.
+
+    :param latency: seconds added to every response
+    :param error_rate: fraction of GET requests answered with a 503
+    :param build_time: seconds a cluster spends BUILDING, or a callable
+        returning it for each new cluster
+    :param delete_time: seconds a cluster spends DELETING
+    :param resize_time: seconds a cluster spends UPDATING after a resize
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, build_time=5.0,
+                 delete_time=1.0, resize_time=1.0, timer=time.time):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.build_time = build_time
+        self.delete_time = delete_time
+        self.resize_time = resize_time
+        self._timer = timer
+        self._lock = threading.Lock()
+        self.clusters = {}
+        self.ssh_keys = {}
+        self.calls = []
+        self.routes = [
+            ('POST', r'/tokens$', 'tokens.create', self._tokens),
+            ('GET', r'/clusters$', 'clusters.list', self._list_clusters),
+            ('POST', r'/clusters$', 'clusters.create', self._create_cluster),
+            ('GET', r'/clusters/(?P<id>[^/]+)$', 'clusters.get',
+             self._get_cluster),
+            ('PUT', r'/clusters/(?P<id>[^/]+)$', 'clusters.resize',
+             self._resize_cluster),
+            ('DELETE', r'/clusters/(?P<id>[^/]+)$', 'clusters.delete',
+             self._delete_cluster),
+            ('GET', r'/clusters/(?P<id>[^/]+)/nodes$', 'clusters.nodes',
+             self._list_nodes),
+            ('GET', r'/flavors$', 'flavors.list', self._list_flavors),
+            ('GET', r'/stacks$', 'stacks.list', self._list_stacks),
+            ('GET', r'/stacks/(?P<id>[^/]+)$', 'stacks.get',
+             self._get_stack),
+            ('GET', r'/limits$', 'limits.get', self._get_limits),
+            ('GET', r'/credentials$', 'credentials.list',
+             self._list_credentials),
+            ('POST', r'/credentials/ssh_keys$',
+             'credentials.create_ssh_key', self._create_ssh_key),
+        ]
+
+    def reset_stats(self):
+        """Forget the recorded calls."""
+        with self._lock:
+            self.calls = []
+
+    def call_counts(self):
+        """Return the number of calls made, keyed by call name."""
+        counts = {}
+        for name, _duration in self.calls:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def handle(self, method, path, body):
+        """Dispatch a request.
+
+        :returns: a (status code, response body, headers) tuple
+        """
+        started = self._timer()
+        if self.latency:
+            time.sleep(self.latency)
+        for route_method, pattern, name, handler in self.routes:
+            match = re.search(pattern, path)
+            if route_method != method or match is None:
+                continue
+            if method == 'GET' and random.random() < self.error_rate:
+                result = (503, {'message': 'Service unavailable'},
+                          {'Retry-After': '1'})
+            else:
+                with self._lock:
+                    result = handler(body, **match.groupdict())
+            with self._lock:
+                self.calls.append((name, self._timer() - started))
+            return result
+        return 404, {'message': 'No route for %s %s' % (method, path)}, {}
+
+    def _status(self, cluster, now):
+        if cluster['deleted'] is not None:
+            return 'DELETING'
+        if now < cluster['ready']:
+            return 'BUILDING'
+        if now < cluster['resize_ready']:
+            return 'UPDATING'
+        return 'ACTIVE'
+
+    def _live_cluster(self, cluster_id):
+        """Return a cluster unless it does not exist or finished deleting."""
+        cluster = self.clusters.get(cluster_id)
+        if cluster is None:
+            return None
+        deleted = cluster['deleted']
+        if deleted is not None and self._timer() - deleted >= self.delete_time:
+            del self.clusters[cluster_id]
+            return None
+        return cluster
+
+    def _cluster_view(self, cluster):
+        now = self._timer()
+        return {
+            'id': cluster['id'],
+            'name': cluster['name'],
+            'status': self._status(cluster, now),
+            'stack_id': cluster['stack_id'],
+            'cbd_version': 2,
+            'username': cluster['username'],
+            'progress': 1.0 if now >= cluster['ready'] else 0.5,
+            'created': _timestamp(cluster['created']),
+            'updated': _timestamp(now),
+            'node_groups': cluster['node_groups'],
+            'scripts': [],
+            'links': [],
+        }
+
+    def _not_found(self, kind, object_id):
+        return 404, {'message': '%s %s not found' % (kind, object_id)}, {}
+
+    def _tokens(self, body):
+        return 200, {'access': {'token': {'id': uuid.uuid4().hex},
+                                'serviceCatalog': []}}, {}
+
+    def _list_clusters(self, body):
+        clusters = [self._live_cluster(cluster_id)
+                    for cluster_id in list(self.clusters)]
+        return 200, {'clusters': [self._cluster_view(cluster)
+                                  for cluster in clusters if cluster]}, {}
+
+    def _create_cluster(self, body):
+        request = body['cluster']
+        now = self._timer()
+        build_time = self.build_time
+        if callable(build_time):
+            build_time = build_time()
+        node_groups = [dict(group, components=[])
+                       for group in request['node_groups']]
+        if not any(group['id'] == 'master' for group in node_groups):
+            # The API adds the stack's master group when it is omitted
+            node_groups.insert(0, {'id': 'master', 'flavor_id': 'hadoop1-7',
+                                   'count': 1, 'components': []})
+        cluster = {
+            'id': str(uuid.uuid4()),
+            'name': request['name'],
+            'stack_id': request['stack_id'],
+            'username': request['username'],
+            'node_groups': node_groups,
+            'created': now,
+            'ready': now + build_time,
+            'resize_ready': now,
+            'deleted': None,
+        }
+        self.clusters[cluster['id']] = cluster
+        return 200, {'cluster': self._cluster_view(cluster)}, {}
+
+    def _get_cluster(self, body, id):
+        cluster = self._live_cluster(id)
+        if cluster is None:
+            return self._not_found('Cluster', id)
+        return 200, {'cluster': self._cluster_view(cluster)}, {}
+
+    def _resize_cluster(self, body, id):
+        cluster = self._live_cluster(id)
+        if cluster is None:
+            return self._not_found('Cluster', id)
+        counts = dict((group['id'], group['count'])
+                      for group in body['cluster']['node_groups'])
+        for group in cluster['node_groups']:
+            group['count'] = counts.get(group['id'], group['count'])
+        started = max(self._timer(), cluster['ready'])
+        cluster['resize_ready'] = started + self.resize_time
+        return 200, {'cluster': self._cluster_view(cluster)}, {}
+
+    def _delete_cluster(self, body, id):
+        cluster = self._live_cluster(id)
+        if cluster is None:
+            return self._not_found('Cluster', id)
+        if cluster['deleted'] is None:
+            cluster['deleted'] = self._timer()
+        return 202, None, {}
+
+    def _list_nodes(self, body, id):
+        cluster = self._live_cluster(id)
+        if cluster is None:
+            return self._not_found('Cluster', id)
+        status = self._status(cluster, self._timer())
+        nodes = []
+        for group in cluster['node_groups']:
+            for index in range(group['count']):
+                name = '%s-%d' % (group['id'], index)
+                components = []
+                if group['id'] == 'master':
+                    components.append({
+                        'name': 'ambari-server',
+                        'nice_name': 'Ambari',
+                        'uri': 'https://%s.example.com:8443' % name})
+                nodes.append({
+                    'id': '%s-%s' % (cluster['id'], name),
+                    'name': name,
+                    'node_group': group['id'],
+                    'flavor_id': group['flavor_id'],
+                    'status': status,
+                    'created': _timestamp(cluster['created']),
+                    'updated': _timestamp(self._timer()),
+                    'addresses': {
+                        'public': [{'address': '192.0.2.%d' % (index + 1),
+                                    'version': '4'}],
+                        'private': [{'address': '10.0.0.%d' % (index + 1),
+                                     'version': '4'}],
+                    },
+                    'components': components,
+                })
+        return 200, {'nodes': nodes}, {}
+
+    def _list_flavors(self, body):
+        return 200, {'flavors': [dict(flavor, links=[])
+                                 for flavor in FLAVORS]}, {}
+
+    def _list_stacks(self, body):
+        return 200, {'stacks': [dict(stack, links=[])
+                                for stack in STACKS]}, {}
+
+    def _get_stack(self, body, id):
+        for stack in STACKS:
+            if stack['id'] == id:
+                return 200, {'stack': dict(stack, links=[])}, {}
+        return self._not_found('Stack', id)
+
+    def _get_limits(self, body):
+        return 200, {'limits': {'absolute': dict(
+            (name, {'limit': limit, 'remaining': limit})
+            for name, limit in QUOTA.items())}}, {}
+
+    def _list_credentials(self, body):
+        return 200, {'credentials': {'ssh_keys': [
+            {'key_name': name} for name in self.ssh_keys]}}, {}
+
+    def _create_ssh_key(self, body):
+        ssh_key = body['ssh_keys']
+        if ssh_key['key_name'] in self.ssh_keys:
+            return 409, {'message': 'SSH key already exists'}, {}
+        self.ssh_keys[ssh_key['key_name']] = ssh_key['public_key']
+        return 201, {'credentials': {'ssh_keys': [
+            {'key_name': ssh_key['key_name']}]}}, {}
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = None
+        if length:
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+        code, payload, headers = self.server.api.handle(
+            self.command, self.path.split('?')[0], body)
+        data = b''
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeLavaServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server serving a FakeLavaAPI on a local port."""
+
+    daemon_threads = True
+
+    def __init__(self, api):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           _RequestHandler)
+        self.api = api
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,194 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Soak test of many Cloud Big Data stacks in one heat engine.
+
+Stacks of Rackspace::Cloud::BigData resources are created and deleted
+together against the fake CBD API, for several rounds, while the CPU
+time and RSS of every scheduler tick, the API calls made and each
+resource's time to COMPLETE are recorded. Cluster build times follow a
+log-normal distribution.
+
+A small soak runs with the unit tests. The full soak is skipped unless
+CBD_SOAK is set. Run it with::
+
+    CBD_SOAK=1 python -m testtools.run cloudbigdata.tests.soak
+
+CBD_SOAK_STACKS, CBD_SOAK_CLUSTERS and CBD_SOAK_ROUNDS set the number of
+stacks, clusters per stack and rounds; CBD_SOAK_BUILD_TIME sets the
+median build time in seconds. The fake API is configured, and the
+report written, as for the benchmarks.
+"""
+
+import gc
+import math
+import os
+import random
+import resource as sys_resource
+
+from . import benchmark
+
+
+# Budgets that fail the soak when exceeded. Status polls are shared by
+# the tenant's clusters, so the calls per cluster must not grow with the
+# number of clusters.
+MAX_API_CALLS_PER_CLUSTER = {'create': 5, 'delete': 3}
+MAX_TICK_CPU_PER_TASK = 0.01
+MAX_RSS_GROWTH_KB = 50 * 1024
+
+# Spread of the log-normal cluster build times
+BUILD_TIME_SIGMA = 0.5
+
+# CPU time of the calling thread, where the platform can tell
+_RUSAGE_WHO = getattr(sys_resource, 'RUSAGE_THREAD', sys_resource.RUSAGE_SELF)
+
+
+def cpu_time():
+    """Return the CPU seconds used so far by the scheduler thread."""
+    usage = sys_resource.getrusage(_RUSAGE_WHO)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_kb():
+    """Return the resident set size of the process in KiB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (IOError, OSError):
+        # Peak rather than current RSS, in KiB on Linux
+        return sys_resource.getrusage(sys_resource.RUSAGE_SELF).ru_maxrss
+
+
+def build_time_distribution(median, sigma=BUILD_TIME_SIGMA, seed=None):
+    """Return a callable drawing log-normal cluster build times."""
+    rng = random.Random(seed)
+    mu = math.log(median)
+    return lambda: rng.lognormvariate(mu, sigma)
+
+
+class TickSampler(object):
+    """Record the CPU time used and the RSS at every scheduler tick."""
+
+    def __init__(self):
+        self.cpu = []
+        self.rss_kb = []
+        self._last = cpu_time()
+
+    def __call__(self):
+        now = cpu_time()
+        self.cpu.append(now - self._last)
+        self._last = now
+        self.rss_kb.append(rss_kb())
+
+    def report(self, tasks):
+        """Return the tick statistics for a phase of tasks run together."""
+        per_task = [cpu / tasks for cpu in self.cpu]
+        return {'ticks': len(self.cpu),
+                'tick_cpu_p50': benchmark.percentile(self.cpu, 50),
+                'tick_cpu_p99': benchmark.percentile(self.cpu, 99),
+                'tick_cpu_max': max(self.cpu or [0.0]),
+                'tick_cpu_per_task_p50': benchmark.percentile(per_task, 50),
+                'rss_kb_max': max(self.rss_kb or [0])}
+
+
+class SoakTestCase(benchmark.FakeAPITestCase):
+
+    """Base class running CBD stack soaks against the fake CBD API."""
+
+    def _run_phase(self, resources, phase):
+        """Run one action of every resource together and measure it."""
+        self.api.reset_stats()
+        sampler = TickSampler()
+        elapsed = benchmark.run_concurrently(
+            [getattr(res, phase) for res in resources], on_tick=sampler)
+        for res in resources:
+            self.assertEqual((phase.upper(), res.COMPLETE),
+                             (res.action, res.status))
+        calls = len(self.api.calls)
+        report = {'api_calls': calls,
+                  'api_calls_per_cluster': float(calls) / len(resources),
+                  'calls': self.api.call_counts()}
+        for pct in (50, 90, 99):
+            report['time_to_complete_p%d' % pct] = benchmark.percentile(
+                elapsed, pct)
+        report['time_to_complete_max'] = max(elapsed)
+        report.update(sampler.report(len(resources)))
+        return report
+
+    def soak(self, stacks, clusters, rounds, build_time, seed=None):
+        """Create and delete stacks of clusters for several rounds.
+
+        :param stacks: number of stacks created in each round
+        :param clusters: number of clusters in each stack
+        :param rounds: number of create and delete rounds
+        :param build_time: median cluster build time in seconds
+        :returns: the measurements of every round and the RSS growth
+            after the first round
+        """
+        self.api.build_time = build_time_distribution(build_time, seed=seed)
+        report = {'stacks': stacks, 'clusters': clusters, 'rounds': []}
+        for _round in range(rounds):
+            heat_stacks = [
+                self.create_stack(benchmark.cluster_template(clusters))
+                for _ in range(stacks)]
+            resources = [res for stack in heat_stacks
+                         for res in stack.resources.values()]
+            round_report = {}
+            for phase in ('create', 'delete'):
+                round_report[phase] = self._run_phase(resources, phase)
+            for stack in heat_stacks:
+                stack.delete()
+            del heat_stacks, resources
+            gc.collect()
+            round_report['rss_kb'] = rss_kb()
+            report['rounds'].append(round_report)
+        # The first round warms up the caches and the database
+        report['rss_growth_kb'] = (report['rounds'][-1]['rss_kb'] -
+                                   report['rounds'][0]['rss_kb'])
+        return report
+
+    def assertWithinBudget(self, report):
+        """Fail if the soak went over its API call budget."""
+        for round_report in report['rounds']:
+            for phase in ('create', 'delete'):
+                self.assertLessEqual(
+                    round_report[phase]['api_calls_per_cluster'],
+                    MAX_API_CALLS_PER_CLUSTER[phase])
+
+
+class CBDSoak(SoakTestCase):
+
+    """Full soak of many CBD stacks in one engine."""
+
+    def setUp(self):
+        """Skip unless the soak was requested."""
+        if not os.environ.get('CBD_SOAK'):
+            self.skipTest('Set CBD_SOAK=1 to run the CBD soak')
+        super(CBDSoak, self).setUp()
+
+    def test_soak(self):
+        """Soak many concurrent stacks and check the scaling budgets."""
+        report = self.soak(
+            stacks=int(os.environ.get('CBD_SOAK_STACKS', 20)),
+            clusters=int(os.environ.get('CBD_SOAK_CLUSTERS', 10)),
+            rounds=int(os.environ.get('CBD_SOAK_ROUNDS', 3)),
+            build_time=float(os.environ.get('CBD_SOAK_BUILD_TIME', 5)))
+        benchmark.write_report(report)
+        self.assertWithinBudget(report)
+        for round_report in report['rounds']:
+            self.assertLessEqual(
+                round_report['create']['tick_cpu_per_task_p50'],
+                MAX_TICK_CPU_PER_TASK)
+        if len(report['rounds']) > 1:
+            self.assertLessEqual(report['rss_growth_kb'], MAX_RSS_GROWTH_KB)
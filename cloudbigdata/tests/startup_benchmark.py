@@ -0,0 +1,92 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Import time and memory cost of loading the CBD plugin.
+
+Heat loads the plugin's client plugin and constraints in every
+heat-engine and heat-api worker. Each measurement imports modules in a
+fresh interpreter that has already imported the heat engine modules, so
+only the plugin's own cost is counted. Run it with::
+
+    python -m cloudbigdata.tests.startup_benchmark
+"""
+
+import os
+import subprocess
+import sys
+
+from oslo_serialization import jsonutils
+
+
+PLUGIN_MODULES = ('cloudbigdata.cbd_client',
+                  'cloudbigdata.resources.cloud_big_data')
+
+RUNS = 5
+
+SCRIPT = """
+import json
+import os
+import sys
+import time
+
+def rss_kb():
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+import heat.engine.clients.client_plugin
+import heat.engine.constraints
+import heat.engine.resource
+
+before = set(sys.modules)
+rss = rss_kb()
+start = time.time()
+for name in sys.argv[1:]:
+    __import__(name)
+print(json.dumps({'seconds': time.time() - start,
+                  'rss_kb': rss_kb() - rss,
+                  'modules': sorted(set(sys.modules) - before)}))
+"""
+
+
+def measure(modules=PLUGIN_MODULES):
+    """Import modules in a fresh interpreter and return their cost.
+
+    :returns: a dict with the import seconds, the RSS growth in KiB and
+        the names of the newly loaded modules
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT] + list(modules),
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'))
+    return jsonutils.loads(output.decode('utf-8'))
+
+
+def _median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    for label, modules in (('plugin', PLUGIN_MODULES),
+                           ('plugin + Lava client',
+                            PLUGIN_MODULES + ('lavaclient.client',))):
+        results = [measure(modules) for _ in range(RUNS)]
+        print('%-22s %7.1f ms %8d KiB %4d modules' % (
+            label,
+            _median([result['seconds'] for result in results]) * 1000,
+            _median([result['rss_kb'] for result in results]),
+            len(results[0]['modules'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,19 @@
 #    under the License.
 
 import uuid
+import fixtures
 import mock
-from ..clients import StackConstraint, FlavorConstraint, \
+from oslo_serialization import jsonutils
+from ..cbd_client import StackConstraint, FlavorConstraint, \
     RackspaceCBDClientPlugin, cfg
+from .. import cbd_client
+from .. import lava
+from .. import reaper
+from .. import snapshot
+from .. import status
+from .. import warm_pool
 
+from heat.common import exception
 from heat.common import template_format
 from heat.engine import environment
 from heat.engine import resource
@@ -50,6 +59,67 @@ TEMPLATE = """ {
     }
 } """
 
+ORIG_CREATE = RackspaceCBDClientPlugin._create
+
+TEMPLATE_NODE_GROUPS = """ {
+    "heat_template_version": "2014-10-16",
+    "resources": {
+        "cbd_cluster": {
+            "type": "Rackspace::Cloud::BigData",
+            "properties": {
+                "clusterLogin": "test_user",
+                "stackId": "KAFKA_HDP2_3",
+                "publicKey": "ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC0UGHHrNc",
+                "publicKeyName": "test",
+                "nodeGroups": [
+                    {"id": "master", "flavor": "Medium Hadoop Instance",
+                     "count": 1},
+                    {"id": "slave", "flavor": "Small Hadoop Instance",
+                     "count": 5}
+                ],
+                "userScripts": ["script-1"],
+                "clusterName": "test"
+            }
+        }
+    }
+} """
+
+TEMPLATE_FLEET = """ {
+    "heat_template_version": "2014-10-16",
+    "resources": {
+        "cbd_cluster": {
+            "type": "Rackspace::Cloud::BigDataFleet",
+            "properties": {
+                "clusterLogin": "test_user",
+                "stackId": "HADOOP_HDP2_2",
+                "publicKey": "ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC0UGHHrNc",
+                "publicKeyName": "test",
+                "flavor": "Small Hadoop Instance",
+                "numSlaveNodes": 3,
+                "clusterCount": 3,
+                "clusterName": "sandbox"
+            }
+        }
+    }
+} """
+
+TEMPLATE_POOL = """ {
+    "heat_template_version": "2014-10-16",
+    "resources": {
+        "cbd_pool": {
+            "type": "Rackspace::Cloud::BigDataPool",
+            "properties": {
+                "clusterLogin": "test_user",
+                "stackId": "HADOOP_HDP2_2",
+                "publicKey": "ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC0UGHHrNc",
+                "publicKeyName": "test",
+                "flavor": "Small Hadoop Instance",
+                "poolSize": 2
+            }
+        }
+    }
+} """
+
 FLAVOR_ID = {'Small Hadoop Instance':  'hadoop1-7',
              'Medium Hadoop Instance': 'hadoop1-15',
              'Large Hadoop Instance':  'hadoop1-30',
@@ -73,13 +143,38 @@ class FakeCluster(object):
     """Fake cluster class for testing."""
 
     def __init__(self, _id=None, name=None, status=None, stack_id=None,
-                 cbd_version=None):
+                 cbd_version=None, node_groups=()):
         """Fake cluster response."""
         self.id = _id
         self.name = name
         self.status = status
         self.stack_id = stack_id
         self.cbd_version = cbd_version
+        self.node_groups = list(node_groups)
+
+
+class FakeFlavor(object):
+
+    """Fake flavor class for testing."""
+
+    def __init__(self, _id, name):
+        """Fake flavor response."""
+        self.id = _id
+        self.name = name
+
+
+class FakeNode(object):
+
+    """Fake cluster node class for testing."""
+
+    def __init__(self, name, node_group, status):
+        """Fake cluster node response."""
+        self.id = 'node-%s' % name
+        self.name = name
+        self.node_group = node_group
+        self.status = status
+        self.addresses = None
+        self.components = []
 
 # pylint: disable=no-init
 class BigdataTest(common.HeatTestCase):
@@ -98,6 +193,11 @@ class BigdataTest(common.HeatTestCase):
         cfg.CONF.set_override('region_name_for_services', 'RegionOne')
         resource._register_class('Rackspace::Cloud::BigData',
                                  cbd.CloudBigData)
+        cbd_client._get_flavor_cache().clear()
+        cbd_client._get_stack_cache().clear()
+        cbd_client._get_client_pool().clear()
+        cbd_client._get_ssh_key_cache().clear()
+        status._aggregators.clear()
 
     def stub_StackConstraint_validate(self):
         validate = self.patchobject(StackConstraint, 'validate')
@@ -107,6 +207,10 @@ class BigdataTest(common.HeatTestCase):
         validate = self.patchobject(FlavorConstraint, 'validate')
         validate.return_value = True
 
+    def stub_flavor_list(self):
+        self.mck_cbd_client.flavors.list.return_value = [
+            FakeFlavor(f_id, name) for name, f_id in FLAVOR_ID.items()]
+
     def _setup_test_stack(self, stack_name, test_templ):
         """Helper method to parse template and stack."""
         temp = template_format.parse(test_templ)
@@ -132,12 +236,13 @@ class BigdataTest(common.HeatTestCase):
         self.mck_cbd_client.clusters.create.return_value = MagicMock(
             fake_cbdinstance)
         self.patchobject(RackspaceCBDClientPlugin,
-                         'get_flavor_id').return_value = 'hadoop1-7'
+                         'get_flavor_ids').return_value = FLAVOR_ID
 
-    def _setup_test_cluster(self, return_cluster, name, create_args):
+    def _setup_test_cluster(self, return_cluster, name, create_args,
+                            test_templ=TEMPLATE):
         """Helper method to create test cluster."""
         stack_name = '{0}_stack'.format(name)
-        templ, self.stack = self._setup_test_stack(stack_name, TEMPLATE)
+        templ, self.stack = self._setup_test_stack(stack_name, test_templ)
         cluster_instance = cbd.CloudBigData('%s_name' % name,
                                             templ.resource_definitions(
                                                 self.stack)['cbd_cluster'],
@@ -185,3 +290,640 @@ class BigdataTest(common.HeatTestCase):
         self.assertEqual((cluster.DELETE, cluster.COMPLETE), cluster.state)
         self.m.VerifyAll()
         self.m.UnsetStubs()
+
+    def test_flavor_lookup_cached(self):
+        """Test flavor names and ids are served from one flavor list."""
+        self.stub_flavor_list()
+        self.assertEqual('hadoop1-7', self.client_plugin.get_flavor_id(
+            'Small Hadoop Instance'))
+        self.assertEqual('hadoop1-15', self.client_plugin.get_flavor_id(
+            'hadoop1-15'))
+        self.assertEqual(1, self.mck_cbd_client.flavors.list.call_count)
+        self.assertEqual(1, cbd_client.flavor_cache_stats()['hits'])
+
+    def test_flavor_lookup_refreshes_on_miss(self):
+        """Test an unknown flavor re-reads the flavor list once."""
+        self.stub_flavor_list()
+        self.client_plugin.get_flavor_id('Small Hadoop Instance')
+        self.assertRaises(exception.EntityNotFound,
+                          self.client_plugin.get_flavor_id, 'Tiny Instance')
+        self.assertEqual(2, self.mck_cbd_client.flavors.list.call_count)
+
+    def test_stack_validation_cached(self):
+        """Test a known-good stack ID is only checked once."""
+        self.client_plugin.validate_stack('HADOOP_HDP2_2')
+        self.client_plugin.validate_stack('HADOOP_HDP2_2')
+        self.client_plugin.validate_stack('SPARK_HDP2_2')
+        self.assertEqual(2, self.mck_cbd_client.stacks.get.call_count)
+
+    def test_stack_validation_cached_per_tenant(self):
+        """Test a stack checked by one tenant is checked by another."""
+        for tenant_id in ('123456', '123456', '654321'):
+            context = self._pooled_client_context('token')
+            context.tenant_id = tenant_id
+            plugin = RackspaceCBDClientPlugin(context=context)
+            plugin.validate_stack('HADOOP_HDP2_2')
+        self.assertEqual(2, self.mck_cbd_client.stacks.get.call_count)
+
+    def test_stack_validation_negative_cache(self):
+        """Test only a missing stack ID is negatively cached."""
+        not_found = lava.RequestError('Not found')
+        not_found.code = 404
+        unavailable = lava.RequestError('Unavailable')
+        unavailable.code = 503
+        self.mck_cbd_client.stacks.get.side_effect = [unavailable, not_found]
+        self.assertRaises(lava.LavaError,
+                          self.client_plugin.validate_stack, 'BAD_STACK')
+        self.assertRaises(lava.RequestError,
+                          self.client_plugin.validate_stack, 'BAD_STACK')
+        self.assertRaises(lava.RequestError,
+                          self.client_plugin.validate_stack, 'BAD_STACK')
+        self.assertEqual(2, self.mck_cbd_client.stacks.get.call_count)
+
+    def _pooled_client_context(self, token):
+        return mock.Mock(region_name='DFW', tenant_id='123456',
+                         username='test_user', auth_url='auth_url',
+                         auth_token=token, auth_token_info=None)
+
+    @mock.patch.object(lava, 'Lava')
+    def test_client_pool_reuse(self, mock_lava):
+        """Test plugins sharing a token reuse one pooled client."""
+        clients = []
+        for _ in range(3):
+            plugin = RackspaceCBDClientPlugin(
+                context=self._pooled_client_context('token'))
+            clients.append(ORIG_CREATE(plugin))
+        self.assertIs(clients[0], clients[1])
+        self.assertIs(clients[0], clients[2])
+        plugin = RackspaceCBDClientPlugin(
+            context=self._pooled_client_context('other_token'))
+        ORIG_CREATE(plugin)
+        self.assertEqual(2, mock_lava.call_count)
+        stats = cbd_client.client_pool_stats()
+        self.assertEqual(2, stats['size'])
+        self.assertEqual(0.5, stats['reuse_rate'])
+
+    @mock.patch.object(lava, 'Lava')
+    def test_client_pool_auth_failure(self, mock_lava):
+        """Test failed authentication does not pool a client."""
+        mock_lava.side_effect = lava.LavaError('Unauthorized')
+        plugin = RackspaceCBDClientPlugin(
+            context=self._pooled_client_context('token'))
+        self.assertRaises(exception.AuthorizationFailure,
+                          ORIG_CREATE, plugin)
+        self.assertEqual(0, cbd_client.client_pool_stats()['size'])
+
+    @mock.patch.object(lava, 'Lava')
+    def test_client_evicted_on_revoked_token(self, mock_lava):
+        """Test a client whose token is rejected is no longer reused."""
+        mock_lava.return_value.clusters.list.side_effect = (
+            lava.RequestError('Unauthorized', code=401))
+        plugin = RackspaceCBDClientPlugin(
+            context=self._pooled_client_context('token'))
+        client = ORIG_CREATE(plugin)
+        self.assertEqual(1, cbd_client.client_pool_stats()['size'])
+        self.assertRaises(lava.RequestError, client.clusters.list)
+        self.assertEqual(0, cbd_client.client_pool_stats()['size'])
+        self.assertIsNot(client, ORIG_CREATE(plugin))
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_attributes_cached(self, mock_is_service_available):
+        """Test attributes are read from cached cluster details."""
+        mock_is_service_available.return_value = True
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._create_test_cluster(
+            fake_cluster, 'stack_attr', CREATE_CLUSTER_ARG_1)
+        scheduler.TaskRunner(cluster.create)()
+        self.mck_cbd_client.clusters.get.return_value = fake_cluster
+        self.mck_cbd_client.clusters.nodes.return_value = []
+        self.assertEqual(2, cluster._resolve_attribute(cluster.CBD_VERSION))
+        self.assertEqual('ACTIVE', cluster._resolve_attribute(cluster.STATUS))
+        self.assertEqual({}, cluster._resolve_attribute(cluster.ENDPOINTS))
+        self.assertEqual(1, self.mck_cbd_client.clusters.get.call_count)
+        cluster._invalidate_cluster_detail()
+        cluster._resolve_attribute(cluster.CBD_VERSION)
+        self.assertEqual(2, self.mck_cbd_client.clusters.get.call_count)
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_create_complete_when_detail_read_fails(
+            self, mock_is_service_available):
+        """Test a failed detail read does not fail a built cluster."""
+        mock_is_service_available.return_value = True
+        cluster = self._created_cluster('stack_detail_error')
+        self.patchobject(cluster, '_poll_cluster').return_value = (
+            FakeCluster(**RETURN_CLUSTER_1))
+        self.mck_cbd_client.clusters.nodes.side_effect = lava.RequestError(
+            'Service unavailable', code=503)
+        self.assertTrue(cluster.check_create_complete(None))
+        self.assertNotIn('cluster_detail', cluster.data())
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_preflight_skips_quota_of_existing_cluster(
+            self, mock_is_service_available):
+        """Test an existing cluster is not checked against the quota."""
+        mock_is_service_available.return_value = True
+        cluster = self._setup_test_cluster(
+            FakeCluster(**RETURN_CLUSTER_1), 'stack_preflight',
+            CREATE_CLUSTER_ARG_1)
+        self.patchobject(RackspaceCBDClientPlugin,
+                         'validate_stack').return_value = {
+            'id': 'HADOOP_HDP2_2', 'node_groups': []}
+        self.patchobject(RackspaceCBDClientPlugin,
+                         'get_flavor_catalog').return_value = {
+            'Small Hadoop Instance': {'id': 'hadoop1-7', 'ram': 7680}}
+        quota = self.patchobject(RackspaceCBDClientPlugin,
+                                 'get_quota_remaining')
+        quota.return_value = {'node_count': 1}
+        self.assertRaises(exception.StackValidationFailed,
+                          cluster._preflight)
+        cluster.resource_id = '4'
+        cluster._preflight()
+        self.assertEqual(1, quota.call_count)
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_preflight_quota_covers_stack(self, mock_is_service_available):
+        """Test the quota is checked against every unbuilt stack cluster."""
+        mock_is_service_available.return_value = True
+        cluster = self._setup_test_cluster(
+            FakeCluster(**RETURN_CLUSTER_1), 'stack_preflight_quota',
+            CREATE_CLUSTER_ARG_1)
+        self.patchobject(RackspaceCBDClientPlugin,
+                         'validate_stack').return_value = {
+            'id': 'HADOOP_HDP2_2', 'node_groups': []}
+        self.patchobject(RackspaceCBDClientPlugin,
+                         'get_flavor_catalog').return_value = {
+            'Small Hadoop Instance': {'id': 'hadoop1-7', 'ram': 7680}}
+        self.patchobject(RackspaceCBDClientPlugin,
+                         'get_quota_remaining').return_value = {
+            'node_count': 4}
+        # The stack's own cbd_cluster needs another 3 nodes
+        exc = self.assertRaises(exception.StackValidationFailed,
+                                cluster._preflight)
+        self.assertIn('need 6 nodes but only 4 remain', str(exc))
+        self.stack.resources['cbd_cluster'].resource_id = '5'
+        cluster._preflight()
+        self.assertEqual({'build_time': 1500, 'nodes': 3,
+                          'node_hours': 1.25},
+                         cluster._resolve_attribute(cluster.BUILD_ESTIMATE))
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    @mock.patch.object(cbd.time, 'time')
+    def test_health_attributes_refreshed_when_stale(
+            self, mock_time, mock_is_service_available):
+        """Test health attributes share one read per freshness window."""
+        mock_is_service_available.return_value = True
+        mock_time.return_value = 1000
+        cluster = self._created_cluster('stack_health')
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            **RETURN_CLUSTER_1)
+        self.mck_cbd_client.clusters.nodes.return_value = [
+            FakeNode('master-0', 'master', 'ACTIVE'),
+            FakeNode('slave-0', 'slave', 'ACTIVE'),
+            FakeNode('slave-1', 'slave', 'BUILDING')]
+        self.assertEqual({'master-0': 'ACTIVE', 'slave-0': 'ACTIVE',
+                          'slave-1': 'BUILDING'},
+                         cluster._resolve_attribute(cluster.NODE_STATUS))
+        self.assertEqual({'master': {'ACTIVE': 1},
+                          'slave': {'ACTIVE': 1, 'BUILDING': 1}},
+                         cluster._resolve_attribute(cluster.NODE_COUNTS))
+        self.assertEqual('1970-01-01T00:16:40Z',
+                         cluster._resolve_attribute(cluster.LAST_UPDATED))
+        self.assertEqual(1, self.mck_cbd_client.clusters.nodes.call_count)
+
+        mock_time.return_value = 1061
+        self.mck_cbd_client.clusters.nodes.return_value = [
+            FakeNode('master-0', 'master', 'ACTIVE')]
+        self.assertEqual({'master': {'ACTIVE': 1}},
+                         cluster._resolve_attribute(cluster.NODE_COUNTS))
+        self.assertEqual('1970-01-01T00:17:41Z',
+                         cluster._resolve_attribute(cluster.LAST_UPDATED))
+        self.assertEqual(2, self.mck_cbd_client.clusters.get.call_count)
+        self.assertEqual(2, self.mck_cbd_client.clusters.nodes.call_count)
+
+        # A failed refresh serves the stale details
+        mock_time.return_value = 1200
+        self.mck_cbd_client.clusters.nodes.side_effect = lava.LavaError(
+            'Service unavailable')
+        self.assertEqual('1970-01-01T00:17:41Z',
+                         cluster._resolve_attribute(cluster.LAST_UPDATED))
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_resize(self, mock_is_service_available):
+        """Test a slave node count change resizes the cluster in place."""
+        mock_is_service_available.return_value = True
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._create_test_cluster(
+            fake_cluster, 'stack_resize', CREATE_CLUSTER_ARG_1)
+        scheduler.TaskRunner(cluster.create)()
+        resize = cluster.handle_update(None, {}, {cluster.NUM_SLAVES: 5})
+        self.assertEqual([{'id': 'slave', 'count': 5}], resize)
+        self.mck_cbd_client.clusters.resize.assert_called_once_with(
+            cluster.resource_id, node_groups=resize)
+
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='ACTIVE', cbd_version=2,
+            node_groups=[mock.Mock(id='slave', flavor_id='hadoop1-7',
+                                   count=3)])
+        self.assertFalse(cluster.check_update_complete(resize))
+        cluster._poll_states[cluster.UPDATE]['next_poll'] = 0
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='UPDATING', cbd_version=2,
+            node_groups=[mock.Mock(id='slave', flavor_id='hadoop1-7',
+                                   count=5)])
+        self.assertFalse(cluster.check_update_complete(resize))
+        cluster._poll_states[cluster.UPDATE]['next_poll'] = 0
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='ACTIVE', cbd_version=2,
+            node_groups=[mock.Mock(id='slave', flavor_id='hadoop1-7',
+                                   count=5)])
+        self.mck_cbd_client.clusters.nodes.return_value = []
+        self.assertTrue(cluster.check_update_complete(resize))
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_resize_counts_before_status(self,
+                                                 mock_is_service_available):
+        """Test new node counts reported before the resize starts."""
+        mock_is_service_available.return_value = True
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._create_test_cluster(
+            fake_cluster, 'stack_resize_early', CREATE_CLUSTER_ARG_1)
+        scheduler.TaskRunner(cluster.create)()
+        resize = cluster.handle_update(None, {}, {cluster.NUM_SLAVES: 5})
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='ACTIVE', cbd_version=2,
+            node_groups=[mock.Mock(id='slave', flavor_id='hadoop1-7',
+                                   count=5)])
+        slaves = [FakeNode('slave-%d' % index, 'slave', 'ACTIVE')
+                  for index in range(3)]
+        self.mck_cbd_client.clusters.nodes.return_value = slaves
+        self.assertFalse(cluster.check_update_complete(resize))
+
+        # The resize finished between two polls
+        cluster._poll_states[cluster.UPDATE]['next_poll'] = 0
+        slaves.extend(FakeNode('slave-%d' % index, 'slave', 'ACTIVE')
+                      for index in range(3, 5))
+        self.assertTrue(cluster.check_update_complete(resize))
+
+    def test_cluster_update_no_resize(self):
+        """Test an update without node count changes makes no API call."""
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._setup_test_cluster(
+            fake_cluster, 'stack_no_resize', CREATE_CLUSTER_ARG_1)
+        self.assertIsNone(cluster.handle_update(None, {}, {}))
+        self.assertTrue(cluster.check_update_complete(None))
+        self.assertFalse(self.mck_cbd_client.clusters.resize.called)
+
+    def test_ssh_key_cached(self):
+        """Test an SSH key is only registered once."""
+        self.client_plugin.ensure_ssh_key('test', 'ssh-rsa AAAA')
+        self.client_plugin.ensure_ssh_key('test', 'ssh-rsa AAAA')
+        self.mck_cbd_client.credentials.create_ssh_key.\
+            assert_called_once_with('test', 'ssh-rsa AAAA')
+
+    def test_ssh_key_retried_after_server_error(self):
+        """Test an SSH key is registered again after a server error."""
+        unavailable = lava.RequestError('Unavailable')
+        unavailable.code = 503
+        self.mck_cbd_client.credentials.create_ssh_key.side_effect = [
+            unavailable, None]
+        self.client_plugin.ensure_ssh_key('test', 'ssh-rsa AAAA')
+        self.client_plugin.ensure_ssh_key('test', 'ssh-rsa AAAA')
+        self.client_plugin.ensure_ssh_key('test', 'ssh-rsa AAAA')
+        self.assertEqual(
+            2, self.mck_cbd_client.credentials.create_ssh_key.call_count)
+
+    def test_ssh_key_cached_only_when_it_exists(self):
+        """Test only a conflict caches a key that was not registered."""
+        forbidden = lava.RequestError('Forbidden')
+        forbidden.code = 403
+        conflict = lava.RequestError('Conflict')
+        conflict.code = 409
+        self.mck_cbd_client.credentials.create_ssh_key.side_effect = [
+            forbidden, lava.LavaError('Bad response'), conflict]
+        for _attempt in range(4):
+            self.client_plugin.ensure_ssh_key('test', 'ssh-rsa AAAA')
+        self.assertEqual(
+            3, self.mck_cbd_client.credentials.create_ssh_key.call_count)
+
+    def _created_cluster(self, name):
+        """Return a created cluster whose status checks are not mocked."""
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._create_test_cluster(
+            fake_cluster, name, CREATE_CLUSTER_ARG_1)
+        scheduler.TaskRunner(cluster.create)()
+        del cluster.check_create_complete
+        self.mck_cbd_client.clusters.list.return_value = []
+        return cluster
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_create_fails_fast_on_terminal_status(self,
+                                                  mock_is_service_available):
+        """Test a cluster deleted while building fails the create."""
+        mock_is_service_available.return_value = True
+        cluster = self._created_cluster('stack_deleted')
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='DELETED')
+        self.assertRaises(lava.LavaError,
+                          cluster.check_create_complete, None)
+        state = cluster._poll_state(cluster.CREATE)
+        self.assertEqual('DELETED', state['transitions'][-1][0])
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_create_retries_transient_errors(self,
+                                             mock_is_service_available):
+        """Test throttled polls are retried within the retry budget."""
+        mock_is_service_available.return_value = True
+        cfg.CONF.set_override('poll_retry_budget', 1,
+                              group='cloud_big_data')
+        cluster = self._created_cluster('stack_throttled')
+        throttled = lava.RequestError('Too many requests')
+        throttled.code = 429
+        throttled.retry_after = 30
+        self.mck_cbd_client.clusters.get.side_effect = throttled
+        self.assertFalse(cluster.check_create_complete(None))
+        state = cluster._poll_state(cluster.CREATE)
+        self.assertGreaterEqual(state['next_poll'] - state['last_poll'], 30)
+        state['next_poll'] = 0
+        self.assertRaises(lava.RequestError,
+                          cluster.check_create_complete, None)
+        # A retried create starts with a fresh retry budget
+        cluster.handle_create()
+        self.assertEqual({}, cluster._poll_state(cluster.CREATE))
+        self.assertNotIn('poll_create', cluster.data())
+        self.assertFalse(cluster.check_create_complete(None))
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_async_delete(self, mock_is_service_available):
+        """Test an asynchronous delete completes once it is accepted."""
+        mock_is_service_available.return_value = True
+        cluster = self._created_cluster('stack_async_delete')
+        cluster.properties.data[cluster.ASYNC_DELETE] = True
+        mock_reaper = mock.Mock()
+        self.patchobject(reaper, 'get_reaper').return_value = mock_reaper
+        scheduler.TaskRunner(cluster.delete)()
+        self.assertEqual((cluster.DELETE, cluster.COMPLETE), cluster.state)
+        self.mck_cbd_client.clusters.delete.assert_called_once_with(
+            cluster.resource_id)
+        get_client, cluster_id = mock_reaper.watch.call_args[0]
+        self.assertEqual(cluster.resource_id, cluster_id)
+        self.assertIs(self.mck_cbd_client, get_client())
+        self.assertFalse(self.mck_cbd_client.clusters.get.called)
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_create_node_groups(self, mock_is_service_available):
+        """Test every node group is created with its own flavor."""
+        mock_is_service_available.return_value = True
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._setup_test_cluster(
+            fake_cluster, 'stack_node_groups', CREATE_CLUSTER_ARG_1,
+            TEMPLATE_NODE_GROUPS)
+        cluster.check_create_complete = mock.Mock(return_value=True)
+        scheduler.TaskRunner(cluster.create)()
+        self.assertEqual((cluster.CREATE, cluster.COMPLETE), cluster.state)
+        RackspaceCBDClientPlugin.get_flavor_ids.assert_called_once_with(
+            ['Medium Hadoop Instance', 'Small Hadoop Instance'])
+        create_args = self.mck_cbd_client.clusters.create.call_args[1]
+        self.assertEqual(
+            [{'id': 'master', 'flavor_id': 'hadoop1-15', 'count': 1},
+             {'id': 'slave', 'flavor_id': 'hadoop1-7', 'count': 5}],
+            create_args['node_groups'])
+        self.assertEqual(['script-1'], create_args['user_scripts'])
+        self.assertEqual([], create_args['connectors'])
+
+    def test_node_group_flavor_change_replaces(self):
+        """Test changing a node group flavor replaces the cluster."""
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._setup_test_cluster(
+            fake_cluster, 'stack_node_group_flavor', CREATE_CLUSTER_ARG_1,
+            TEMPLATE_NODE_GROUPS)
+        node_groups = [{'id': 'master', 'flavor': 'Large Hadoop Instance',
+                        'count': 1},
+                       {'id': 'slave', 'flavor': 'Small Hadoop Instance',
+                        'count': 5}]
+        self.assertRaises(resource.UpdateReplace, cluster.handle_update,
+                          None, {}, {cluster.NODE_GROUPS: node_groups})
+        self.assertFalse(self.mck_cbd_client.clusters.resize.called)
+
+    def test_flavor_lookup_batched(self):
+        """Test several flavors are resolved from one flavor list."""
+        self.stub_flavor_list()
+        self.assertEqual({'Small Hadoop Instance': 'hadoop1-7',
+                          'hadoop1-60': 'hadoop1-60'},
+                         self.client_plugin.get_flavor_ids(
+                             ['Small Hadoop Instance', 'hadoop1-60']))
+        self.assertEqual(1, self.mck_cbd_client.flavors.list.call_count)
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_claimed_from_pool(self, mock_is_service_available):
+        """Test a cluster is adopted from a warm pool and recycled."""
+        mock_is_service_available.return_value = True
+        fake_cluster = FakeCluster(**RETURN_CLUSTER_1)
+        cluster = self._create_test_cluster(
+            fake_cluster, 'stack_pool', CREATE_CLUSTER_ARG_1)
+        cluster.properties.data[cluster.POOL] = 'cbdpool-test'
+        spec = dict(CREATE_CLUSTER_ARG_1)
+        del spec['name']
+        pool = warm_pool.ClusterPool(
+            'cbdpool-test', 'tenant', 'dfw', spec, 1,
+            lambda: self.mck_cbd_client, recycle=True)
+        pool.release('pooled-1')
+        self.patchobject(warm_pool, 'get_pool').return_value = pool
+        self.patchobject(pool, '_wake')
+        scheduler.TaskRunner(cluster.create)()
+        self.assertEqual((cluster.CREATE, cluster.COMPLETE), cluster.state)
+        self.assertEqual('pooled-1', cluster.resource_id)
+        self.assertFalse(self.mck_cbd_client.clusters.create.called)
+        scheduler.TaskRunner(cluster.delete)()
+        self.assertEqual((cluster.DELETE, cluster.COMPLETE), cluster.state)
+        self.assertFalse(self.mck_cbd_client.clusters.delete.called)
+        self.assertEqual(['pooled-1'], pool.idle())
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_pool_restored_from_resource_data(self,
+                                              mock_is_service_available):
+        """Test a pool unknown to the engine is restored and deleted."""
+        mock_is_service_available.return_value = True
+        templ, self.stack = self._setup_test_stack('stack_pool',
+                                                   TEMPLATE_POOL)
+        pool_res = cbd.CloudBigDataPool(
+            'cbd_pool', templ.resource_definitions(self.stack)['cbd_pool'],
+            self.stack)
+        pool_res._store()
+        self._stubout_create(None)
+        self.patchobject(RackspaceCBDClientPlugin,
+                         'get_flavor_id').return_value = 'hadoop1-7'
+        self.patchobject(warm_pool.ClusterPool, 'start')
+        self.patchobject(warm_pool.ClusterPool, '_wake')
+        self.mck_cbd_client.clusters.create.side_effect = [
+            FakeCluster(_id='1', status='BUILDING'),
+            FakeCluster(_id='2', status='BUILDING')]
+        pool_res.handle_create()
+        key = (pool_res.context.tenant_id, pool_res.client_plugin().region,
+               pool_res.resource_id)
+        self.addCleanup(warm_pool.unregister, *key)
+
+        # Another engine, or this one after a restart
+        warm_pool.unregister(*key)
+        pool = pool_res._pool()
+        self.assertEqual(['1', '2'], sorted(pool.members()))
+        self.assertIs(pool, warm_pool.get_pool(*key))
+        self.assertIsNone(warm_pool.get_pool('other', key[1], key[2]))
+
+        warm_pool.unregister(*key)
+        pool_res.handle_delete()
+        self.assertEqual(
+            ['1', '2'],
+            sorted(call[0][0] for call in
+                   self.mck_cbd_client.clusters.delete.call_args_list))
+        self.assertNotIn('pool_state', pool_res.data())
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_adopt(self, mock_is_service_available):
+        """Test an adopted cluster keeps its details after one read."""
+        mock_is_service_available.return_value = True
+        cluster = self._setup_test_cluster(
+            FakeCluster(**RETURN_CLUSTER_1), 'stack_adopt',
+            CREATE_CLUSTER_ARG_1)
+        nodes = [{'id': 'node-1', 'name': 'slave-1', 'node_group': 'slave',
+                  'status': 'ACTIVE', 'public_ip': None, 'private_ip': None,
+                  'endpoints': {}}]
+        detail = {'status': 'ACTIVE', 'cbd_version': 1, 'node_groups': [],
+                  'nodes': nodes}
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='ACTIVE', cbd_version=2,
+            node_groups=[mock.Mock(id='slave', flavor_id='hadoop1-7',
+                                   count=3)])
+        scheduler.TaskRunner(cluster.adopt, {
+            'resource_id': '4',
+            'resource_data': {'cluster_detail': jsonutils.dumps(detail)},
+            'metadata': {}})()
+        self.assertEqual((cluster.ADOPT, cluster.COMPLETE), cluster.state)
+        self.assertEqual('4', cluster.resource_id)
+        self.assertEqual(nodes, cluster._resolve_attribute(cluster.NODES))
+        self.assertEqual(2, cluster._resolve_attribute(cluster.CBD_VERSION))
+        self.mck_cbd_client.clusters.get.assert_called_once_with('4')
+        self.assertFalse(self.mck_cbd_client.clusters.nodes.called)
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_abandon(self, mock_is_service_available):
+        """Test an abandoned cluster carries its details."""
+        mock_is_service_available.return_value = True
+        cluster = self._created_cluster('stack_abandon')
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            **RETURN_CLUSTER_1)
+        self.mck_cbd_client.clusters.nodes.return_value = []
+        abandoned = cluster.prepare_abandon()
+        self.assertEqual(cluster.resource_id, abandoned['resource_id'])
+        detail = jsonutils.loads(
+            abandoned['resource_data']['cluster_detail'])
+        self.assertEqual('ACTIVE', detail['status'])
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_cluster_check(self, mock_is_service_available):
+        """Test a check reads the cluster once and requires it active."""
+        mock_is_service_available.return_value = True
+        cluster = self._created_cluster('stack_check')
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            **RETURN_CLUSTER_1)
+        scheduler.TaskRunner(cluster.check)()
+        self.assertEqual((cluster.CHECK, cluster.COMPLETE), cluster.state)
+        self.mck_cbd_client.clusters.get.return_value = FakeCluster(
+            status='ERROR')
+        self.assertRaises(exception.ResourceFailure,
+                          scheduler.TaskRunner(cluster.check))
+        self.assertEqual((cluster.CHECK, cluster.FAILED), cluster.state)
+        self.assertEqual(2, self.mck_cbd_client.clusters.get.call_count)
+
+    def _setup_test_fleet(self, name):
+        """Helper method to set up a fleet whose clusters are listed."""
+        templ, self.stack = self._setup_test_stack('%s_stack' % name,
+                                                   TEMPLATE_FLEET)
+        fleet = cbd.CloudBigDataFleet(
+            '%s_name' % name,
+            templ.resource_definitions(self.stack)['cbd_cluster'],
+            self.stack)
+        fleet._store()
+        self._stubout_create(None)
+        self.clusters = {}
+
+        def create(name, **kwargs):
+            cluster = FakeCluster(_id=str(len(self.clusters) + 1), name=name,
+                                  status='BUILDING', cbd_version=2)
+            self.clusters[cluster.id] = cluster
+            return cluster
+        self.mck_cbd_client.clusters.create.side_effect = create
+        self.mck_cbd_client.clusters.list.side_effect = (
+            lambda: list(self.clusters.values()))
+        return fleet
+
+    def _build_fleet(self):
+        for cluster in self.clusters.values():
+            cluster.status = 'ACTIVE'
+        status._aggregators.clear()
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_fleet_create(self, mock_is_service_available):
+        """Test a fleet resolves its key and flavor once for all clusters."""
+        mock_is_service_available.return_value = True
+        fleet = self._setup_test_fleet('stack_fleet')
+        fleet.handle_create()
+        self.assertEqual(
+            ['sandbox-1', 'sandbox-2', 'sandbox-3'],
+            sorted(call[1]['name'] for call in
+                   self.mck_cbd_client.clusters.create.call_args_list))
+        self.assertEqual(
+            1, self.mck_cbd_client.credentials.create_ssh_key.call_count)
+        RackspaceCBDClientPlugin.get_flavor_ids.assert_called_once_with(
+            ['Small Hadoop Instance'])
+        self.assertFalse(fleet.check_create_complete(None))
+        fleet._poll_states[fleet.CREATE]['next_poll'] = 0
+        self._build_fleet()
+        self.assertTrue(fleet.check_create_complete(None))
+        self.assertEqual(2, self.mck_cbd_client.clusters.list.call_count)
+        self.assertFalse(self.mck_cbd_client.clusters.get.called)
+        self.assertEqual(['1', '2', '3'],
+                         fleet._resolve_attribute(fleet.CLUSTER_IDS))
+        self.assertEqual([2, 2, 2],
+                         fleet._resolve_attribute(fleet.CBD_VERSIONS))
+
+    @mock.patch.object(res.Resource, 'is_service_available')
+    def test_fleet_scale(self, mock_is_service_available):
+        """Test a cluster count change adds or deletes clusters."""
+        mock_is_service_available.return_value = True
+        fleet = self._setup_test_fleet('stack_fleet_scale')
+        fleet.handle_create()
+        self._build_fleet()
+        added = fleet.handle_update(None, {}, {fleet.CLUSTER_COUNT: 4})
+        self.assertEqual(['4'], added)
+        self.assertEqual('sandbox-4', self.clusters['4'].name)
+        mock_reaper = mock.Mock()
+        self.patchobject(reaper, 'get_reaper').return_value = mock_reaper
+        self.assertIsNone(
+            fleet.handle_update(None, {}, {fleet.CLUSTER_COUNT: 2}))
+        self.assertEqual(
+            ['3', '4'],
+            sorted(call[0][0] for call in
+                   self.mck_cbd_client.clusters.delete.call_args_list))
+        self.assertEqual(['1', '2'],
+                         fleet._resolve_attribute(fleet.CLUSTER_IDS))
+        self.assertRaises(resource.UpdateReplace, fleet.handle_update,
+                          None, {}, {fleet.NUM_SLAVES: 5})
+
+    def test_catalog_snapshot(self):
+        """Test flavors and stacks are served from the catalog snapshot."""
+        directory = self.useFixture(fixtures.TempDir()).path
+        cfg.CONF.set_override('catalog_snapshot_dir', directory,
+                              group='cloud_big_data')
+        plugin = RackspaceCBDClientPlugin(
+            context=self._pooled_client_context('token'))
+        snapshot.get_store().write(
+            '123456', 'dfw',
+            [{'id': 'hadoop1-7', 'name': 'Small Hadoop Instance',
+              'ram': 7680, 'vcpus': 2, 'disk': 1250}],
+            [{'id': 'HADOOP_HDP2_2', 'node_groups': []}])
+        self.assertEqual('hadoop1-7', plugin.get_flavor_id(
+            'Small Hadoop Instance'))
+        self.assertEqual({'id': 'HADOOP_HDP2_2', 'node_groups': []},
+                         plugin.validate_stack('HADOOP_HDP2_2'))
+        self.assertFalse(self.mck_cbd_client.flavors.list.called)
+        self.assertFalse(self.mck_cbd_client.stacks.get.called)
@@ -0,0 +1,41 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from heat.tests import common
+
+from .. import fleet
+
+
+class FleetTest(common.HeatTestCase):
+
+    """Bulk cluster creation test class."""
+
+    def test_cluster_name(self):
+        """Test member names keep their number within the length limit."""
+        self.assertEqual('sandbox-3', fleet.cluster_name('sandbox', 3))
+        self.assertEqual('a' * 47 + '-12', fleet.cluster_name('a' * 50, 12))
+
+    def test_bulk_create(self):
+        """Test every cluster is submitted and failures are collected."""
+        failed = Exception('Over quota')
+
+        def create(name):
+            if name == 'bad':
+                raise failed
+            return mock.Mock(id=name.upper())
+        created, errors = fleet.bulk_create(create, ['a', 'bad', 'b'],
+                                            concurrency=2)
+        self.assertEqual({'a': 'A', 'b': 'B'}, created)
+        self.assertEqual({'bad': failed}, errors)
@@ -0,0 +1,92 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from heat.tests import common
+
+from .. import instrumentation
+
+
+class InstrumentationTest(common.HeatTestCase):
+
+    """CBD API call instrumentation test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(InstrumentationTest, self).setUp()
+        self.sink = instrumentation.HistogramSink()
+        instrumentation.set_sink(self.sink)
+        self.addCleanup(instrumentation.set_sink, None)
+        self.lava = mock.MagicMock()
+        self.client = instrumentation.InstrumentedClient(self.lava)
+
+    def test_manager_calls_timed(self):
+        """Test calls through client managers are recorded."""
+        self.lava.clusters.get.return_value = 'cluster'
+        self.assertEqual('cluster', self.client.clusters.get('1'))
+        self.client.clusters.get('2')
+        self.lava.clusters.get.assert_called_with('2')
+        snapshot = self.sink.snapshot()
+        self.assertEqual(2, snapshot['clusters.get']['count'])
+        self.assertEqual(0, snapshot['clusters.get']['errors'])
+        self.assertEqual(1, self.sink.percentile('clusters.get', 99))
+
+    def test_statsd_status_counters(self):
+        """Test statsd counts calls by status and failed calls by code."""
+        sink = instrumentation.StatsdSink('127.0.0.1', 8125, 'heat.cbd')
+        sink._socket = mock.Mock()
+        sink.emit({'name': 'clusters.get', 'duration': 0.5,
+                   'status': 'ok', 'code': None})
+        sink.emit({'name': 'clusters.get', 'duration': 0.5,
+                   'status': 'error', 'code': 503})
+        sent = [call[0][0].decode('utf-8')
+                for call in sink._socket.sendto.call_args_list]
+        self.assertEqual(
+            ['heat.cbd.clusters.get:500|ms\nheat.cbd.clusters.get.ok:1|c',
+             'heat.cbd.clusters.get:500|ms\nheat.cbd.clusters.get.error:1|c'
+             '\nheat.cbd.clusters.get.code.503:1|c'], sent)
+
+    def test_failed_calls_recorded(self):
+        """Test failed calls are recorded with their status code."""
+        error = Exception('Unavailable')
+        error.code = 503
+        self.lava.flavors.list.side_effect = error
+        events = []
+        instrumentation.set_sink(mock.Mock(emit=events.append))
+        with instrumentation.scope('stack/cluster', 'flavor_lookup',
+                                   retries=2):
+            self.assertRaises(Exception, self.client.flavors.list)
+        self.assertEqual(1, len(events))
+        self.assertEqual('flavors.list', events[0]['name'])
+        self.assertEqual('error', events[0]['status'])
+        self.assertEqual(503, events[0]['code'])
+        self.assertEqual(2, events[0]['retries'])
+        self.assertEqual('stack/cluster', events[0]['correlation_id'])
+        self.assertEqual('flavor_lookup', events[0]['phase'])
+
+    def test_phase_timings_aggregated(self):
+        """Test calls in a scope are aggregated per phase."""
+        timings = {}
+        with instrumentation.scope('stack/cluster', 'submit', timings):
+            self.client.clusters.create(name='test')
+        with instrumentation.scope('stack/cluster', 'build_poll', timings):
+            self.client.clusters.get('1')
+            self.client.clusters.get('1')
+        self.assertEqual(1, timings['submit']['calls'])
+        self.assertEqual(2, timings['build_poll']['calls'])
+
+    def test_non_manager_attributes_passed_through(self):
+        """Test attributes other than API managers are not wrapped."""
+        self.lava.endpoint = 'https://example.com'
+        self.assertEqual('https://example.com', self.client.endpoint)
@@ -0,0 +1,121 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from heat.tests import common
+
+from .. import polling
+
+
+class PollPolicyTest(common.HeatTestCase):
+
+    """Cluster status poll policy test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(PollPolicyTest, self).setUp()
+        self.now = 0
+        self.policy = polling.PollPolicy(1500, min_interval=5,
+                                         max_interval=120,
+                                         timer=lambda: self.now)
+
+    def test_backoff_while_unchanged(self):
+        """Test the interval doubles while the status is unchanged."""
+        state = {}
+        intervals = []
+        for _ in range(5):
+            self.policy.record(state, 'BUILDING')
+            intervals.append(state['interval'])
+            self.now = state['next_poll']
+        self.assertEqual([5, 10, 20, 40, 80], intervals)
+
+    def test_reset_on_status_change(self):
+        """Test a status change resets the interval to the minimum."""
+        state = {}
+        self.policy.record(state, 'BUILDING')
+        self.now = 10
+        self.policy.record(state, 'BUILDING')
+        self.assertEqual(10, state['interval'])
+        self.now = 30
+        self.policy.record(state, 'CONFIGURING')
+        self.assertEqual(5, state['interval'])
+
+    def test_failed_poll_backs_off(self):
+        """Test a failed poll keeps the last status and backs off."""
+        state = {}
+        self.policy.record(state, 'BUILDING')
+        self.policy.record(state, None)
+        self.assertEqual('BUILDING', state['status'])
+        self.assertEqual(10, state['interval'])
+
+    def test_minimum_interval_near_completion(self):
+        """Test polls use the minimum interval near expected completion."""
+        state = {'started': 0, 'status': 'BUILDING', 'interval': 120}
+        self.now = 1450
+        self.policy.record(state, 'BUILDING')
+        self.assertEqual(5, state['interval'])
+
+    def test_skipped_polls_counted(self):
+        """Test polls before the next poll time are skipped and counted."""
+        state = {}
+        self.assertTrue(self.policy.should_poll(state))
+        self.policy.record(state, 'BUILDING')
+        saved = polling.stats()['polls_saved']
+        self.assertFalse(self.policy.should_poll(state))
+        self.assertEqual(saved + 1, polling.stats()['polls_saved'])
+        self.now = state['next_poll']
+        self.assertTrue(self.policy.should_poll(state))
+
+    def test_retry_after_honored(self):
+        """Test a Retry-After delays the next poll."""
+        state = {}
+        self.policy.record(state, None, wait=60)
+        self.assertEqual(60, state['next_poll'])
+        self.assertEqual(1, state['failures'])
+
+    def test_transitions_recorded(self):
+        """Test status transitions are recorded with their time."""
+        state = {}
+        self.policy.record(state, 'BUILDING')
+        self.now = 100
+        self.policy.record(state, 'BUILDING')
+        self.now = 200
+        self.policy.record(state, 'CONFIGURING')
+        self.assertEqual([['BUILDING', 0], ['CONFIGURING', 200]],
+                         state['transitions'])
+
+    def test_stuck_status(self):
+        """Test a status unchanged for far too long is stuck."""
+        state = {}
+        self.policy.record(state, 'BUILDING')
+        self.now = 1500 * 3
+        self.assertFalse(self.policy.is_stuck(state))
+        self.now += 1
+        self.assertTrue(self.policy.is_stuck(state))
+
+    def test_classify(self):
+        """Test cluster statuses map to action outcomes."""
+        self.assertEqual(polling.COMPLETE,
+                         polling.classify('CREATE', 'ACTIVE'))
+        self.assertEqual(polling.IN_PROGRESS,
+                         polling.classify('CREATE', 'BUILDING'))
+        for status in ('ERROR', 'DELETED', 'DELETING', 'UNKNOWN'):
+            self.assertEqual(polling.FAILED,
+                             polling.classify('CREATE', status))
+
+    def test_transient_errors(self):
+        """Test only throttling and server errors are transient."""
+        for code, transient in ((429, True), (503, True), (500, True),
+                                (404, False), (400, False)):
+            exc = Exception()
+            exc.code = code
+            self.assertEqual(transient, polling.is_transient(exc))
@@ -0,0 +1,72 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from heat.tests import common
+
+from .. import preflight
+
+
+SMALL = {'id': 'hadoop1-7', 'name': 'Small Hadoop Instance',
+         'ram': 7680, 'vcpus': 2, 'disk': 1250}
+
+FLAVORS = {'Small Hadoop Instance': SMALL, 'hadoop1-7': SMALL}
+
+STACK = {'id': 'KAFKA_HDP2_3', 'node_groups': [
+    {'id': 'master', 'flavor_id': 'hadoop1-7', 'count': 1,
+     'min_count': 1, 'max_count': 1, 'min_ram': None},
+    {'id': 'slave', 'flavor_id': 'hadoop1-7', 'count': 3,
+     'min_count': 1, 'max_count': 5, 'min_ram': 7680}]}
+
+
+class PreflightTest(common.HeatTestCase):
+
+    """Cluster preflight check test class."""
+
+    def test_valid_cluster(self):
+        """Test a cluster within its stack limits and quota passes."""
+        node_groups = [{'id': 'slave', 'flavor': 'Small Hadoop Instance',
+                        'count': 5}]
+        self.assertEqual([], preflight.check_cluster(
+            STACK, FLAVORS, node_groups))
+        self.assertEqual([], preflight.check_quota(
+            preflight.cluster_usage(STACK, FLAVORS, node_groups),
+            {'node_count': 6}))
+
+    def test_stack_limits(self):
+        """Test node counts and unknown node groups are rejected."""
+        node_groups = [{'id': 'slave', 'flavor': 'hadoop1-7', 'count': 6},
+                       {'id': 'edge', 'flavor': 'hadoop1-7', 'count': 1}]
+        self.assertEqual(
+            ['Node group slave of stack KAFKA_HDP2_3 allows at most 5 '
+             'nodes.',
+             'Stack KAFKA_HDP2_3 has no node group edge.'],
+            sorted(preflight.check_cluster(STACK, FLAVORS, node_groups)))
+
+    def test_quota_includes_default_node_groups(self):
+        """Test unrequested stack node groups count against the quota."""
+        node_groups = [{'id': 'slave', 'flavor': 'hadoop1-7', 'count': 5}]
+        usage = preflight.cluster_usage(STACK, FLAVORS, node_groups)
+        self.assertEqual({'node_count': 6, 'ram': 46080, 'vcpus': 12,
+                          'disk': 7500}, usage)
+        self.assertEqual(
+            ['The clusters need 6 nodes but only 5 remain in the tenant '
+             'quota.',
+             'The clusters need 46080 MB of RAM but only 8000 remain in '
+             'the tenant quota.'],
+            preflight.check_quota(usage, {'node_count': 5, 'ram': 8000}))
+
+    def test_estimate(self):
+        """Test the build estimate uses the stack's expected build time."""
+        self.assertEqual(
+            {'build_time': 900, 'nodes': 4, 'node_hours': 1.0},
+            preflight.estimate('KAFKA_HDP2_3', [{'count': 4}]))
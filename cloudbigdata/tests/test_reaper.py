@@ -0,0 +1,81 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from heat.tests import common
+
+from .. import reaper
+
+
+class ReaperTest(common.HeatTestCase):
+
+    """Bulk and background cluster deletion test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(ReaperTest, self).setUp()
+        self.now = 0
+        self.client = mock.MagicMock()
+        self.reaper = reaper.ClusterReaper(30, 600, timer=lambda: self.now)
+        self.patchobject(reaper.eventlet, 'spawn')
+
+    def test_bulk_delete(self):
+        """Test every cluster is deleted and missing clusters ignored."""
+        not_found = Exception('Not found')
+        not_found.code = 404
+        failed = Exception('Failed')
+        failed.code = 500
+
+        def delete(cluster_id):
+            if cluster_id == 'gone':
+                raise not_found
+            if cluster_id == 'bad':
+                raise failed
+        self.client.clusters.delete.side_effect = delete
+        errors = reaper.bulk_delete(self.client, ['1', 'gone', 'bad', '2'],
+                                    concurrency=2)
+        self.assertEqual({'bad': failed}, errors)
+        self.assertEqual(4, self.client.clusters.delete.call_count)
+
+    def test_reap(self):
+        """Test deletes are confirmed, retried and given up on."""
+        for cluster_id in ('gone', 'deleting', 'active'):
+            self.reaper.watch(lambda: self.client, cluster_id)
+        self.client.clusters.list.return_value = [
+            mock.Mock(id='deleting', status='DELETING'),
+            mock.Mock(id='active', status='ACTIVE')]
+        self.assertEqual(2, self.reaper.reap())
+        self.assertEqual(1, self.reaper.confirmed)
+        self.client.clusters.delete.assert_called_once_with('active')
+        self.now = 601
+        self.assertEqual(0, self.reaper.reap())
+        self.assertEqual(2, self.reaper.abandoned)
+
+    def test_deadline_without_cluster_list(self):
+        """Test deletes are given up on while the list keeps failing."""
+        get_client = mock.Mock(return_value=self.client)
+        self.reaper.watch(get_client, 'stuck')
+        self.client.clusters.list.side_effect = Exception('Unauthorized')
+        self.assertRaises(Exception, self.reaper.reap)
+        self.now = 601
+        self.assertEqual(0, self.reaper.reap())
+        self.assertEqual(1, self.reaper.abandoned)
+        self.assertEqual(1, get_client.call_count)
+
+    def test_one_reaper_per_tenant(self):
+        """Test reapers are shared per tenant and region."""
+        self.assertIs(reaper.get_reaper('tenant', 'dfw'),
+                      reaper.get_reaper('tenant', 'dfw'))
+        self.assertIsNot(reaper.get_reaper('tenant', 'dfw'),
+                         reaper.get_reaper('tenant', 'ord'))
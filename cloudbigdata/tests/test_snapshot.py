@@ -0,0 +1,105 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import fcntl
+import os
+
+import fixtures
+import mock
+
+from heat.tests import common
+
+from .. import snapshot
+
+
+FLAVORS = [{'id': 'hadoop1-7', 'name': 'Small Hadoop Instance',
+            'ram': 7680, 'vcpus': 2, 'disk': 1250},
+           {'id': 'hadoop1-15', 'name': 'Medium Hadoop Instance',
+            'ram': 15360, 'vcpus': 4, 'disk': 2500}]
+
+STACKS = [{'id': 'KAFKA_HDP2_3', 'node_groups': [
+    {'id': 'slave', 'flavor_id': 'hadoop1-7', 'count': 3,
+     'min_count': 1, 'max_count': 5, 'min_ram': 15360}]}]
+
+
+class SnapshotTest(common.HeatTestCase):
+
+    """Catalog snapshot test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(SnapshotTest, self).setUp()
+        self.now = 1000
+        self.directory = self.useFixture(fixtures.TempDir()).path
+        self.store = snapshot.SnapshotStore(self.directory, 60,
+                                            timer=lambda: self.now)
+        self.fetch = mock.Mock(return_value=(FLAVORS, STACKS))
+
+    def test_write_and_read(self):
+        """Test a written snapshot is read back with its catalogs."""
+        written = self.store.write('123456', 'dfw', FLAVORS, STACKS)
+        self.assertEqual(snapshot.FORMAT_VERSION, written['version'])
+        store = snapshot.SnapshotStore(self.directory, 60)
+        read = store.read('123456', 'dfw')
+        self.assertEqual(FLAVORS, read['flavors'])
+        self.assertEqual(written['etag'], read['etag'])
+        self.assertEqual({'KAFKA_HDP2_3': {'slave': ['hadoop1-15']}},
+                         read['compatibility'])
+        self.assertEqual(['cbd-catalog-123456-dfw.json'],
+                         os.listdir(self.directory))
+
+    def test_snapshot_scoped_to_tenant(self):
+        """Test a tenant never reads another tenant's stacks."""
+        self.store.write('123456', 'dfw', FLAVORS, STACKS)
+        self.assertIsNone(self.store.read('654321', 'dfw'))
+        self.assertIsNone(self.store.read('123456', 'ord'))
+
+    def test_unusable_snapshot_ignored(self):
+        """Test corrupt and other-version snapshots are not used."""
+        path = os.path.join(self.directory, 'cbd-catalog-123456-dfw.json')
+        with open(path, 'w') as snapshot_file:
+            snapshot_file.write('{"version": 0')
+        self.assertIsNone(self.store.read('123456', 'dfw'))
+        with open(path, 'w') as snapshot_file:
+            snapshot_file.write('{"version": 0}')
+        self.assertIsNone(self.store.read('123456', 'dfw'))
+
+    def test_load_refreshes_stale_snapshot(self):
+        """Test the catalogs are only fetched once the snapshot is stale."""
+        self.assertEqual(
+            FLAVORS, self.store.load('123456', 'dfw', self.fetch)['flavors'])
+        self.store.load('123456', 'dfw', self.fetch)
+        self.assertEqual(1, self.fetch.call_count)
+        self.now += 61
+        self.assertEqual(
+            self.now,
+            self.store.load('123456', 'dfw', self.fetch)['generated_at'])
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_load_while_locked(self):
+        """Test a worker without the lock uses the stale snapshot."""
+        stale = self.store.write('123456', 'dfw', FLAVORS, [])
+        self.now += 61
+        with open(os.path.join(self.directory, 'cbd-catalog-123456-dfw.lock'),
+                  'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.assertEqual(stale,
+                             self.store.load('123456', 'dfw', self.fetch))
+        self.assertFalse(self.fetch.called)
+
+    def test_load_fetch_failure(self):
+        """Test a failed refresh keeps the stale snapshot."""
+        stale = self.store.write('123456', 'dfw', FLAVORS, [])
+        self.now += 61
+        self.fetch.side_effect = Exception('Unavailable')
+        self.assertEqual(stale, self.store.load('123456', 'dfw', self.fetch))
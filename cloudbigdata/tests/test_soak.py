@@ -0,0 +1,36 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from . import soak
+
+
+class SoakTest(soak.SoakTestCase):
+
+    """Small CBD stack soak test class."""
+
+    def test_small_soak(self):
+        """Test concurrent stacks stay within the API call budget."""
+        report = self.soak(stacks=2, clusters=5, rounds=1, build_time=1,
+                           seed=1)
+        self.assertWithinBudget(report)
+        create = report['rounds'][0]['create']
+        self.assertGreater(create['ticks'], 0)
+        self.assertLessEqual(create['time_to_complete_p50'],
+                             create['time_to_complete_max'])
+
+    def test_build_time_distribution(self):
+        """Test build times are drawn around the median."""
+        draw = soak.build_time_distribution(10, seed=1)
+        times = sorted(draw() for _ in range(101))
+        self.assertTrue(5 < times[50] < 20)
+        self.assertTrue(all(duration > 0 for duration in times))
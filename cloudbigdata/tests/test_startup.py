@@ -0,0 +1,35 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from heat.tests import common
+
+from .. import lava
+from . import startup_benchmark
+
+
+class StartupTest(common.HeatTestCase):
+
+    """Plugin load cost test class."""
+
+    def test_plugin_import_does_not_load_lava_client(self):
+        """Test loading the plugin leaves the Lava client unloaded."""
+        modules = startup_benchmark.measure()['modules']
+        self.assertIn('cloudbigdata.cbd_client', modules)
+        self.assertEqual([], [name for name in modules
+                              if name.split('.')[0] == 'lavaclient'])
+
+    def test_stand_in_errors(self):
+        """Test the stand-in exceptions mirror the Lava client's."""
+        exc = lava.RequestError('Not found', code=404)
+        self.assertIsInstance(exc, lava.LavaError)
+        self.assertEqual(404, exc.code)
@@ -0,0 +1,61 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from heat.tests import common
+
+from .. import status
+
+
+class ClusterStatusAggregatorTest(common.HeatTestCase):
+
+    """Shared cluster status aggregator test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(ClusterStatusAggregatorTest, self).setUp()
+        self.now = 0
+        self.client = mock.MagicMock()
+        self.clusters = [mock.Mock(id=i, status='BUILDING')
+                         for i in range(3)]
+        self.client.clusters.list.return_value = self.clusters
+        self.aggregator = status.ClusterStatusAggregator(
+            10, timer=lambda: self.now)
+
+    def test_one_list_per_interval(self):
+        """Test many clusters are served from one cluster list."""
+        for cluster in self.clusters:
+            self.assertIs(cluster,
+                          self.aggregator.get_cluster(self.client,
+                                                      cluster.id))
+        self.assertEqual(1, self.client.clusters.list.call_count)
+        self.assertFalse(self.client.clusters.get.called)
+        self.now = 10
+        self.aggregator.get_cluster(self.client, 0)
+        self.assertEqual(2, self.client.clusters.list.call_count)
+
+    def test_missing_cluster_fallback(self):
+        """Test a cluster missing from the list is read directly."""
+        self.client.clusters.get.return_value = 'cluster'
+        self.assertEqual('cluster',
+                         self.aggregator.get_cluster(self.client, 'new'))
+        self.client.clusters.get.assert_called_once_with('new')
+        self.assertEqual(1, self.aggregator.get_calls)
+
+    def test_aggregator_per_tenant(self):
+        """Test aggregators are shared per tenant and region."""
+        self.assertIs(status.get_aggregator('tenant', 'dfw'),
+                      status.get_aggregator('tenant', 'dfw'))
+        self.assertIsNot(status.get_aggregator('tenant', 'dfw'),
+                         status.get_aggregator('other', 'dfw'))
@@ -0,0 +1,108 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+import mock
+from oslo_config import cfg
+
+from heat.tests import common
+
+from .. import instrumentation
+from .. import throttle
+
+
+class ThrottleTest(common.HeatTestCase):
+
+    """CBD API rate limiting and coalescing test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(ThrottleTest, self).setUp()
+        self.now = 0
+        self.waits = []
+        self.bucket = throttle.TokenBucket(1, 2, timer=lambda: self.now,
+                                           sleep=self.waits.append)
+
+    def test_token_bucket(self):
+        """Test calls beyond the burst wait for their token."""
+        self.assertEqual((0.0, 0), self.bucket.acquire())
+        self.assertEqual((0.0, 0), self.bucket.acquire())
+        self.assertEqual((1.0, 0), self.bucket.acquire())
+        self.assertEqual([1.0], self.waits)
+        self.assertEqual(1, self.bucket.throttled)
+        self.assertEqual(1, self.bucket.max_queue_depth)
+        self.assertEqual(0, self.bucket.queue_depth)
+        self.now = 10
+        self.assertEqual((0.0, 0), self.bucket.acquire())
+
+    def test_drain_on_throttled_call(self):
+        """Test a throttled call drops the saved burst."""
+        limiter = throttle.Limiter(1, 2, timer=lambda: self.now,
+                                   sleep=self.waits.append)
+        throttled = Exception('Too many requests')
+        throttled.code = 429
+
+        def fail(info):
+            raise throttled
+        self.assertRaises(Exception, limiter.call, 'key', fail)
+        self.assertEqual('ok', limiter.call('key', lambda info: 'ok'))
+        self.assertEqual(1, limiter.stats()['throttled'])
+
+    def test_coalesced_reads(self):
+        """Test identical concurrent reads are made once."""
+        coalescer = throttle.Coalescer()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def read():
+            calls.append(1)
+            release.wait()
+            return 'flavors'
+
+        def call():
+            results.append(coalescer.call('flavors.list', read))
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while coalescer.coalesced < 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['flavors', 'flavors'], results)
+
+    def test_limited_client_reports_throttle_wait(self):
+        """Test calls through a limited client report their wait."""
+        events = []
+        instrumentation.set_sink(mock.Mock(emit=events.append))
+        self.addCleanup(instrumentation.set_sink, None)
+        limiter = throttle.Limiter(1, 1, timer=lambda: self.now,
+                                   sleep=self.waits.append)
+        client = instrumentation.InstrumentedClient(mock.MagicMock(),
+                                                    limiter)
+        client.flavors.list()
+        client.clusters.create(name='test')
+        self.assertEqual([0.0, 1.0],
+                         [event['throttle_wait'] for event in events])
+        self.assertEqual(2, limiter.stats()['calls'])
+
+    def test_limiter_disabled(self):
+        """Test no limiter is used when the rate limit is 0."""
+        cfg.CONF.set_override('api_rate_limit', 0, group='cloud_big_data')
+        self.addCleanup(cfg.CONF.clear_override, 'api_rate_limit',
+                        group='cloud_big_data')
+        self.assertIsNone(throttle.get_limiter('tenant', 'dfw'))
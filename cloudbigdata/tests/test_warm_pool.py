@@ -0,0 +1,149 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from heat.tests import common
+
+from .. import status
+from .. import warm_pool
+
+
+SPEC = {'stack_id': 'HADOOP_HDP2_2', 'username': 'pool_user',
+        'ssh_keys': ['pool_key'], 'user_scripts': [], 'connectors': [],
+        'node_groups': [{'id': 'slave', 'flavor_id': 'hadoop1-7',
+                         'count': 3}]}
+
+
+class WarmPoolTest(common.HeatTestCase):
+
+    """Warm cluster pool test class."""
+
+    def setUp(self):
+        """Initialization."""
+        super(WarmPoolTest, self).setUp()
+        status._aggregators.clear()
+        self.patchobject(warm_pool.ClusterPool, 'start')
+        self.patchobject(warm_pool.ClusterPool, '_wake')
+        self.client = mock.MagicMock()
+        self.clusters = {}
+        self.client.clusters.create.side_effect = self._create
+        self.client.clusters.list.side_effect = lambda: list(
+            self.clusters.values())
+        self.states = []
+        self.pool = warm_pool.ClusterPool('cbdpool-test', 'tenant', 'dfw',
+                                          SPEC, 2, lambda: self.client,
+                                          interval=0,
+                                          on_change=self.states.append)
+
+    def _create(self, name, **kwargs):
+        cluster = mock.Mock(id=str(len(self.clusters) + 1), status='BUILDING')
+        cluster.name = name
+        self.clusters[cluster.id] = cluster
+        return cluster
+
+    def _build_all(self):
+        for cluster in self.clusters.values():
+            if cluster.status == 'BUILDING':
+                cluster.status = 'ACTIVE'
+        status._aggregators.clear()
+        self.pool.refill()
+
+    def test_claim_and_refill(self):
+        """Test only built clusters are claimed and claims are replaced."""
+        self.pool.fill()
+        self.assertEqual(2, self.client.clusters.create.call_count)
+        self.assertIsNone(self.pool.claim())
+        self._build_all()
+        self.assertEqual(['1', '2'], self.pool.idle())
+        self.assertEqual('1', self.pool.claim())
+        self.assertEqual(1, self.pool.refill())
+        self.assertEqual('cbdpool-test-3', self.clusters['3'].name)
+        self.assertEqual((1, 1), (self.pool.claims, self.pool.misses))
+
+    def test_failed_clusters_replaced(self):
+        """Test clusters that fail to build are deleted and replaced."""
+        self.pool.fill()
+        self.clusters['1'].status = 'ERROR'
+        status._aggregators.clear()
+        self.assertEqual(1, self.pool.refill())
+        self.client.clusters.delete.assert_called_once_with('1')
+        self.assertEqual(['2', '3'], sorted(self.pool.members()))
+
+    def test_matches(self):
+        """Test claims only match clusters built the same way."""
+        self.assertTrue(self.pool.matches(dict(SPEC)))
+        self.assertFalse(self.pool.matches(dict(SPEC,
+                                                stack_id='SPARK_HDP2_2')))
+        self.assertFalse(self.pool.matches(dict(SPEC, ssh_keys=['other'])))
+        self.assertFalse(self.pool.matches(dict(SPEC, username='other')))
+        self.assertFalse(self.pool.matches(dict(SPEC,
+                                                user_scripts=['script'])))
+        node_groups = [{'id': 'slave', 'flavor_id': 'hadoop1-7', 'count': 5}]
+        self.assertFalse(self.pool.matches(dict(SPEC,
+                                                node_groups=node_groups)))
+
+    def test_registry_scoped_to_tenant(self):
+        """Test a pool is only found by its own tenant and region."""
+        self.assertIs(self.pool, warm_pool.register(self.pool))
+        self.addCleanup(warm_pool.unregister, 'tenant', 'dfw', 'cbdpool-test')
+        self.assertIs(self.pool,
+                      warm_pool.get_pool('tenant', 'dfw', 'cbdpool-test'))
+        self.assertIsNone(warm_pool.get_pool('other', 'dfw', 'cbdpool-test'))
+        self.assertIsNone(warm_pool.get_pool('tenant', 'ord',
+                                             'cbdpool-test'))
+
+    def test_release_and_close(self):
+        """Test recycled clusters return while the pool has room."""
+        self.pool.fill()
+        self._build_all()
+        cluster_id = self.pool.claim()
+        self.assertFalse(self.pool.release(cluster_id))
+        self.pool.recycle = True
+        self.assertTrue(self.pool.release(cluster_id))
+        self.assertFalse(self.pool.release('other'))
+        self.assertEqual({}, self.pool.close())
+        self.assertEqual(2, self.client.clusters.delete.call_count)
+        self.assertEqual(0, self.pool.refill())
+
+    def test_shrink(self):
+        """Test shrinking the pool deletes unbuilt clusters first."""
+        self.pool.fill()
+        self.clusters['2'].status = 'ACTIVE'
+        status._aggregators.clear()
+        self.pool.resize(1)
+        self.pool.refill()
+        self.client.clusters.delete.assert_called_once_with('1')
+        self.assertEqual(['2'], self.pool.idle())
+
+    def test_state_restored(self):
+        """Test a pool restored from its saved state keeps its members."""
+        self.pool.fill()
+        self._build_all()
+        self.assertEqual({'1': 'ACTIVE', '2': 'ACTIVE'},
+                         self.states[-1]['members'])
+        restored = warm_pool.ClusterPool('cbdpool-test', 'tenant', 'dfw',
+                                         SPEC, 2, lambda: self.client)
+        restored.restore(self.states[-1])
+        self.assertEqual('1', restored.claim())
+        restored.refill()
+        self.assertEqual('cbdpool-test-3', self.clusters['3'].name)
+
+    def test_client_fetched_for_each_refill(self):
+        """Test refills use a fresh client instead of a stored one."""
+        get_client = mock.Mock(return_value=self.client)
+        pool = warm_pool.ClusterPool('cbdpool-test', 'tenant', 'dfw', SPEC,
+                                     1, get_client)
+        pool.refill()
+        pool.refill()
+        self.assertEqual(2, get_client.call_count)
@@ -0,0 +1,217 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-tenant rate limiting and coalescing of CBD API calls."""
+
+import threading
+import time
+
+import eventlet
+from oslo_config import cfg
+
+from cloudbigdata import cache
+
+
+throttle_opts = [
+    cfg.FloatOpt('api_rate_limit',
+                 default=5.0,
+                 help='Sustained CBD API calls per second allowed per tenant '
+                      'and region by each heat engine. 0 disables the '
+                      'limit.'),
+    cfg.IntOpt('api_rate_burst',
+               default=10,
+               help='CBD API calls a tenant may make at once before the '
+                    'rate limit applies.'),
+    cfg.BoolOpt('api_coalesce_reads',
+                default=True,
+                help='Share the result of identical CBD API reads made at '
+                     'the same time instead of repeating them.'),
+]
+cfg.CONF.register_opts(throttle_opts, group='cloud_big_data')
+
+# HTTP status codes telling the client to slow down
+THROTTLED_CODES = (429, 503)
+
+# Limiters are dropped after a day without use
+LIMITER_TTL = 24 * 60 * 60
+MAX_LIMITERS = 1024
+
+_limiters = cache.TTLCache(MAX_LIMITERS, LIMITER_TTL)
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """Token bucket whose waiting callers queue up for future tokens.
+
+    A caller finding the bucket empty reserves the next token and sleeps
+    until it is due, so callers are served in arrival order.
+    """
+
+    def __init__(self, rate, burst, timer=time.time, sleep=eventlet.sleep):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.throttled = 0
+        self.throttle_wait = 0.0
+        self._tokens = float(self.burst)
+        self._timer = timer
+        self._sleep = sleep
+        self._updated = timer()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take a token, waiting for it if none is available.
+
+        :returns: the seconds waited and the queue depth on arrival
+        """
+        with self._lock:
+            self._refill(self._timer())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0, self.queue_depth
+            wait = -self._tokens / self.rate
+            depth = self.queue_depth
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth,
+                                       self.queue_depth)
+            self.throttled += 1
+            self.throttle_wait += wait
+        try:
+            self._sleep(wait)
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+        return wait, depth
+
+    def drain(self):
+        """Drop the saved burst after the API asked us to slow down."""
+        with self._lock:
+            self._refill(self._timer())
+            self._tokens = min(self._tokens, 0.0)
+
+
+class _Call(object):
+    """An API call in flight whose result is shared."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer(object):
+    """Run identical concurrent calls once and share their result."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, func):
+        """Return func(), or the result of the identical call in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class Limiter(object):
+    """Rate limit and coalesce the CBD API calls of one tenant."""
+
+    def __init__(self, rate, burst, coalesce=True, timer=time.time,
+                 sleep=eventlet.sleep):
+        self.bucket = TokenBucket(rate, burst, timer, sleep)
+        self.coalescer = Coalescer() if coalesce else None
+        self.calls = 0
+
+    def call(self, key, func, read=False):
+        """Make an API call once the rate limit allows it.
+
+        :param key: identifies the call; identical reads in flight at the
+            same time are made once
+        :param func: callable making the call, given a dict with the
+            throttle_wait and queue_depth of the call
+        :param read: whether the call only reads
+        """
+        if read and self.coalescer is not None:
+            return self.coalescer.call(key, lambda: self._call(func))
+        return self._call(func)
+
+    def _call(self, func):
+        wait, depth = self.bucket.acquire()
+        self.calls += 1
+        try:
+            return func({'throttle_wait': wait, 'queue_depth': depth})
+        except Exception as exc:
+            if getattr(exc, 'code', None) in THROTTLED_CODES:
+                self.bucket.drain()
+            raise
+
+    def stats(self):
+        """Return the call, queue and throttle-wait counters."""
+        return {'calls': self.calls,
+                'queue_depth': self.bucket.queue_depth,
+                'max_queue_depth': self.bucket.max_queue_depth,
+                'throttled': self.bucket.throttled,
+                'throttle_wait': self.bucket.throttle_wait,
+                'coalesced': (self.coalescer.coalesced
+                              if self.coalescer is not None else 0)}
+
+
+def get_limiter(tenant_id, region):
+    """Return the engine-wide limiter of a tenant and region.
+
+    :returns: the limiter, or None if the rate limit is disabled
+    """
+    opts = cfg.CONF.cloud_big_data
+    if opts.api_rate_limit <= 0:
+        return None
+    key = (tenant_id, region)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = Limiter(opts.api_rate_limit, opts.api_rate_burst,
+                              opts.api_coalesce_reads)
+        # Re-store on every use to keep active tenants from expiring
+        _limiters.set(key, limiter)
+    return limiter
+
+
+def stats():
+    """Return the counters of every limiter, keyed by tenant and region."""
+    return dict(('%s/%s' % key, limiter.stats())
+                for key, limiter in _limiters.items())
@@ -0,0 +1,292 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Pools of pre-built Cloud Big Data clusters ready to be claimed."""
+
+import threading
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from heat.common.i18n import _LI
+from heat.common.i18n import _LW
+
+from cloudbigdata import polling
+from cloudbigdata import reaper
+from cloudbigdata import status
+
+
+LOG = logging.getLogger(__name__)
+
+warm_pool_opts = [
+    cfg.IntOpt('warm_pool_refill_interval',
+               default=60,
+               help='Seconds between checks that warm CBD cluster pools '
+                    'hold their configured number of clusters.'),
+]
+cfg.CONF.register_opts(warm_pool_opts, group='cloud_big_data')
+
+# Status of a built cluster that can be claimed
+IDLE_STATUS = 'ACTIVE'
+
+# clusters.create arguments a claimed cluster must have been built with,
+# besides its node groups
+SPEC_KEYS = ('stack_id', 'username', 'ssh_keys', 'user_scripts',
+             'connectors')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ClusterPool(object):
+    """Keep a number of identical clusters built and ready to be claimed.
+
+    Claimed clusters are replaced in the background. Clusters that fail
+    to build or disappear are deleted and replaced. The pool hands its
+    membership to on_change whenever it changes, so that an engine can
+    restore the pool with restore(). Only an engine that started the
+    pool refills it.
+    """
+
+    def __init__(self, pool_id, tenant_id, region, spec, size, get_client,
+                 recycle=False, interval=None, on_change=None):
+        """
+        :param pool_id: the pool ID, also the prefix of its cluster names
+        :param spec: the clusters.create arguments other than the name
+        :param size: the number of clusters to keep
+        :param get_client: callable returning a CBD client, called for
+            every pass so that expired clients are replaced
+        :param recycle: whether released clusters return to the pool
+        :param on_change: optional callable given the pool state after
+            its membership changed
+        """
+        if interval is None:
+            interval = cfg.CONF.cloud_big_data.warm_pool_refill_interval
+        self.pool_id = pool_id
+        self.tenant_id = tenant_id
+        self.region = region
+        self.spec = spec
+        self.size = size
+        self.recycle = recycle
+        self.interval = interval
+        self.claims = 0
+        self.misses = 0
+        self.built = 0
+        self._get_client = get_client
+        self._on_change = on_change
+        self._members = {}
+        self._serial = 0
+        self._closed = False
+        self._refilling = False
+        self._thread = None
+
+    def matches(self, spec):
+        """Return True if the pool's clusters are built as spec asks.
+
+        :param spec: the clusters.create arguments other than the name
+        """
+        def shape(groups):
+            return sorted((group['id'], group['flavor_id'], group['count'])
+                          for group in groups)
+        return (all(self.spec.get(key) == spec.get(key)
+                    for key in SPEC_KEYS) and
+                shape(self.spec['node_groups']) == shape(spec['node_groups']))
+
+    def idle(self):
+        """Return the IDs of the built clusters waiting to be claimed."""
+        return sorted(cluster_id
+                      for cluster_id, cluster_status in self._members.items()
+                      if cluster_status == IDLE_STATUS)
+
+    def members(self):
+        """Return the status of every pool cluster, keyed by cluster ID."""
+        return dict(self._members)
+
+    def state(self):
+        """Return the pool's creation spec and membership."""
+        return {'spec': self.spec,
+                'members': dict(self._members),
+                'serial': self._serial}
+
+    def restore(self, state):
+        """Take over the membership saved from state()."""
+        self._members = dict(state['members'])
+        self._serial = state['serial']
+
+    def _changed(self):
+        """Hand the new state to on_change."""
+        if self._on_change is not None:
+            self._on_change(self.state())
+
+    def claim(self):
+        """Take a built cluster out of the pool.
+
+        :returns: the cluster ID, or None if no cluster is ready
+        """
+        idle = self.idle()
+        if not idle:
+            self.misses += 1
+            self._wake()
+            return None
+        cluster_id = idle[0]
+        del self._members[cluster_id]
+        self._changed()
+        self.claims += 1
+        LOG.info(_LI("Claimed CBD cluster %(cluster)s from pool %(pool)s."),
+                 {'cluster': cluster_id, 'pool': self.pool_id})
+        self._wake()
+        return cluster_id
+
+    def release(self, cluster_id):
+        """Return a claimed cluster to the pool if it is recycled.
+
+        :returns: True if the pool took the cluster back
+        """
+        if (not self.recycle or self._closed or
+                len(self._members) >= self.size):
+            return False
+        self._members[str(cluster_id)] = IDLE_STATUS
+        self._changed()
+        return True
+
+    def resize(self, size):
+        """Change the number of clusters kept by the pool."""
+        self.size = size
+        self._wake()
+
+    def fill(self):
+        """Start building the pool clusters and keep the pool full."""
+        self.refill()
+        self.start()
+
+    def start(self):
+        """Start checking the pool clusters in the background."""
+        if self._thread is None and not self._closed:
+            self._thread = eventlet.spawn(self._run)
+
+    def refill(self):
+        """Check the pool clusters once and build any missing ones.
+
+        :returns: the number of clusters submitted
+        """
+        if self._closed:
+            return 0
+        client = self._get_client()
+        before = dict(self._members)
+        aggregator = status.get_aggregator(self.tenant_id, self.region)
+        doomed = []
+        for cluster_id in list(self._members):
+            try:
+                cluster = aggregator.get_cluster(client, cluster_id)
+            except Exception as exc:
+                if getattr(exc, 'code', None) != 404:
+                    raise
+                cluster = None
+            if cluster is None:
+                del self._members[cluster_id]
+            elif (polling.classify('CREATE', cluster.status) ==
+                    polling.FAILED):
+                LOG.warning(_LW("Replacing CBD cluster %(cluster)s of pool "
+                                "%(pool)s in status %(status)s."),
+                            {'cluster': cluster_id, 'pool': self.pool_id,
+                             'status': cluster.status})
+                del self._members[cluster_id]
+                doomed.append(cluster_id)
+            elif cluster_id in self._members:
+                self._members[cluster_id] = cluster.status
+        # Shrink by deleting unclaimed clusters, unbuilt ones first
+        excess = len(self._members) - self.size
+        if excess > 0:
+            surplus = sorted(self._members,
+                             key=lambda cid: self._members[cid] == IDLE_STATUS)
+            for cluster_id in surplus[:excess]:
+                del self._members[cluster_id]
+                doomed.append(cluster_id)
+        if doomed:
+            reaper.bulk_delete(client, doomed)
+        missing = max(0, self.size - len(self._members))
+        try:
+            for _ in range(missing):
+                self._serial += 1
+                cluster = client.clusters.create(
+                    name='%s-%d' % (self.pool_id, self._serial), **self.spec)
+                self._members[str(cluster.id)] = cluster.status
+                self.built += 1
+        finally:
+            if self._members != before:
+                self._changed()
+        return missing
+
+    def close(self):
+        """Stop refilling and delete the unclaimed clusters.
+
+        Clusters that could not be deleted stay members, so that closing
+        the pool again retries them.
+        :returns: a dict of cluster ID to the exception raised deleting it
+        """
+        self._closed = True
+        errors = reaper.bulk_delete(self._get_client(), list(self._members))
+        self._members = dict((cluster_id, cluster_status)
+                             for cluster_id, cluster_status
+                             in self._members.items()
+                             if cluster_id in errors)
+        self._changed()
+        return errors
+
+    def _wake(self):
+        """Replace claimed clusters without waiting for the next check."""
+        if (self._thread is not None and not self._closed and
+                not self._refilling):
+            eventlet.spawn_n(self._safe_refill)
+
+    def _safe_refill(self):
+        if self._refilling:
+            return
+        self._refilling = True
+        try:
+            self.refill()
+        except Exception as exc:
+            LOG.warning(_LW("Unable to refill CBD cluster pool %(pool)s: "
+                            "%(exc)s"), {'pool': self.pool_id, 'exc': exc})
+        finally:
+            self._refilling = False
+
+    def _run(self):
+        while not self._closed:
+            eventlet.sleep(self.interval)
+            self._safe_refill()
+        self._thread = None
+
+
+def register(pool):
+    """Make a pool available to its tenant's resources in its region.
+
+    :returns: the pool registered with the pool's ID, which is an
+        earlier pool if one was already registered
+    """
+    key = (pool.tenant_id, pool.region, pool.pool_id)
+    with _pools_lock:
+        return _pools.setdefault(key, pool)
+
+
+def unregister(tenant_id, region, pool_id):
+    """Forget a pool, returning it if it was registered."""
+    with _pools_lock:
+        return _pools.pop((tenant_id, region, pool_id), None)
+
+
+def get_pool(tenant_id, region, pool_id):
+    """Return a tenant's registered pool with an ID, or None."""
+    with _pools_lock:
+        return _pools.get((tenant_id, region, pool_id))